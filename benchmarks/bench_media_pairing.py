@@ -0,0 +1,76 @@
+import os
+import sys
+import time
+import random
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src.utils.media_pairing import VideoMatcher
+
+
+# Reference: the original per-image scan from the history pages.
+def legacy_pairing(video_map, image_times, window):
+    used_keys = set()
+    results = []
+    for img_dt in image_times:
+        best_url = None
+        best_vid_dt = None
+        min_diff = window
+        for vid_dt, url in video_map.items():
+            if vid_dt in used_keys:
+                continue
+            diff = (vid_dt - img_dt).total_seconds()
+            if 0 <= diff < min_diff:
+                min_diff = diff
+                best_url = url
+                best_vid_dt = vid_dt
+        if best_vid_dt is not None:
+            used_keys.add(best_vid_dt)
+        results.append(best_url)
+    return results
+
+
+def fast_pairing(video_map, image_times, window):
+    matcher = VideoMatcher(video_map, window=window)
+    return [matcher.match(img_dt) for img_dt in image_times]
+
+
+def make_day(n_images, n_videos, seed):
+    rng = random.Random(seed)
+    day = datetime(2025, 1, 1)
+    image_times = sorted(day + timedelta(seconds=rng.randrange(86400)) for _ in range(n_images))
+    video_map = {}
+    for _ in range(n_videos):
+        vid_dt = day + timedelta(seconds=rng.randrange(86400))
+        video_map[vid_dt] = f"/media/cam/videos/evidence_{vid_dt:%Y%m%d_%H%M%S}.mp4"
+    return video_map, image_times
+
+
+def main():
+    for seed in range(200):
+        video_map, image_times = make_day(random.Random(seed).randint(0, 60), random.Random(seed + 1).randint(0, 60), seed)
+        rng = random.Random(seed)
+        if seed % 2:
+            rng.shuffle(image_times)
+        for window in (60.0, 120.0):
+            assert legacy_pairing(video_map, image_times, window) == fast_pairing(video_map, image_times, window), seed
+    print("Randomized equivalence: 200 days x 2 windows OK")
+
+    for n_images, n_videos in ((500, 500), (2000, 2000), (5000, 5000)):
+        video_map, image_times = make_day(n_images, n_videos, seed=42)
+
+        t0 = time.perf_counter()
+        expected = legacy_pairing(video_map, image_times, 120.0)
+        t_legacy = time.perf_counter() - t0
+
+        t0 = time.perf_counter()
+        got = fast_pairing(video_map, image_times, 120.0)
+        t_fast = time.perf_counter() - t0
+
+        assert expected == got
+        print(f"{n_images:>5} images / {n_videos:>5} videos: legacy {t_legacy * 1000:9.1f} ms | bisect {t_fast * 1000:7.2f} ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+import os
+import sys
+import time
+
+import cv2
+import numpy as np
+from nicegui import json as packet_json   # the codec NiceGUI installs for every Socket.IO server in the process
+from socketio import packet
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src.core.wire_format import pack_frame, unpack_frame, pack_telemetry, unpack_telemetry
+
+DEVICE_ID = 'qaeye34'
+TELEMETRY = {
+    'fps': 14.8, 'detections': 3, 'alarm_status': False, 'cpu_temp': 61.5,
+    'inference_ms': 38.2, 'queue_len': 0, 'uptime_s': 86400,
+}
+
+
+def make_jpeg(width=1280, height=720, quality=80):
+    rng = np.random.default_rng(0)
+    img = cv2.GaussianBlur(rng.integers(0, 255, (height, width, 3), dtype=np.uint8), (15, 15), 0)
+    _, buf = cv2.imencode('.jpg', img, [cv2.IMWRITE_JPEG_QUALITY, quality])
+    return buf.tobytes()
+
+
+def wire_size(encoded):
+    # Socket.IO packet text plus binary attachments, as they go out over engine.io.
+    if isinstance(encoded, list):
+        return len(encoded[0].encode()) + sum(len(a) for a in encoded[1:])
+    return len(encoded.encode() if isinstance(encoded, str) else encoded)
+
+
+def encode(args):
+    return packet.Packet(packet.EVENT, args, namespace='/device').encode()
+
+
+def decode(encoded):
+    if isinstance(encoded, list):
+        pkt = packet.Packet(encoded_packet=encoded[0])
+        for attachment in encoded[1:]:
+            pkt.add_attachment(attachment)
+        return pkt
+    return packet.Packet(encoded_packet=encoded)
+
+
+def bench(label, args, parse, n, rounds=15):
+    # What the server pays per message: packet decode plus unpacking. Best of several rounds, since
+    # single runs on a busy machine swing by more than the differences measured here.
+    encoded = encode(args)
+    best = float('inf')
+    for _ in range(rounds):
+        t0 = time.perf_counter()
+        for _ in range(n):
+            parse(decode(encoded).data[1:])
+        best = min(best, (time.perf_counter() - t0) / n * 1e6)
+    size = wire_size(encoded)
+    print(f"{label:<34} {size:>9} B/msg {best:>8.2f} us/msg (server decode)")
+    return size, best
+
+
+def report(baseline, result):
+    print(f"  saved vs baseline: {baseline[0] - result[0]} B/msg, cpu {baseline[1] - result[1]:.2f} us/msg\n")
+
+
+def main():
+    packet.Packet.json = packet_json
+    jpeg = make_jpeg()
+    print(f"JPEG payload: {len(jpeg)} bytes\n")
+
+    # Baseline is the server before negotiation: dict events.
+    frame = {'id': DEVICE_ID, 'image': jpeg}
+    base = bench('video_frame (dict)', ['video_frame', frame], lambda a: a[0]['image'], 5000)
+    # No gain expected: the binary frame exists to carry seq + capture time, which the dict format lacks.
+    report(base, bench('video_frame_bin', ['video_frame_bin'] + pack_frame(0, 1, time.time(), jpeg), unpack_frame, 5000))
+
+    body = {'id': DEVICE_ID, 'mode': 'stats', 'data': TELEMETRY}
+    base = bench('telemetry (dict)', ['telemetry', body], lambda a: a[0]['data'], 20000)
+    report(base, bench('telemetry_bin', ['telemetry_bin'] + pack_telemetry(0, 'stats', TELEMETRY), unpack_telemetry,
+                       20000))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,98 +1,216 @@
+import asyncio
 import logging
 import os
-import shutil
+import sys
+import subprocess
 import uvicorn
-from fastapi import FastAPI, UploadFile, File, Form
+from fastapi import FastAPI, HTTPException
 from fastapi.staticfiles import StaticFiles 
-from fastapi.responses import StreamingResponse
+from fastapi.responses import StreamingResponse, FileResponse, PlainTextResponse
 from nicegui import ui
 
 from src.utils.logger import setup_logger
+from src.core.factory_manager import factory_manager
 from src.core.device_socket_manager import device_socket_manager
 from src.core.user_socket_manager import user_socket_manager
-from src.ui.pages import dashboard, device_detail, history, admin_history
+from src.core.media_index import media_index
+from src.core.thumbnail_manager import thumbnail_manager
+from src.core.resumable_upload_manager import resumable_upload_manager
+from src.core.telemetry_store import telemetry_store
+from src.core.latency_tracer import latency_tracer
+from src.core.metrics import loop_lag_sampler, render_metrics
+from src.core.loop_watchdog import loop_watchdog
+from src.core.state_backend import state_backend, BrokerBackend
+from src.core.state_broker import broker_running
+from src.core.cluster_sync import cluster_sync
+from src.core.frame_ring import frame_rings
+from src.core.clip_recorder import clip_recorder
+from src.core.retention_manager import retention_manager
+from src.api import upload, devices, telemetry, clips, retention
 
 setup_logger(level=logging.INFO)
 logger = logging.getLogger("ServerMain")
 
+# all: everything in one process (default). ingest: device sockets and /upload only. ui: dashboard,
+# viewers and APIs, with device state mirrored from the ingest process through the state backend.
+QAI_ROLE = os.environ.get('QAI_ROLE', 'all')
+if QAI_ROLE not in ('all', 'ingest', 'ui'):
+    sys.exit(f"Unknown QAI_ROLE: {QAI_ROLE}")
+if QAI_ROLE != 'all' and not state_backend.shared:
+    sys.exit(f"QAI_ROLE={QAI_ROLE} needs a shared QAI_STATE_BACKEND (unix:///path/broker.sock or redis://...)")
+SERVES_DEVICES = QAI_ROLE in ('all', 'ingest')
+SERVES_UI = QAI_ROLE in ('all', 'ui')
+
 app = FastAPI()
 
 device_socket_manager.bind_user_socket(user_socket_manager)
 
-app.mount("/socket.io/device", device_socket_manager.app)
-app.mount("/socket.io/user", user_socket_manager.app)
+if SERVES_DEVICES:
+    app.mount("/socket.io/device", device_socket_manager.app)
+if SERVES_UI:
+    app.mount("/socket.io/user", user_socket_manager.app)
 
 if not os.path.exists('server_storage'):
-    os.makedirs('server_storage')
+    os.makedirs('server_storage', exist_ok=True)
 
 app.mount("/media", StaticFiles(directory="server_storage"), name="media")
 app.mount("/assets", StaticFiles(directory="assets"), name="assets")
 
+@app.on_event("startup")
+async def start_state_backend():
+    await state_backend.start()
+    await cluster_sync.start()
+
+@app.on_event("shutdown")
+async def close_state_backend():
+    await state_backend.close()
+    frame_rings.close()
+
+@app.on_event("startup")
+async def backfill_media_index():
+    if SERVES_DEVICES:
+        await asyncio.to_thread(media_index.backfill)
+        await asyncio.to_thread(media_index.backfill_datasets)
+
+@app.on_event("startup")
+async def start_upload_gc():
+    if SERVES_DEVICES:
+        resumable_upload_manager.start_gc()
+
+@app.on_event("startup")
+async def watch_factory_config():
+    factory_manager.start_watching()
+
+@app.on_event("startup")
+async def start_telemetry_store():
+    # The UI role only reads the database that the ingest process writes.
+    if SERVES_DEVICES:
+        telemetry_store.start()
+
+@app.on_event("startup")
+async def start_clip_recorder():
+    if SERVES_DEVICES:
+        clip_recorder.start()
+
+@app.on_event("startup")
+async def start_retention():
+    if SERVES_DEVICES:
+        retention_manager.start()
+
+@app.on_event("startup")
+async def start_loop_lag_sampler():
+    loop_lag_sampler.start()
+
+@app.on_event("startup")
+async def start_loop_watchdog():
+    loop_watchdog.start()
+
+@app.on_event("shutdown")
+async def stop_loop_watchdog():
+    loop_watchdog.stop()
+
 @app.get("/api/video_feed/{device_id}")
-async def video_feed(device_id: str):
+async def video_feed(device_id: str, fps: float = None, variant: str = "main"):
+    # Unknown ids would otherwise get a frame hub and cluster-wide interest of their own.
+    if not factory_manager.is_allowed(device_id):
+        raise HTTPException(status_code=404, detail="Unknown device")
     return StreamingResponse(
-        device_socket_manager.get_stream_generator(device_id),
+        device_socket_manager.get_stream_generator(device_id, max_fps=fps, variant=variant),
         media_type="multipart/x-mixed-replace; boundary=frame"
     )
 
-@app.post("/upload")
-async def receive_file(
-    file: UploadFile = File(...),
-    device_id: str = Form(...),
-    file_type: str = Form(...),  
-    filename: str = Form(...)    
-):
-    base_dir = f"server_storage/{device_id}"
-    
-    if file_type == "video":
-        if "_ANN_" in filename:
-            sub_folder = "annotated_videos"
-        else:
-            sub_folder = "videos"
-    elif file_type == "image":
-        sub_folder = "images"
-    else:
-        sub_folder = f"{file_type}s"
-
-    save_dir = os.path.join(base_dir, sub_folder)
-    os.makedirs(save_dir, exist_ok=True)
-    
-    file_path = os.path.join(save_dir, filename)
-    
-    with open(file_path, "wb") as buffer:
-        shutil.copyfileobj(file.file, buffer)
-        
-    return {"status": "success", "path": file_path, "folder": sub_folder}
-
-UPLOAD_ROOT = "received_dataset"
-@app.post("/dataset_upload")
-async def upload_file(
-    file: UploadFile = File(...),
-    sub_folder: str = Form(...)  
-):
+@app.get("/api/fanout_stats")
+async def fanout_stats():
+    return user_socket_manager.get_fanout_stats()
+
+@app.get("/metrics")
+async def metrics():
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+@app.get("/api/latency")
+async def latency_stats():
+    return latency_tracer.snapshot()
+
+@app.get("/api/loop_watchdog")
+async def loop_watchdog_report(limit: int = 10):
+    return loop_watchdog.get_report(limit)
+
+@app.get("/api/cluster")
+async def cluster_stats():
+    return cluster_sync.get_stats()
+
+@app.get("/api/frame_rings")
+async def frame_ring_stats():
+    return frame_rings.get_stats()
+
+@app.get("/api/thumbnail/{device_id}/{filename}")
+async def thumbnail(device_id: str, filename: str):
+    # basename() leaves '.' and '..' alone, so reject those explicitly.
+    if any(part in ('.', '..') or os.path.basename(part) != part for part in (device_id, filename)):
+        raise HTTPException(status_code=400, detail="Invalid path")
+
+    thumb_path = await thumbnail_manager.ensure(device_id, filename)
+    if thumb_path:
+        return FileResponse(thumb_path, media_type="image/jpeg", headers={"Cache-Control": "public, max-age=86400"})
+
+    src_path = thumbnail_manager.source_path(device_id, filename)
+    if os.path.exists(src_path):
+        return FileResponse(src_path)
+    raise HTTPException(status_code=404, detail="Not found")
+
+app.include_router(clips.router)
+
+if SERVES_DEVICES:
+    app.include_router(upload.router)
+    app.include_router(retention.router)
+
+if SERVES_UI:
+    from src.ui.pages import dashboard, device_detail, history, admin_history, wall, fleet, diagnostics
+
+    app.include_router(devices.router)
+    app.include_router(telemetry.router)
+
+    ui.run_with(
+        app, 
+        title="ORO Dashboard", 
+        favicon="assets/oro.png"
+    )
+
+def run_workers(count, base_port, ingest_port=None):
+    # One uvicorn process per port: NiceGUI pages and Socket.IO polling keep per-process state, so
+    # put a sticky (e.g. ip_hash) proxy in front of them. Devices may connect to any worker.
+    # With ingest_port, devices and /upload get their own process and the workers only serve the UI.
+    if not state_backend.shared:
+        sys.exit("QAI_WORKERS > 1 / QAI_INGEST_PORT need a shared QAI_STATE_BACKEND (unix:///path/broker.sock or redis://...)")
+
+    roles = [('ui' if ingest_port else 'all', base_port + i) for i in range(count)]
+    if ingest_port:
+        roles.insert(0, ('ingest', ingest_port))
+
+    processes = []
+    if isinstance(state_backend, BrokerBackend) and not broker_running(state_backend.path):
+        processes.append(subprocess.Popen([sys.executable, '-m', 'src.core.state_broker', state_backend.path]))
+    for role, port in roles:
+        logger.info(f"🚀 {role} worker on http://0.0.0.0:{port}")
+        processes.append(subprocess.Popen(
+            [sys.executable, '-m', 'uvicorn', 'main:app', '--host', '0.0.0.0', '--port', str(port), '--log-level', 'warning'],
+            env=dict(os.environ, QAI_ROLE=role)
+        ))
     try:
-        save_dir = os.path.join(UPLOAD_ROOT, sub_folder)
-        if not os.path.exists(save_dir):
-            os.makedirs(save_dir)
-        
-        file_location = os.path.join(save_dir, file.filename)
-        
-        with open(file_location, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
-            
-        logger.info(f"Received: {sub_folder}/{file.filename}")
-        return {"status": "success", "filename": file.filename}
-    
-    except Exception as e:
-        logger.error(f"Error: {e}")
-        return {"status": "error", "message": str(e)}
-
-ui.run_with(
-    app, 
-    title="ORO Dashboard", 
-    favicon="assets/oro.png"
-)
+        for process in processes:
+            process.wait()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for process in processes:
+            process.terminate()
 
 if __name__ == '__main__':
-    logger.info("🚀 Server starting on http://0.0.0.0:80")
-    uvicorn.run(app, host='0.0.0.0', port=80, log_level="warning")
\ No newline at end of file
+    workers = int(os.environ.get('QAI_WORKERS', '1'))
+    port = int(os.environ.get('QAI_PORT', '80'))
+    ingest_port = int(os.environ.get('QAI_INGEST_PORT', '0')) or None
+    if workers > 1 or ingest_port:
+        run_workers(workers, port, ingest_port)
+    else:
+        logger.info(f"🚀 Server starting on http://0.0.0.0:{port}")
+        uvicorn.run(app, host='0.0.0.0', port=port, log_level="warning")
\ No newline at end of file
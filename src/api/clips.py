@@ -0,0 +1,24 @@
+from fastapi import APIRouter, Depends, HTTPException
+
+from src.core.clip_recorder import clip_recorder
+from src.core.device_socket_manager import device_socket_manager
+from src.utils.auth import require_admin
+
+router = APIRouter(prefix="/api/clips")
+
+
+@router.get("")
+async def clip_stats():
+    return clip_recorder.get_stats()
+
+
+# Costs encoder time and disk: admin only, like /api/fleet.
+@router.post("/{device_id}", dependencies=[Depends(require_admin)])
+async def record_clip(device_id: str):
+    if not clip_recorder.enabled:
+        raise HTTPException(status_code=409, detail="Clip recorder is disabled (QAI_CLIP_RECORDER=1)")
+    result = device_socket_manager.record_clip(device_id)
+    if result is None:
+        raise HTTPException(status_code=409, detail="Device offline or recorder over budget")
+    # Forwarded to the worker that owns the device: the filename is only known there.
+    return {'device_id': device_id, 'filename': result if isinstance(result, str) else None}
@@ -0,0 +1,39 @@
+from typing import List, Optional
+from fastapi import APIRouter, Depends, HTTPException
+from pydantic import BaseModel
+
+from src.core.fleet_manager import fleet_manager, FLEET_MAX_PARALLEL, FLEET_TIMEOUT
+from src.utils.auth import require_admin
+
+# Same password as the /admin/fleet page, sent as the X-Admin-Password header.
+router = APIRouter(prefix="/api/fleet", dependencies=[Depends(require_admin)])
+
+
+class FleetCommandRequest(BaseModel):
+    command: str
+    payload: Optional[dict] = None
+    lines: List[str] = []
+    devices: List[str] = []
+    all_devices: bool = False
+    max_parallel: int = FLEET_MAX_PARALLEL
+    timeout: float = FLEET_TIMEOUT
+
+
+@router.post("/command")
+async def fleet_command(req: FleetCommandRequest):
+    targets = fleet_manager.resolve_targets(req.lines, req.devices, req.all_devices)
+    if not targets:
+        raise HTTPException(status_code=400, detail="No known devices in target selection")
+
+    return await fleet_manager.dispatch(
+        targets, req.command, req.payload,
+        max_parallel=req.max_parallel, timeout=req.timeout
+    )
+
+
+@router.get("/rollouts")
+async def fleet_rollouts():
+    return [
+        {k: v for k, v in rollout.items() if k != 'results'}
+        for rollout in reversed(fleet_manager.rollouts)
+    ]
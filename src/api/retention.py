@@ -0,0 +1,31 @@
+from fastapi import APIRouter, Depends, HTTPException
+
+from src.core.retention_manager import retention_manager
+from src.utils.auth import require_admin
+
+router = APIRouter(prefix="/api/retention")
+
+
+@router.get("")
+async def retention_stats():
+    return retention_manager.get_stats()
+
+
+@router.get("/plan")
+async def retention_plan():
+    # What the next pass would do with the current configs/retention.json, also while it is disabled.
+    retention_manager.load_config()
+    return [
+        {'action': kind, 'device_id': device_id, 'folder': folder, 'date': date, 'bytes': size, 'path': path}
+        for kind, device_id, folder, date, size, path in retention_manager.plan()
+    ]
+
+
+# Deletes and archives files: admin only, like /api/fleet.
+@router.post("/run", dependencies=[Depends(require_admin)])
+async def run_retention():
+    retention_manager.load_config()
+    if not retention_manager.enabled:
+        raise HTTPException(status_code=409, detail="Retention is disabled (configs/retention.json: enabled)")
+    retention_manager.trigger()
+    return {'status': 'scheduled', 'running': retention_manager.running}
@@ -0,0 +1,19 @@
+import time
+from typing import Optional
+from fastapi import APIRouter
+
+from src.core.telemetry_store import telemetry_store
+
+router = APIRouter(prefix="/api/telemetry")
+
+
+# Plain def: both routes read SQLite, so FastAPI runs them in its threadpool instead of on the event loop.
+@router.get("/{device_id}")
+def telemetry_metrics(device_id: str):
+    return {'device_id': device_id, 'metrics': telemetry_store.get_metrics(device_id)}
+
+
+@router.get("/{device_id}/{metric}")
+def telemetry_series(device_id: str, metric: str, minutes: float = 60, resolution: Optional[int] = None):
+    end = time.time()
+    return telemetry_store.query(device_id, metric, end - minutes * 60, end, resolution)
@@ -0,0 +1,139 @@
+import os
+import logging
+from datetime import datetime
+from fastapi import APIRouter, UploadFile, File, Form, HTTPException
+from fastapi.responses import JSONResponse
+
+from src.core.media_index import media_index, DATASET_FOLDER
+from src.core.thumbnail_manager import thumbnail_manager
+from src.core.upload_manager import upload_manager
+from src.core.resumable_upload_manager import resumable_upload_manager, UploadOffsetMismatch, UploadChecksumMismatch
+
+logger = logging.getLogger("UploadAPI")
+
+router = APIRouter()
+
+STORAGE_ROOT = "server_storage"
+UPLOAD_ROOT = "received_dataset"
+
+
+def resolve_sub_folder(file_type, filename):
+    if file_type == "video":
+        if "_ANN_" in filename:
+            return "annotated_videos"
+        return "videos"
+    elif file_type == "image":
+        return "images"
+    return f"{file_type}s"
+
+
+def register_media(device_id, sub_folder, filename, size):
+    media_index.add(device_id, sub_folder, filename, size=size)
+    if sub_folder == "images":
+        thumbnail_manager.schedule(device_id, filename)
+
+
+@router.post("/upload")
+async def receive_file(
+    file: UploadFile = File(...),
+    device_id: str = Form(...),
+    file_type: str = Form(...),
+    filename: str = Form(...)
+):
+    sub_folder = resolve_sub_folder(file_type, filename)
+    file_path = os.path.join(STORAGE_ROOT, device_id, sub_folder, filename)
+
+    record = await upload_manager.save_stream(file, file_path, kind=sub_folder)
+    register_media(device_id, sub_folder, filename, record['bytes'])
+
+    return {"status": "success", "path": file_path, "folder": sub_folder}
+
+
+@router.post("/upload/start")
+async def start_resumable_upload(
+    device_id: str = Form(...),
+    file_type: str = Form(...),
+    filename: str = Form(...),
+    total_size: int = Form(None)
+):
+    sub_folder = resolve_sub_folder(file_type, filename)
+    file_path = os.path.join(STORAGE_ROOT, device_id, sub_folder, filename)
+
+    state = await resumable_upload_manager.start(
+        file_path,
+        {'device_id': device_id, 'sub_folder': sub_folder, 'filename': filename},
+        total_size=total_size
+    )
+    return {"status": "success", "upload_id": state['upload_id'], "offset": state['offset']}
+
+
+@router.get("/upload/status/{upload_id}")
+async def resumable_upload_status(upload_id: str):
+    state = await resumable_upload_manager.get(upload_id)
+    if state is None:
+        raise HTTPException(status_code=404, detail="Unknown upload_id")
+    return {"status": "success", "upload_id": upload_id, "offset": state['offset'], "total_size": state['total_size']}
+
+
+@router.post("/upload/append")
+async def append_resumable_upload(
+    file: UploadFile = File(...),
+    upload_id: str = Form(...),
+    offset: int = Form(...)
+):
+    try:
+        state = await resumable_upload_manager.append(upload_id, offset, file)
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Unknown upload_id")
+    except UploadOffsetMismatch as e:
+        return JSONResponse(status_code=409, content={"status": "error", "message": str(e), "offset": e.expected})
+
+    return {"status": "success", "offset": state['offset']}
+
+
+@router.post("/upload/finalize")
+async def finalize_resumable_upload(
+    upload_id: str = Form(...),
+    sha256: str = Form(...)
+):
+    try:
+        state = await resumable_upload_manager.finalize(upload_id, sha256)
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Unknown upload_id")
+    except UploadOffsetMismatch as e:
+        return JSONResponse(status_code=409, content={"status": "error", "message": str(e), "offset": e.expected})
+    except UploadChecksumMismatch as e:
+        logger.warning(f"Resumable upload {upload_id} rejected: {e}")
+        upload_manager.record_failed(e.state['meta']['sub_folder'])
+        return JSONResponse(status_code=422, content={"status": "error", "message": str(e)})
+
+    meta = state['meta']
+    upload_manager.record_completed(meta['sub_folder'], state['dest_path'], state['offset'], state['created_at'],
+                                    chunks=state.get('chunks', 0))
+    register_media(meta['device_id'], meta['sub_folder'], meta['filename'], state['offset'])
+
+    return {"status": "success", "path": state['dest_path'], "folder": meta['sub_folder']}
+
+
+@router.post("/dataset_upload")
+async def upload_file(
+    file: UploadFile = File(...),
+    sub_folder: str = Form(...)
+):
+    try:
+        file_location = os.path.join(UPLOAD_ROOT, sub_folder, file.filename)
+
+        record = await upload_manager.save_stream(file, file_location, kind="dataset")
+        media_index.add(os.path.normpath(sub_folder), DATASET_FOLDER, file.filename, size=record['bytes'], timestamp=datetime.now())
+
+        logger.info(f"Received: {sub_folder}/{file.filename}")
+        return {"status": "success", "filename": file.filename}
+
+    except Exception as e:
+        logger.error(f"Error: {e}")
+        return {"status": "error", "message": str(e)}
+
+
+@router.get("/api/upload_stats")
+async def upload_stats():
+    return upload_manager.get_stats()
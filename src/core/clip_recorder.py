@@ -0,0 +1,246 @@
+import os
+import time
+import asyncio
+import logging
+from collections import deque
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+
+from src.core.media_index import media_index, STORAGE_ROOT
+
+logger = logging.getLogger("ClipRecorder")
+
+CLIP_RECORDER_ENABLED = os.environ.get('QAI_CLIP_RECORDER', '0') == '1'
+ALARM_FIELDS = ('alarm_status',)       # Telemetry flags whose rising edge starts a clip
+
+PRE_EVENT_SECONDS = 10.0
+POST_EVENT_SECONDS = 10.0
+MAX_CLIP_SECONDS = 60.0                # Re-triggers extend a running clip up to this length
+CLIP_FPS = 10.0                        # Frames kept per second; camera frames in between are not buffered
+MAX_DEVICE_BYTES = 48 * 1024 * 1024    # Buffered JPEGs per device, pre-event and recording together
+MIN_CLIP_INTERVAL = 30.0               # Per device, between clip starts
+MAX_QUEUED_CLIPS = 4                   # Clips waiting for or in the encoder, all devices
+REAP_INTERVAL = 1.0
+FOURCC_PREFERENCE = ('avc1', 'mp4v')   # H.264 when the OpenCV build has an encoder for it
+
+_fourcc = None
+
+
+def _open_writer(path, fps, size):
+    global _fourcc
+    for code in ([_fourcc] if _fourcc else FOURCC_PREFERENCE):
+        writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*code), fps, size)
+        if writer.isOpened():
+            _fourcc = code
+            return writer
+        writer.release()
+    return None
+
+
+def encode_clip(frames, path, work_dir):
+    # frames: [(receive ts, jpeg bytes)]. Playback fps follows the real capture rate so clips keep wall time.
+    span = frames[-1][0] - frames[0][0]
+    fps = min(CLIP_FPS, max(1.0, (len(frames) - 1) / span)) if span > 0 else CLIP_FPS
+
+    os.makedirs(work_dir, exist_ok=True)
+    tmp_path = os.path.join(work_dir, os.path.basename(path))
+    writer, size = None, None
+    try:
+        for _, jpeg in frames:
+            img = cv2.imdecode(np.frombuffer(jpeg, dtype=np.uint8), cv2.IMREAD_COLOR)
+            if img is None:
+                continue
+            if writer is None:
+                size = (img.shape[1], img.shape[0])
+                writer = _open_writer(tmp_path, fps, size)
+                if writer is None:
+                    return None
+            elif (img.shape[1], img.shape[0]) != size:
+                img = cv2.resize(img, size, interpolation=cv2.INTER_AREA)
+            writer.write(img)
+    finally:
+        if writer is not None:
+            writer.release()
+
+    if writer is None:
+        return None
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    try:
+        # link, not replace: if the camera's own upload landed while we encoded, it wins (FileExistsError).
+        os.link(tmp_path, path)
+    finally:
+        os.remove(tmp_path)
+    return os.path.getsize(path)
+
+
+class _DeviceBuffer:
+    def __init__(self):
+        self.frames = deque()      # (receive ts, jpeg bytes), oldest first; references, not copies
+        self.bytes = 0
+        self.last_kept = 0.0
+        self.recording = None      # { filename, reason, event_ts, end_ts } while a clip is open
+        self.last_clip = 0.0
+        self.encoding = False
+
+
+class ClipRecorder:
+    # Keeps a rolling pre-event buffer of every device's frames (sampled to CLIP_FPS) and, when an alarm
+    # rises or someone asks, writes pre + post event into server_storage/<device>/videos like a camera upload.
+    def __init__(self, storage_root=STORAGE_ROOT, enabled=CLIP_RECORDER_ENABLED, pre_seconds=PRE_EVENT_SECONDS,
+                 post_seconds=POST_EVENT_SECONDS, fps=CLIP_FPS, max_device_bytes=MAX_DEVICE_BYTES, max_workers=1):
+        self.storage_root = storage_root
+        self.enabled = enabled
+        self.pre_seconds = pre_seconds
+        self.post_seconds = post_seconds
+        self.frame_interval = 1.0 / fps
+        self.max_device_bytes = max_device_bytes
+        # One encoder thread by default: clip encoding never takes more than a core from ingest.
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="clip")
+
+        self.buffers = {}          # Map: { device_id: _DeviceBuffer }
+        self._alarm_state = {}     # Map: { (device_id, field): last seen value }
+        self._queued = 0
+        self._tasks = set()
+        self._reaper = None
+        self.recent = deque(maxlen=50)
+        self.stats = {'clips': 0, 'failed': 0, 'throttled': 0, 'dropped': 0, 'truncated': 0, 'existing': 0}
+
+    def on_frame(self, device_id, image_bytes, ts):
+        if not self.enabled:
+            return
+        buf = self.buffers.get(device_id)
+        if buf is None:
+            buf = self.buffers[device_id] = _DeviceBuffer()
+        if ts - buf.last_kept < self.frame_interval:
+            return
+        buf.last_kept = ts
+        buf.frames.append((ts, image_bytes))
+        buf.bytes += len(image_bytes)
+
+        rec = buf.recording
+        horizon = (rec['event_ts'] if rec else ts) - self.pre_seconds
+        while buf.frames and buf.frames[0][0] < horizon:
+            buf.bytes -= len(buf.frames.popleft()[1])
+        if buf.bytes > self.max_device_bytes:
+            if rec:
+                # Memory budget reached mid-clip: close it with what we have.
+                self.stats['truncated'] += 1
+                self._finish(device_id, buf)
+            while buf.bytes > self.max_device_bytes and buf.frames:
+                buf.bytes -= len(buf.frames.popleft()[1])
+        elif rec and ts >= rec['end_ts']:
+            self._finish(device_id, buf)
+
+    def on_telemetry(self, device_id, data):
+        if not self.enabled or not isinstance(data, dict):
+            return
+        for field in ALARM_FIELDS:
+            if field in data:
+                value = bool(data[field])
+                previous = self._alarm_state.get((device_id, field))
+                self._alarm_state[(device_id, field)] = value
+                if value and not previous:
+                    self.trigger(device_id, reason=field)
+
+    def trigger(self, device_id, reason='manual'):
+        # Returns the clip filename, or None if recording is off or over budget.
+        if not self.enabled:
+            return None
+        buf = self.buffers.get(device_id)
+        if buf is None:
+            buf = self.buffers[device_id] = _DeviceBuffer()
+        now = time.time()
+
+        rec = buf.recording
+        if rec:
+            rec['end_ts'] = min(now + self.post_seconds, rec['event_ts'] + MAX_CLIP_SECONDS)
+            return rec['filename']
+        if now - buf.last_clip < MIN_CLIP_INTERVAL:
+            self.stats['throttled'] += 1
+            return None
+        if buf.encoding or self._queued >= MAX_QUEUED_CLIPS:
+            self.stats['dropped'] += 1
+            logger.warning(f"Clip for {device_id} dropped: encoder busy")
+            return None
+
+        filename = f"evidence_{datetime.fromtimestamp(now).strftime('%Y%m%d_%H%M%S')}.mp4"
+        buf.recording = {'filename': filename, 'reason': reason, 'event_ts': now, 'end_ts': now + self.post_seconds}
+        buf.last_clip = now
+        logger.info(f"Recording {device_id}/{filename} ({reason})")
+        return filename
+
+    def _finish(self, device_id, buf):
+        rec, buf.recording = buf.recording, None
+        start = rec['event_ts'] - self.pre_seconds
+        frames = [f for f in buf.frames if start <= f[0] <= rec['end_ts']]
+        if len(frames) < 2:
+            self.stats['failed'] += 1
+            logger.warning(f"Clip {device_id}/{rec['filename']} has no frames; skipped")
+            return
+        buf.encoding = True
+        self._queued += 1
+        task = asyncio.create_task(self._encode(device_id, buf, rec, frames))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _encode(self, device_id, buf, rec, frames):
+        filename = rec['filename']
+        path = os.path.join(self.storage_root, device_id, 'videos', filename)
+        started = time.perf_counter()
+        try:
+            if os.path.exists(path):
+                # The camera's own upload got there first.
+                self.stats['existing'] += 1
+                return
+            work_dir = os.path.join(self.storage_root, device_id, '.recording')
+            size = await asyncio.get_running_loop().run_in_executor(self.executor, encode_clip, frames, path, work_dir)
+            if size is None:
+                self.stats['failed'] += 1
+                logger.error(f"Clip {device_id}/{filename}: no encoder could write {len(frames)} frames")
+                return
+            media_index.add(device_id, 'videos', filename, size=size)
+            self.stats['clips'] += 1
+            self.recent.append({
+                'device_id': device_id, 'filename': filename, 'reason': rec['reason'], 'frames': len(frames),
+                'seconds': round(frames[-1][0] - frames[0][0], 1), 'bytes': size,
+                'encode_ms': round((time.perf_counter() - started) * 1000, 1),
+            })
+            logger.info(f"Clip saved: {device_id}/{filename} ({len(frames)} frames, {size} bytes)")
+        except FileExistsError:
+            self.stats['existing'] += 1
+            logger.info(f"Clip {device_id}/{filename}: camera upload arrived during encoding, keeping it")
+        except Exception as e:
+            self.stats['failed'] += 1
+            logger.error(f"Clip {device_id}/{filename} failed: {e}")
+        finally:
+            buf.encoding = False
+            self._queued -= 1
+
+    async def _reap(self):
+        # Devices that stop sending frames mid-clip would never reach end_ts in on_frame.
+        while True:
+            await asyncio.sleep(REAP_INTERVAL)
+            now = time.time()
+            for device_id, buf in list(self.buffers.items()):
+                if buf.recording and now >= buf.recording['end_ts'] + REAP_INTERVAL:
+                    self._finish(device_id, buf)
+
+    def start(self):
+        if self.enabled and (self._reaper is None or self._reaper.done()):
+            self._reaper = asyncio.create_task(self._reap())
+
+    def get_stats(self):
+        return {
+            'enabled': self.enabled,
+            'queued': self._queued,
+            'recording': {d: b.recording['filename'] for d, b in self.buffers.items() if b.recording},
+            'buffered_bytes': {d: b.bytes for d, b in self.buffers.items()},
+            'recent': list(self.recent),
+            **self.stats,
+        }
+
+
+clip_recorder = ClipRecorder()
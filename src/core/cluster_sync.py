@@ -0,0 +1,301 @@
+import os
+import time
+import asyncio
+import uuid
+import socket
+import struct
+import logging
+
+import orjson
+
+from src.core.state_backend import state_backend
+from src.core.state_broker import EXPIRED_PREFIX
+from src.core.frame_ring import frame_rings
+
+logger = logging.getLogger("ClusterSync")
+
+DEVICES_KEY = 'qai:devices'            # Hash: { device_id: status record of the owning worker }
+INTEREST_KEY = 'qai:interest'          # Hash: { "device_id|worker": last refresh time } while a worker has viewers
+DEVICE_EVENTS = 'qai:device_events'    # status / telemetry / interest events
+COMMAND_RESULTS = 'qai:command_results'
+FRAME_CHANNEL = 'qai:frames:'          # + device_id; only published while another worker is interested
+
+FRAME_META = struct.Struct('<H')       # length of the orjson meta that precedes the JPEG (if any)
+HOSTNAME = socket.gethostname()
+# Backends without connection-scoped fields (Redis) can hold records of dead workers. Owners re-stamp
+# their records every REFRESH_INTERVAL and every worker re-reads them as often, so an "online" record
+# not refreshed for STALE_RECORD_AGE is treated as offline, at startup and from then on.
+REFRESH_INTERVAL = 20.0
+STALE_RECORD_AGE = 60.0
+# Same for viewer interest: workers re-announce it every REFRESH_INTERVAL, and interest not heard of for
+# STALE_INTEREST_AGE is dropped, so a crashed viewer worker does not keep frames flowing to it forever.
+STALE_INTEREST_AGE = 60.0
+
+
+class ClusterSync:
+    # Mirrors device ownership, status, telemetry and frames between workers that share a state backend.
+    # Each device socket lives on exactly one worker (its owner); everyone else works from mirrored state.
+    def __init__(self, backend=state_backend, worker_id=None):
+        self.backend = backend
+        self.enabled = backend.shared
+        self.worker_id = worker_id or f"{HOSTNAME}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+        self.manager = None
+
+        self.remote_owner = {}      # Map: { device_id: last status record published by its owner }
+        self.local_owner = {}       # Map: { device_id: status record this worker published, while online }
+        self.remote_interest = {}   # Map: { device_id: { worker id with viewers: last heard (local time) } }
+        self.local_interest = {}    # Map: { device_id: local viewer/stream count }
+        self.stats = {'frames_out': 0, 'frames_in': 0, 'frames_via_ring': 0, 'ring_misses': 0,
+                      'events_out': 0, 'events_in': 0, 'stale_interest': 0, 'stale_records': 0}
+        self._refresh_task = None
+
+    def bind(self, manager):
+        self.manager = manager
+
+    async def start(self):
+        if not self.enabled:
+            return
+        sio = self.manager.sio if self.manager else None
+        if sio is not None and not sio.manager_initialized:
+            # python-socketio starts the queue listener on the first local connection; acks for commands
+            # sent to devices on other workers arrive through it, so start it now.
+            sio.manager_initialized = True
+            sio.manager.initialize()
+        self.backend.subscribe(DEVICE_EVENTS, self._on_device_event)
+        self.backend.subscribe(COMMAND_RESULTS, self._on_command_result)
+        self.backend.subscribe(EXPIRED_PREFIX + DEVICES_KEY, self._on_devices_expired)
+        self.backend.subscribe(EXPIRED_PREFIX + INTEREST_KEY, self._on_interest_expired)
+
+        now = time.time()
+        for device_id, record in (await self.backend.hgetall(DEVICES_KEY)).items():
+            if record.get('status') == 'online' and self._is_stale(record, now):
+                record = dict(record, status='offline')
+            self._on_status(device_id, record)
+        for field, refreshed in (await self.backend.hgetall(INTEREST_KEY)).items():
+            device_id, _, worker = field.rpartition('|')
+            if worker == self.worker_id:
+                continue
+            if isinstance(refreshed, (int, float)) and now - refreshed <= STALE_INTEREST_AGE:
+                self.remote_interest.setdefault(device_id, {})[worker] = refreshed
+            else:
+                # Left behind by a worker that died without cleaning up (backends without ephemeral fields).
+                self.backend.hdel(INTEREST_KEY, field)
+        if self._refresh_task is None or self._refresh_task.done():
+            self._refresh_task = asyncio.create_task(self._refresh_loop())
+        logger.info(f"Cluster sync up as worker {self.worker_id}: {len(self.remote_owner)} known devices")
+
+    def _emit_event(self, event):
+        event['worker'] = self.worker_id
+        self.backend.publish(DEVICE_EVENTS, orjson.dumps(event))
+        self.stats['events_out'] += 1
+
+    # --- Owner side ---
+
+    def publish_status(self, device_id, status, sid=None):
+        if not self.enabled:
+            return
+        record = {'status': status['status'], 'last_seen': status['last_seen'], 'ip': status['ip'],
+                  'sid': sid, 'worker': self.worker_id, 'refreshed': time.time()}
+        self.remote_owner.pop(device_id, None)
+        if record['status'] == 'online':
+            self.local_owner[device_id] = record
+        else:
+            self.local_owner.pop(device_id, None)
+        # Ephemeral: if this worker dies, the broker drops the record and tells everyone.
+        self.backend.hset(DEVICES_KEY, device_id, record, ephemeral=True)
+        self._emit_event({'type': 'status', 'device_id': device_id, 'record': record})
+
+    def publish_telemetry(self, device_id, mode, data):
+        if self.enabled:
+            self._emit_event({'type': 'telemetry', 'device_id': device_id, 'mode': mode, 'data': data})
+
+    def publish_frame(self, device_id, image_bytes, meta):
+        workers = self.remote_interest.get(device_id)
+        if not self.enabled or not workers:
+            return
+        meta = dict(meta, worker=self.worker_id)
+        if all(w.rsplit(':', 2)[0] == HOSTNAME for w in workers):
+            # Everyone interested is on this host: send the ring slot, readers map the JPEG themselves.
+            ring = frame_rings.write(device_id, image_bytes, meta)
+            if ring:
+                meta['ring'], meta['ring_seq'] = ring
+                image_bytes = b''
+        head = orjson.dumps(meta)
+        self.backend.publish(FRAME_CHANNEL + device_id, FRAME_META.pack(len(head)) + head + image_bytes)
+        self.stats['frames_out'] += 1
+
+    def request_clip(self, device_id, reason):
+        if self.enabled:
+            self._emit_event({'type': 'clip', 'device_id': device_id, 'reason': reason})
+
+    def publish_command_result(self, request_id, result):
+        if self.enabled:
+            self.backend.publish(COMMAND_RESULTS, orjson.dumps({'request_id': request_id, 'result': result}))
+
+    # --- Viewer side ---
+
+    def acquire(self, device_id):
+        if not self.enabled:
+            return
+        count = self.local_interest.get(device_id, 0)
+        self.local_interest[device_id] = count + 1
+        if count == 0:
+            self.backend.subscribe(FRAME_CHANNEL + device_id, self._on_frame)
+            self._announce_interest(device_id)
+
+    def _announce_interest(self, device_id):
+        self.backend.hset(INTEREST_KEY, f"{device_id}|{self.worker_id}", time.time(), ephemeral=True)
+        self._emit_event({'type': 'interest', 'device_id': device_id, 'on': True})
+
+    def release(self, device_id):
+        if not self.enabled or device_id not in self.local_interest:
+            return
+        self.local_interest[device_id] -= 1
+        if self.local_interest[device_id] <= 0:
+            del self.local_interest[device_id]
+            self.backend.unsubscribe(FRAME_CHANNEL + device_id, self._on_frame)
+            self.backend.hdel(INTEREST_KEY, f"{device_id}|{self.worker_id}")
+            frame_rings.detach(device_id)
+            self._emit_event({'type': 'interest', 'device_id': device_id, 'on': False})
+
+    def remote_sid(self, device_id):
+        # Socket.IO sid of a device owned by another worker; emits to it go through the client manager.
+        record = self.remote_owner.get(device_id)
+        if record and record['status'] == 'online' and record['worker'] != self.worker_id:
+            return record.get('sid')
+        return None
+
+    # --- Incoming ---
+
+    def _on_device_event(self, channel, body):
+        event = orjson.loads(body)
+        if event.get('worker') == self.worker_id:
+            return
+        self.stats['events_in'] += 1
+        kind, device_id = event.get('type'), event.get('device_id')
+        if kind == 'status':
+            self._on_status(device_id, event['record'])
+        elif kind == 'telemetry':
+            if self.manager and not self.manager.sessions.is_connected(device_id):
+                self.manager._apply_remote_telemetry(device_id, event['mode'], event['data'])
+        elif kind == 'clip':
+            if self.manager and self.manager.sessions.is_connected(device_id):
+                self.manager.record_clip(device_id, event.get('reason', 'manual'))
+        elif kind == 'interest':
+            if event['on']:
+                self.remote_interest.setdefault(device_id, {})[event['worker']] = time.time()
+            else:
+                self._drop_interest(device_id, event['worker'])
+
+    def _on_status(self, device_id, record):
+        current = self.remote_owner.get(device_id)
+        if record['status'] != 'online' and current and current['worker'] != record['worker']:
+            # Late offline from a worker the device already left.
+            return
+        if record['status'] != 'online' or (current and current['worker'] != record['worker']):
+            frame_rings.detach(device_id)
+        self.remote_owner[device_id] = record
+        if self.manager and not self.manager.sessions.is_connected(device_id):
+            self.manager._apply_remote_status(device_id, record)
+
+    def _on_frame(self, channel, body):
+        (head_len,) = FRAME_META.unpack_from(body)
+        meta = orjson.loads(body[FRAME_META.size:FRAME_META.size + head_len])
+        if meta.pop('worker', None) == self.worker_id or not self.manager:
+            return
+        device_id = channel[len(FRAME_CHANNEL):]
+        image_bytes = body[FRAME_META.size + head_len:]
+        if 'ring' in meta:
+            frame = frame_rings.read(device_id, meta.pop('ring'), meta.pop('ring_seq'))
+            if frame is None:
+                # Lapped by the writer or the owner is gone; the next frame will do.
+                self.stats['ring_misses'] += 1
+                return
+            image_bytes = frame.data
+            self.stats['frames_via_ring'] += 1
+        self.stats['frames_in'] += 1
+        self.manager._apply_remote_frame(device_id, image_bytes, meta)
+
+    def _on_command_result(self, channel, body):
+        message = orjson.loads(body)
+        if self.manager:
+            self.manager._resolve_command(message.get('request_id'), message.get('result'))
+
+    def _on_devices_expired(self, channel, body):
+        # The owning worker went away without saying goodbye.
+        for device_id in orjson.loads(body):
+            record = self.remote_owner.get(device_id)
+            if record and record['status'] == 'online':
+                self._on_status(device_id, dict(record, status='offline'))
+
+    def _on_interest_expired(self, channel, body):
+        for field in orjson.loads(body):
+            device_id, _, worker = field.rpartition('|')
+            self._drop_interest(device_id, worker)
+
+    def _drop_interest(self, device_id, worker):
+        workers = self.remote_interest.get(device_id)
+        if workers:
+            workers.pop(worker, None)
+            if not workers:
+                del self.remote_interest[device_id]
+
+    @staticmethod
+    def _is_stale(record, now):
+        return now - record.get('refreshed', record.get('last_seen', 0)) > STALE_RECORD_AGE
+
+    def refresh_interest(self, now=None):
+        for device_id in list(self.local_interest):
+            self._announce_interest(device_id)
+        cutoff = (now or time.time()) - STALE_INTEREST_AGE
+        for device_id, workers in list(self.remote_interest.items()):
+            for worker, heard in list(workers.items()):
+                if heard < cutoff:
+                    logger.warning(f"Dropping stale interest in {device_id} from worker {worker}")
+                    self.stats['stale_interest'] += 1
+                    self._drop_interest(device_id, worker)
+
+    def refresh_records(self):
+        # Re-stamp the records of devices this worker owns; no event, readers pick it up in check_records.
+        now = time.time()
+        for device_id, record in self.local_owner.items():
+            record['refreshed'] = now
+            self.backend.hset(DEVICES_KEY, device_id, record, ephemeral=True)
+
+    async def check_records(self, now=None):
+        # Owners that died without their records expiring (no connection-scoped fields) stop refreshing.
+        now = now or time.time()
+        stored = await self.backend.hgetall(DEVICES_KEY)
+        for device_id, record in list(self.remote_owner.items()):
+            if record['status'] != 'online' or record['worker'] == self.worker_id:
+                continue
+            latest = stored.get(device_id)
+            if latest and latest.get('worker') == record['worker']:
+                record['refreshed'] = latest.get('refreshed', record.get('refreshed'))
+            if self._is_stale(record, now):
+                logger.warning(f"Record of {device_id} from worker {record['worker']} is stale; marking offline")
+                self.stats['stale_records'] += 1
+                self._on_status(device_id, dict(record, status='offline'))
+
+    async def _refresh_loop(self):
+        while True:
+            await asyncio.sleep(REFRESH_INTERVAL)
+            try:
+                self.refresh_interest()
+                self.refresh_records()
+                await self.check_records()
+            except Exception as e:
+                logger.error(f"Cluster refresh failed: {e}")
+
+    def get_stats(self):
+        return {
+            'worker_id': self.worker_id,
+            'enabled': self.enabled,
+            'remote_devices': sum(1 for r in self.remote_owner.values() if r['status'] == 'online'),
+            'remote_interest': {d: sorted(w) for d, w in self.remote_interest.items()},
+            'local_interest': dict(self.local_interest),
+            **self.stats,
+        }
+
+
+cluster_sync = ClusterSync()
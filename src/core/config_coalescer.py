@@ -0,0 +1,75 @@
+import asyncio
+import logging
+
+from src.core.device_socket_manager import device_socket_manager
+from src.core.metrics import CONFIG_UPDATES_COALESCED
+
+logger = logging.getLogger("ConfigCoalescer")
+
+COALESCE_WINDOW = 0.3
+
+
+class ConfigCoalescer:
+    def __init__(self, send, window=COALESCE_WINDOW):
+        self.send = send              # async (device_id, command, payload) -> bool
+        self.window = window
+
+        self.pending = {}             # Map: { device_id: { 'updates', 'future', 'timer' } }
+        self._locks = {}              # Map: { device_id: asyncio.Lock }, one flush in flight per device
+        self.stats = {'submitted': 0, 'sent': 0}
+
+    @property
+    def saved(self):
+        return self.stats['submitted'] - self.stats['sent'] - len(self.pending)
+
+    def _lock(self, device_id):
+        lock = self._locks.get(device_id)
+        if lock is None:
+            lock = self._locks[device_id] = asyncio.Lock()
+        return lock
+
+    def submit(self, device_id, updates):
+        # Returns (future, is_new_batch); every caller merged into the same batch shares the future.
+        self.stats['submitted'] += 1
+
+        batch = self.pending.get(device_id)
+        if batch is not None:
+            batch['updates'].update(updates)
+            CONFIG_UPDATES_COALESCED.inc()
+            return batch['future'], False
+
+        batch = {
+            'updates': dict(updates),
+            'future': asyncio.get_running_loop().create_future(),
+            'timer': None,
+        }
+        self.pending[device_id] = batch
+        batch['timer'] = asyncio.create_task(self._flush_later(device_id))
+        return batch['future'], True
+
+    async def _flush_later(self, device_id):
+        await asyncio.sleep(self.window)
+        await self.flush(device_id)
+
+    async def flush(self, device_id):
+        async with self._lock(device_id):
+            batch = self.pending.pop(device_id, None)
+            if batch is None:
+                return True
+
+            if batch['timer'] is not asyncio.current_task():
+                batch['timer'].cancel()
+
+            try:
+                ok = await self.send(device_id, 'update_config', batch['updates'])
+            except Exception as e:
+                logger.error(f"Config flush to {device_id} failed: {e}")
+                ok = False
+
+            self.stats['sent'] += 1
+            if not batch['future'].done():
+                batch['future'].set_result(ok)
+            return ok
+
+
+config_coalescer = ConfigCoalescer(device_socket_manager.send_command)
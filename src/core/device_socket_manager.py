@@ -1,29 +1,67 @@
 import socketio
 import logging
 import asyncio
+import uuid
 import cv2
 import numpy as np
 import time
 from src.core.factory_manager import factory_manager
+from src.core.session_registry import SessionRegistry
+from src.core.frame_hub import frame_hub
+from src.core.frame_ring import frame_rings
+from src.core.clip_recorder import clip_recorder
+from src.core.stream_variants import variant_transcoder, normalize_variant, MAIN_VARIANT
+from src.core.telemetry_store import telemetry_store
+from src.core.state_backend import state_backend
+from src.core.cluster_sync import cluster_sync
+from src.core.latency_tracer import latency_tracer
+from src.core.metrics import DEVICES_CONNECTED, FRAMES_RECEIVED, COMMAND_LATENCY, COMMAND_FAILURES
+from src.core.wire_format import (
+    WIRE_LEGACY, WIRE_BINARY, WIRE_VERSION, WireFormatError, DeviceIndexTable, unpack_frame,
+    unpack_telemetry
+)
 
 logger = logging.getLogger("SocketManager")
 
+# last_seen changes on every frame; listeners only hear about it this often per device.
+STATUS_TICK_INTERVAL = 5.0
+COMMAND_TIMEOUT = 5.0
+
+
+class DeviceOfflineError(Exception):
+    pass
+
+
 class DeviceSocketManager:
     def __init__(self):
 
         self.sio = socketio.AsyncServer(
             async_mode='asgi',
             cors_allowed_origins='*', 
-            max_http_buffer_size=10*1024*1024 
+            max_http_buffer_size=10*1024*1024,
+            # None (the default in-process manager) unless a shared state backend is configured.
+            client_manager=state_backend.client_manager('qai:socketio:device')
         )
         
 
         self.app = socketio.ASGIApp(self.sio)
 
-        self.connected_devices = {}   # Map: { sid: device_id }
+        self.sessions = SessionRegistry()   # sid <-> device_id, with reconnect generations
+        DEVICES_CONNECTED.set_function(lambda: len(self.sessions))
         self.device_data = {}         # Map: { device_id: { 'frame': bytes, 'stats': dict, 'status': 'online' } }
 
         self.user_socket = NotImplementedError
+        self.status_listeners = []
+        self._last_status_push = {}   # Map: { device_id: time of last pushed tick }
+        self._pending_commands = {}   # Map: { request_id: Future }
+        self._telemetry_waiters = {}  # Map: { (device_id, mode): [Future] }
+        self._background_tasks = set()
+        self.device_index = DeviceIndexTable()   # device_id <-> compact index for the binary wire format
+        self._last_seq = {}           # Map: { device_id: last frame sequence }
+        self._black_frame = None
+        variant_transcoder.on_frame = self._publish_frame
+        factory_manager.add_listener(self._on_factory_change)
+        cluster_sync.bind(self)
 
         self._register_handlers()
 
@@ -35,40 +73,56 @@ class DeviceSocketManager:
 
         @self.sio.event
         async def disconnect(sid):
-            device_id = self.connected_devices.get(sid)
-            if device_id:
+            device_id, is_current = self.sessions.unregister(sid)
+            if device_id and is_current:
+                frame_rings.close_writer(device_id)
+            if device_id and not is_current:
+                # The device already re-registered on a newer sid; this one is just the stale socket closing.
+                logger.info(f"Stale session closed: {device_id} ({sid})")
+            elif device_id and cluster_sync.remote_sid(device_id):
+                # Closed because the device re-registered on another worker; show its state from there.
+                record = cluster_sync.remote_owner[device_id]
+                logger.info(f"Device {device_id} moved to worker {record['worker']} ({sid})")
+                self._apply_remote_status(device_id, record)
+            elif device_id:
                 logger.warning(f"❌ Device disconnected: {device_id} ({sid})")
                 
                 if device_id in self.device_data:
                     self.device_data[device_id]['status'] = 'offline'
                 
-                del self.connected_devices[sid]
+                self._notify_status(device_id)
             else:
                 logger.info(f"Unknown client disconnected: {sid}")
 
         @self.sio.event
-        async def register_device(sid, device_id):
+        async def register_device(sid, data):
+            # Legacy devices send a bare id string; newer ones send {'device_id', 'wire'} to negotiate framing.
+            if isinstance(data, dict):
+                device_id, wire = data.get('device_id'), data.get('wire', WIRE_LEGACY)
+            else:
+                device_id, wire = data, WIRE_LEGACY
+
             if not factory_manager.is_allowed(device_id):
                 logger.warning(f"REJECTED: Unknown device '{device_id}' tried to connect.")
                 await self.sio.disconnect(sid) 
                 return
-            logger.info(f"Device Accepted: {device_id} (Line: {factory_manager.device_to_line.get(device_id)})")
+            logger.info(f"Device Accepted: {device_id} (Line: {factory_manager.device_to_line.get(device_id)}, wire: {wire})")
             
-            self.connected_devices[sid] = device_id
+            generation, stale_sid = self.sessions.register(sid, device_id)
+            stale_sid = stale_sid or cluster_sync.remote_sid(device_id)
+            if stale_sid:
+                logger.warning(f"Device {device_id} re-registered (gen {generation}); closing stale session {stale_sid}")
+                await self.sio.disconnect(stale_sid)
+            self._last_seq.pop(device_id, None)
             
-            if device_id not in self.device_data:
-                self.device_data[device_id] = {
-                    'frame': self._create_black_frame(),
-                    'stats': {},
-                    'configs': {},
-                    'status': 'online',
-                    'last_seen': 0
-                }
-            else:
-                self.device_data[device_id]['status'] = 'online'
+            self._ensure_device(device_id)['status'] = 'online'
+            self._notify_status(device_id)
             await self.send_command(device_id,'get_config')
             await self.send_command(device_id,'resend_datalog')
 
+            if wire == WIRE_BINARY:
+                return {'wire': WIRE_BINARY, 'version': WIRE_VERSION, 'device_index': self.device_index.assign(device_id)}
+
         @self.sio.event
         async def video_frame(sid, data):
             device_id = data.get('id')
@@ -77,59 +131,287 @@ class DeviceSocketManager:
             if not device_id or not image_bytes:
                 return
 
-            if device_id not in self.device_data:
+            if self.sessions.get_device(sid) == device_id and not self.sessions.is_current(sid):
                 return
-            
-            self.device_data[device_id]['frame'] = image_bytes
-            self.device_data[device_id]['status'] = 'online' 
-            self.device_data[device_id]['last_seen'] = time.time()
 
-            if self.user_socket:
-                await self.user_socket.broadcast_frame(device_id, image_bytes)
+            # Optional tracing fields; devices that do not send them get a server-side sequence.
+            self._ingest_frame(device_id, image_bytes, data.get('seq'), data.get('ts'))
+
+        @self.sio.event
+        async def video_frame_bin(sid, *args):
+            try:
+                device_index, seq, capture_ts, image_bytes = unpack_frame(args)
+            except WireFormatError as e:
+                logger.warning(f"Bad binary frame from {sid}: {e}")
+                return
+
+            device_id = self.device_index.lookup(device_index)
+            if device_id is None or self.sessions.get_device(sid) != device_id or not self.sessions.is_current(sid):
+                return
+
+            # Frames can overtake each other across reconnects; never step back to an older one.
+            last = self._last_seq.get(device_id)
+            if last is not None and (seq - last) & 0xFFFFFFFF >= 0x80000000:
+                return
+            self._ingest_frame(device_id, image_bytes, seq, capture_ts)
 
         @self.sio.event
         async def telemetry(sid, data):
             device_id = data.get('id')
-            mode = data.get('mode')
-            data = data.get('data')
-            if device_id and device_id in self.device_data:
-                self.device_data[device_id][mode].update(data)
+            if self.sessions.get_device(sid) == device_id and not self.sessions.is_current(sid):
+                return
+            self._ingest_telemetry(device_id, data.get('mode'), data.get('data'))
+
+        @self.sio.event
+        async def telemetry_bin(sid, *args):
+            try:
+                device_index, mode, payload = unpack_telemetry(args)
+            except WireFormatError as e:
+                logger.warning(f"Bad binary telemetry from {sid}: {e}")
+                return
+
+            device_id = self.device_index.lookup(device_index)
+            if device_id is not None and self.sessions.get_device(sid) == device_id and self.sessions.is_current(sid):
+                self._ingest_telemetry(device_id, mode, payload)
+
+        @self.sio.event
+        async def command_response(sid, data):
+            if isinstance(data, dict):
+                request_id = data.get('request_id')
+                if request_id in self._pending_commands:
+                    self._resolve_command(request_id, data.get('result'))
+                elif request_id:
+                    # Issued by another worker.
+                    cluster_sync.publish_command_result(request_id, data.get('result'))
+
+    def _ensure_device(self, device_id):
+        if device_id not in self.device_data:
+            self.device_data[device_id] = {
+                'frame': self._create_black_frame(),
+                'stats': {},
+                'configs': {},
+                'status': 'online',
+                'last_seen': 0
+            }
+            frame_hub.publish(device_id, self.device_data[device_id]['frame'])
+        return self.device_data[device_id]
+
+    def _ingest_frame(self, device_id, image_bytes, seq=None, capture_ts=None):
+        if device_id not in self.device_data:
+            return
+        
+        self.device_data[device_id]['frame'] = image_bytes
+        self.device_data[device_id]['status'] = 'online' 
+        self.device_data[device_id]['last_seen'] = now = time.time()
+        if now - self._last_status_push.get(device_id, 0) >= STATUS_TICK_INTERVAL:
+            self._notify_status(device_id)
+
+        if seq is None:
+            seq = self._last_seq.get(device_id, 0) + 1
+        self._last_seq[device_id] = seq
+        latency_tracer.record_span(device_id, 'capture_to_receive', capture_ts, now)
+        meta = {'seq': seq, 'ts_capture': capture_ts, 'ts_recv': now}
+
+        telemetry_store.record(device_id, 'server_frames', 1, now)
+        FRAMES_RECEIVED.labels(device_id).inc()
+        clip_recorder.on_frame(device_id, image_bytes, now)
+        self._publish_frame(device_id, image_bytes, meta=meta)
+        variant_transcoder.submit(device_id, image_bytes, meta)
+        cluster_sync.publish_frame(device_id, image_bytes, meta)
+
+    def _ingest_telemetry(self, device_id, mode, data, local=True):
+        if device_id and device_id in self.device_data:
+            self.device_data[device_id][mode].update(data)
+            if local:
+                cluster_sync.publish_telemetry(device_id, mode, data)
+                clip_recorder.on_telemetry(device_id, data)
+            if mode == 'configs' and 'ip' in data:
+                self._notify_status(device_id, publish=local)
+            elif mode == 'stats' and local:
+                telemetry_store.record_many(device_id, data)
+            for future in self._telemetry_waiters.pop((device_id, mode), []):
+                if not future.done():
+                    future.set_result(dict(self.device_data[device_id][mode]))
+
+    # --- State mirrored from the worker that owns the device socket (see ClusterSync) ---
+
+    def _apply_remote_status(self, device_id, record):
+        if not factory_manager.is_allowed(device_id):
+            return
+        data = self._ensure_device(device_id)
+        data['status'] = record['status']
+        data['last_seen'] = record['last_seen']
+        if record.get('ip'):
+            data['configs']['ip'] = record['ip']
+        self._notify_status(device_id, publish=False)
+
+    def _apply_remote_telemetry(self, device_id, mode, data):
+        if device_id in self.device_data and mode in ('stats', 'configs'):
+            self._ingest_telemetry(device_id, mode, data, local=False)
+
+    def _apply_remote_frame(self, device_id, image_bytes, meta):
+        if device_id not in self.device_data or self.sessions.is_connected(device_id):
+            return
+        self.device_data[device_id]['frame'] = image_bytes
+        self._publish_frame(device_id, image_bytes, meta=meta)
+        variant_transcoder.submit(device_id, image_bytes, meta)
 
     def _create_black_frame(self):
-        img = np.zeros((360, 640, 3), dtype=np.uint8)
-        cv2.putText(img, "NO SIGNAL", (200, 180), cv2.FONT_HERSHEY_SIMPLEX, 1, (255, 255, 255), 2)
-        _, buf = cv2.imencode('.jpg', img)
-        return buf.tobytes()
-
-    async def get_stream_generator(self, device_id):
-        while True:
-            data = self.device_data.get(device_id)
-            
-            if data:
-                frame = data.get('frame')
-                if frame:
-                    yield (b'--frame\r\n'
-                           b'Content-Type: image/jpeg\r\n\r\n' + frame + b'\r\n')
-                else:
-                    await asyncio.sleep(0.1)
-            else:
-                await asyncio.sleep(1.0)
-            
-            await asyncio.sleep(0.03)
+        # Same placeholder for every device: encode once instead of on the loop per registration.
+        if self._black_frame is None:
+            img = np.zeros((360, 640, 3), dtype=np.uint8)
+            cv2.putText(img, "NO SIGNAL", (200, 180), cv2.FONT_HERSHEY_SIMPLEX, 1, (255, 255, 255), 2)
+            _, buf = cv2.imencode('.jpg', img)
+            self._black_frame = buf.tobytes()
+        return self._black_frame
+
+    def get_status(self, device_id):
+        data = self.device_data.get(device_id, {})
+        return {
+            'device_id': device_id,
+            'status': data.get('status', 'offline'),
+            'last_seen': data.get('last_seen', 0),
+            'ip': data.get('configs', {}).get('ip', 'N/A'),
+        }
+
+    def add_status_listener(self, callback):
+        self.status_listeners.append(callback)
+
+    def remove_status_listener(self, callback):
+        if callback in self.status_listeners:
+            self.status_listeners.remove(callback)
+
+    def _notify_status(self, device_id, publish=True):
+        self._last_status_push[device_id] = time.time()
+        status = self.get_status(device_id)
+        if publish:
+            cluster_sync.publish_status(device_id, status, self.sessions.get_sid(device_id))
+        for callback in list(self.status_listeners):
+            try:
+                callback(status)
+            except Exception as e:
+                logger.error(f"Status listener failed: {e}")
+
+    def _on_factory_change(self, diff):
+        # Devices dropped from factory.json lose their session; register_device rejects them from now on.
+        for device_id in diff['removed_devices']:
+            sid = self.sessions.get_sid(device_id)
+            self.device_data.pop(device_id, None)
+            self._notify_status(device_id)
+            if sid:
+                logger.warning(f"Device {device_id} removed from factory config; disconnecting {sid}")
+                task = asyncio.create_task(self.sio.disconnect(sid))
+                self._background_tasks.add(task)
+                task.add_done_callback(self._background_tasks.discard)
+
+    def _publish_frame(self, device_id, image_bytes, variant=MAIN_VARIANT, meta=None):
+        frame_hub.publish(device_id, image_bytes, variant)
+        if self.user_socket:
+            self.user_socket.publish_frame(device_id, image_bytes, variant, meta)
+
+    async def get_stream_generator(self, device_id, max_fps=None, variant=MAIN_VARIANT):
+        variant = normalize_variant(variant)
+        variant_transcoder.acquire(device_id, variant)
+        cluster_sync.acquire(device_id)
+        try:
+            async for chunk in frame_hub.stream(device_id, max_fps=max_fps, variant=variant):
+                yield chunk
+        finally:
+            variant_transcoder.release(device_id, variant)
+            cluster_sync.release(device_id)
+
+    def record_clip(self, device_id, reason='manual'):
+        # The recorder sees frames only where the device socket lives; elsewhere, ask that worker.
+        if self.sessions.is_connected(device_id):
+            return clip_recorder.trigger(device_id, reason)
+        if cluster_sync.remote_sid(device_id):
+            cluster_sync.request_clip(device_id, reason)
+            return True
+        return None
+
+    def _command_target(self, device_id):
+        # Local sockets skip the message queue; a device on another worker is reached through it.
+        target_sid = self.sessions.get_sid(device_id)
+        if target_sid:
+            return target_sid, True
+        return cluster_sync.remote_sid(device_id), False
 
     async def send_command(self, device_id, command, payload=None):
-        target_sid = None
-        for sid, dev_id in self.connected_devices.items():
-            if dev_id == device_id:
-                target_sid = sid
-                break
-        
+        target_sid, local = self._command_target(device_id)
         if target_sid:
             data = {'command': command, 'payload': payload}
-            await self.sio.emit('server_command', data, to=target_sid)
+            with COMMAND_LATENCY.labels(command).time():
+                await self.sio.emit('server_command', data, to=target_sid, ignore_queue=local)
             return True
+        COMMAND_FAILURES.labels(command, 'offline').inc()
         return False
     
+    def _resolve_command(self, request_id, result):
+        future = self._pending_commands.get(request_id)
+        if future and not future.done():
+            future.set_result(result)
+
+    async def request(self, device_id, command, payload=None, timeout=COMMAND_TIMEOUT):
+        # Awaitable command: resolves on the Socket.IO ack or a 'command_response' event
+        # carrying the same request_id, whichever arrives first.
+        target_sid, local = self._command_target(device_id)
+        if not target_sid:
+            COMMAND_FAILURES.labels(command, 'offline').inc()
+            raise DeviceOfflineError(device_id)
+
+        request_id = uuid.uuid4().hex
+        future = asyncio.get_running_loop().create_future()
+        self._pending_commands[request_id] = future
+
+        data = {'command': command, 'payload': payload, 'request_id': request_id}
+        started = time.perf_counter()
+        try:
+            await self.sio.emit(
+                'server_command', data, to=target_sid, ignore_queue=local,
+                callback=lambda *args: self._resolve_command(request_id, args[0] if args else None)
+            )
+            result = await asyncio.wait_for(future, timeout)
+            COMMAND_LATENCY.labels(command).observe(time.perf_counter() - started)
+            return result
+        except asyncio.TimeoutError:
+            COMMAND_FAILURES.labels(command, 'timeout').inc()
+            raise
+        except Exception:
+            COMMAND_FAILURES.labels(command, 'error').inc()
+            raise
+        finally:
+            self._pending_commands.pop(request_id, None)
+
+    def _watch_telemetry(self, device_id, mode):
+        future = asyncio.get_running_loop().create_future()
+        self._telemetry_waiters.setdefault((device_id, mode), []).append(future)
+        return future
+
+    def _unwatch_telemetry(self, device_id, mode, future):
+        waiters = self._telemetry_waiters.get((device_id, mode), [])
+        if future in waiters:
+            waiters.remove(future)
+        if not waiters:
+            self._telemetry_waiters.pop((device_id, mode), None)
+
+    async def _await_telemetry(self, device_id, mode, future, timeout):
+        try:
+            return await asyncio.wait_for(future, timeout)
+        finally:
+            self._unwatch_telemetry(device_id, mode, future)
+
+    async def wait_for_telemetry(self, device_id, mode, timeout=COMMAND_TIMEOUT):
+        future = self._watch_telemetry(device_id, mode)
+        return await self._await_telemetry(device_id, mode, future, timeout)
+
+    async def request_config(self, device_id, timeout=COMMAND_TIMEOUT):
+        # Devices answer get_config with a 'configs' telemetry push; wait for that snapshot.
+        future = self._watch_telemetry(device_id, 'configs')
+        if not await self.send_command(device_id, 'get_config'):
+            self._unwatch_telemetry(device_id, 'configs', future)
+            raise DeviceOfflineError(device_id)
+        return await self._await_telemetry(device_id, 'configs', future, timeout)
+
     def bind_user_socket(self, user_socket):
         self.user_socket = user_socket
 
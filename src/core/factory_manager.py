@@ -1,5 +1,6 @@
 import json
 import os
+import asyncio
 import logging
 
 logger = logging.getLogger("FactoryManager")
@@ -7,33 +8,89 @@ logger = logging.getLogger("FactoryManager")
 class FactoryManager:
     def __init__(self, config_path="configs/factory.json"):
         self.config_path = config_path
-        self.structure = {}   
-        self.valid_devices = set() 
-        self.device_to_line = {}  
-        
+        self.structure = {}
+        self.valid_devices = set()
+        self.device_to_line = {}
+
+        self.listeners = []
+        self._watch_task = None
+
         self.load_config()
 
     def load_config(self):
         if not os.path.exists(self.config_path):
             logger.error(f"Config file not found: {self.config_path}")
-            return
+            return None
 
         try:
             with open(self.config_path, 'r', encoding='utf-8') as f:
-                self.structure = json.load(f)
-            
-            self.valid_devices.clear()
-            self.device_to_line.clear()
-            
-            for line_id, info in self.structure.items():
+                structure = json.load(f)
+
+            valid_devices = set()
+            device_to_line = {}
+
+            for line_id, info in structure.items():
                 for dev_id in info.get('devices', []):
-                    self.valid_devices.add(dev_id)
-                    self.device_to_line[dev_id] = line_id
-            
-            logger.info(f"Loaded factory config: {len(self.structure)} lines, {len(self.valid_devices)} devices.")
-            
+                    valid_devices.add(dev_id)
+                    device_to_line[dev_id] = line_id
+
         except Exception as e:
             logger.error(f"Failed to load factory config: {e}")
+            return None
+
+        diff = self._diff(structure, device_to_line)
+
+        # Swap whole objects so readers never see a half-built config.
+        self.structure, self.valid_devices, self.device_to_line = structure, valid_devices, device_to_line
+
+        logger.info(f"Loaded factory config: {len(self.structure)} lines, {len(self.valid_devices)} devices.")
+        return diff
+
+    def _diff(self, structure, device_to_line):
+        old_lines, new_lines = set(self.structure), set(structure)
+        old_devices, new_devices = set(self.device_to_line), set(device_to_line)
+        return {
+            'added_lines': sorted(new_lines - old_lines),
+            'removed_lines': sorted(old_lines - new_lines),
+            'changed_lines': sorted(l for l in old_lines & new_lines if self.structure[l] != structure[l]),
+            'added_devices': sorted(new_devices - old_devices),
+            'removed_devices': sorted(old_devices - new_devices),
+            'moved_devices': sorted(d for d in old_devices & new_devices if self.device_to_line[d] != device_to_line[d]),
+        }
+
+    def add_listener(self, callback):
+        self.listeners.append(callback)
+
+    def remove_listener(self, callback):
+        if callback in self.listeners:
+            self.listeners.remove(callback)
+
+    def reload(self):
+        diff = self.load_config()
+        if diff is None or not any(diff.values()):
+            return diff
+
+        logger.info(f"Factory config changed: {diff}")
+        for callback in list(self.listeners):
+            try:
+                callback(diff)
+            except Exception as e:
+                logger.error(f"Factory config listener failed: {e}")
+        return diff
+
+    async def _watch(self):
+        from watchfiles import awatch
+
+        # Watch the directory: editors often save by replacing the file.
+        config_dir = os.path.dirname(os.path.abspath(self.config_path)) or '.'
+        config_file = os.path.abspath(self.config_path)
+        async for changes in awatch(config_dir):
+            if any(os.path.abspath(path) == config_file for _, path in changes):
+                self.reload()
+
+    def start_watching(self):
+        if self._watch_task is None or self._watch_task.done():
+            self._watch_task = asyncio.create_task(self._watch())
 
     def is_allowed(self, device_id):
         return device_id in self.valid_devices
@@ -44,4 +101,4 @@ class FactoryManager:
     def get_all_lines(self):
         return self.structure
 
-factory_manager = FactoryManager()
\ No newline at end of file
+factory_manager = FactoryManager()
@@ -0,0 +1,83 @@
+import time
+import uuid
+import asyncio
+import logging
+from collections import deque
+
+from src.core.factory_manager import factory_manager
+from src.core.device_socket_manager import device_socket_manager, DeviceOfflineError
+from src.core.config_coalescer import config_coalescer
+
+logger = logging.getLogger("FleetManager")
+
+FLEET_MAX_PARALLEL = 8
+FLEET_TIMEOUT = 5.0
+
+
+class FleetManager:
+    def __init__(self, history_size=50):
+        self.rollouts = deque(maxlen=history_size)
+
+    def resolve_targets(self, lines=None, devices=None, all_devices=False):
+        if all_devices:
+            targets = [dev for info in factory_manager.get_all_lines().values() for dev in info.get('devices', [])]
+        else:
+            targets = []
+            for line_id in lines or []:
+                targets.extend(factory_manager.get_line_info(line_id).get('devices', []))
+            targets.extend(devices or [])
+
+        # Keep config order, drop duplicates and ids the factory config does not know.
+        seen = set()
+        return [d for d in targets if factory_manager.is_allowed(d) and not (d in seen or seen.add(d))]
+
+    async def _dispatch_one(self, semaphore, device_id, command, payload, timeout):
+        async with semaphore:
+            started = time.perf_counter()
+            result = {'device_id': device_id, 'status': None, 'result': None, 'latency_ms': None}
+            try:
+                await config_coalescer.flush(device_id)
+                result['result'] = await device_socket_manager.request(device_id, command, payload, timeout=timeout)
+                result['status'] = 'acked'
+            except DeviceOfflineError:
+                result['status'] = 'offline'
+            except asyncio.TimeoutError:
+                result['status'] = 'timeout'
+            except Exception as e:
+                result['status'] = 'error'
+                result['result'] = str(e)
+            result['latency_ms'] = round((time.perf_counter() - started) * 1000, 1)
+            return result
+
+    async def dispatch(self, targets, command, payload=None, max_parallel=FLEET_MAX_PARALLEL, timeout=FLEET_TIMEOUT):
+        rollout = {
+            'id': uuid.uuid4().hex[:8],
+            'command': command,
+            'payload': payload,
+            'targets': len(targets),
+            'started': time.time(),
+        }
+        logger.info(f"Fleet rollout {rollout['id']}: '{command}' -> {len(targets)} devices")
+
+        semaphore = asyncio.Semaphore(max(1, max_parallel))
+        t0 = time.perf_counter()
+        results = await asyncio.gather(*[
+            self._dispatch_one(semaphore, device_id, command, payload, timeout) for device_id in targets
+        ])
+
+        summary = {}
+        for r in results:
+            summary[r['status']] = summary.get(r['status'], 0) + 1
+
+        rollout.update({
+            'duration_ms': round((time.perf_counter() - t0) * 1000, 1),
+            'summary': summary,
+            'stragglers': [r['device_id'] for r in results if r['status'] == 'timeout'],
+            'results': results,
+        })
+        self.rollouts.append(rollout)
+        logger.info(f"Fleet rollout {rollout['id']} done in {rollout['duration_ms']} ms: {summary}")
+        return rollout
+
+
+fleet_manager = FleetManager()
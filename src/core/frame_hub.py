@@ -0,0 +1,82 @@
+import asyncio
+import time
+import logging
+
+logger = logging.getLogger("FrameHub")
+
+BOUNDARY = b'--frame\r\n'
+
+
+def build_multipart_chunk(frame: bytes):
+    return b''.join((
+        BOUNDARY,
+        b'Content-Type: image/jpeg\r\nContent-Length: ', str(len(frame)).encode(), b'\r\n\r\n',
+        frame,
+        b'\r\n'
+    ))
+
+
+class DeviceFrameHub:
+    def __init__(self):
+        self.frame = None
+        self.seq = 0
+        self.subscribers = 0
+
+        self._chunk = None
+        self._chunk_seq = 0
+        self._event = asyncio.Event()
+
+    def publish(self, frame: bytes):
+        self.frame = frame
+        self.seq += 1
+        event, self._event = self._event, asyncio.Event()
+        event.set()
+
+    def chunk(self):
+        # Built at most once per frame and shared by every subscriber.
+        if self._chunk_seq != self.seq:
+            self._chunk = build_multipart_chunk(self.frame)
+            self._chunk_seq = self.seq
+        return self._chunk
+
+    async def wait_newer(self, last_seq):
+        while self.seq == last_seq:
+            await self._event.wait()
+        return self.seq, self.chunk()
+
+
+class FrameHub:
+    def __init__(self):
+        self.hubs = {}   # Map: { (device_id, variant): DeviceFrameHub }
+
+    def get(self, device_id, variant='main'):
+        key = (device_id, variant)
+        hub = self.hubs.get(key)
+        if hub is None:
+            hub = self.hubs[key] = DeviceFrameHub()
+        return hub
+
+    def publish(self, device_id, frame: bytes, variant='main'):
+        self.get(device_id, variant).publish(frame)
+
+    async def stream(self, device_id, max_fps=None, variant='main'):
+        hub = self.get(device_id, variant)
+        min_interval = 1.0 / max_fps if max_fps and max_fps > 0 else 0.0
+
+        hub.subscribers += 1
+        try:
+            last_seq = 0
+            while True:
+                last_seq, chunk = await hub.wait_newer(last_seq)
+                sent_at = time.monotonic()
+                yield chunk
+
+                if min_interval:
+                    remaining = min_interval - (time.monotonic() - sent_at)
+                    if remaining > 0:
+                        await asyncio.sleep(remaining)
+        finally:
+            hub.subscribers -= 1
+
+
+frame_hub = FrameHub()
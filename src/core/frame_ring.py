@@ -0,0 +1,274 @@
+import os
+import re
+import struct
+import hashlib
+import logging
+from multiprocessing import shared_memory, resource_tracker
+
+from src.core.state_backend import state_backend
+
+logger = logging.getLogger("FrameRing")
+
+# Per-device ring of the last N frames in a shared memory segment. One writer (the process that owns
+# the device socket); any process on the host can attach by name and read without pickling.
+# Only used between workers (a shared QAI_STATE_BACKEND), and only for devices viewed from another worker.
+RING_SLOTS = int(os.environ.get('QAI_FRAME_RING_SLOTS', '16'))            # 0 disables the rings
+SLOT_BYTES = int(os.environ.get('QAI_FRAME_SLOT_BYTES', str(256 * 1024)))  # larger frames are skipped
+# All rings of this process together; Docker's default /dev/shm is 64 MB. Devices past it go without.
+SHM_BUDGET = int(os.environ.get('QAI_FRAME_RING_SHM_BYTES', str(32 * 1024 * 1024)))
+
+MAGIC = b'QFR1'
+HEADER = struct.Struct('<4sIIQ')         # magic, slots, slot_bytes, head (last written ring seq)
+HEAD_OFFSET = 16
+HEADER_SIZE = 64
+LOCK = struct.Struct('<Q')               # per-slot seqlock: odd while writing, 2 * seq once complete
+SLOT_FIELDS = struct.Struct('<QQIdd')    # ring seq, frame seq, length, ts_capture, ts_recv
+SLOT_HEADER_SIZE = 64
+U64 = struct.Struct('<Q')
+
+
+def _segment_name(device_id):
+    # The hash keeps ids that sanitize alike (a.b / a_b) or share a long prefix apart.
+    digest = hashlib.sha1(device_id.encode('utf-8')).hexdigest()[:10]
+    return f"qai{os.getpid()}_{re.sub(r'[^A-Za-z0-9_-]', '_', device_id)[:64]}_{digest}"
+
+
+def ring_size(slots, slot_bytes):
+    return HEADER_SIZE + slots * (SLOT_HEADER_SIZE + slot_bytes)
+
+
+class RingFrame:
+    __slots__ = ('ring', 'seq', 'frame_seq', 'ts_capture', 'ts_recv', 'data')
+
+    def __init__(self, ring, seq, frame_seq, ts_capture, ts_recv, data):
+        self.ring = ring
+        self.seq = seq
+        self.frame_seq = frame_seq
+        self.ts_capture = ts_capture
+        self.ts_recv = ts_recv
+        self.data = data          # bytes, or a memoryview into the segment for zero-copy reads
+
+    def intact(self):
+        # A zero-copy view is only trustworthy if the writer has not lapped its slot since.
+        return self.ring.slot_lock(self.seq) == 2 * self.seq
+
+    def meta(self):
+        return {'seq': self.frame_seq, 'ts_capture': self.ts_capture or None, 'ts_recv': self.ts_recv}
+
+
+class FrameRing:
+    def __init__(self, shm, owner):
+        self.shm = shm
+        self.name = shm.name
+        self.owner = owner
+        magic, self.slots, self.slot_bytes, _ = HEADER.unpack_from(shm.buf, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{self.name} is not a frame ring")
+        self.stride = SLOT_HEADER_SIZE + self.slot_bytes
+        self.stats = {'written': 0, 'oversize': 0}
+
+    @classmethod
+    def create(cls, device_id, slots=RING_SLOTS, slot_bytes=SLOT_BYTES, replace_stale=False):
+        name = _segment_name(device_id)
+        size = ring_size(slots, slot_bytes)
+        try:
+            shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+        except FileExistsError:
+            if not replace_stale:
+                raise
+            # Left over from an earlier process with our pid (e.g. a restarted container).
+            stale = shared_memory.SharedMemory(name=name)
+            stale.close()
+            stale.unlink()
+            shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+        try:
+            # tmpfs allocates pages on first touch, and a write that finds /dev/shm full is a SIGBUS,
+            # not an exception. Reserving them now turns that into an OSError here.
+            os.posix_fallocate(shm._fd, 0, size)
+        except OSError:
+            shm.close()
+            shm.unlink()
+            raise
+        HEADER.pack_into(shm.buf, 0, MAGIC, slots, slot_bytes, 0)
+        return cls(shm, owner=True)
+
+    @classmethod
+    def attach(cls, name):
+        shm = shared_memory.SharedMemory(name=name)
+        # Readers must not unlink the writer's segment when they exit (CPython registers attaches too).
+        resource_tracker.unregister(shm._name, 'shared_memory')
+        return cls(shm, owner=False)
+
+    def _slot_offset(self, seq):
+        return HEADER_SIZE + (seq % self.slots) * self.stride
+
+    @property
+    def head(self):
+        return U64.unpack_from(self.shm.buf, HEAD_OFFSET)[0]
+
+    def slot_lock(self, seq):
+        return LOCK.unpack_from(self.shm.buf, self._slot_offset(seq))[0]
+
+    def write(self, data, frame_seq=0, ts_capture=None, ts_recv=0.0):
+        size = len(data)
+        if size > self.slot_bytes:
+            self.stats['oversize'] += 1
+            return None
+
+        seq = self.head + 1
+        offset = self._slot_offset(seq)
+        buf = self.shm.buf
+        LOCK.pack_into(buf, offset, 2 * seq - 1)
+        body = offset + SLOT_HEADER_SIZE
+        buf[body:body + size] = data
+        SLOT_FIELDS.pack_into(buf, offset + LOCK.size, seq, frame_seq or 0, size, ts_capture or 0.0, ts_recv or 0.0)
+        LOCK.pack_into(buf, offset, 2 * seq)
+        U64.pack_into(buf, HEAD_OFFSET, seq)
+        self.stats['written'] += 1
+        return seq
+
+    def read(self, seq=None, copy=True):
+        # Returns None if the slot is being written or has been reused for a newer frame.
+        head = self.head
+        seq = head if seq is None else seq
+        if seq <= 0 or seq > head or head - seq >= self.slots:
+            return None
+
+        offset = self._slot_offset(seq)
+        buf = self.shm.buf
+        if LOCK.unpack_from(buf, offset)[0] != 2 * seq:
+            return None
+        slot_seq, frame_seq, size, ts_capture, ts_recv = SLOT_FIELDS.unpack_from(buf, offset + LOCK.size)
+        body = offset + SLOT_HEADER_SIZE
+        view = buf[body:body + size]
+        frame = RingFrame(self, slot_seq, frame_seq, ts_capture, ts_recv, bytes(view) if copy else view)
+        if copy:
+            view.release()
+        if slot_seq != seq or not frame.intact():
+            if not copy:
+                view.release()
+            return None
+        return frame
+
+    def recent(self, count=None, since=None):
+        # Oldest first; for pre-event rewind. `since` filters on receive time.
+        head = self.head
+        count = min(count or self.slots, self.slots - 1, head)
+        frames = []
+        for seq in range(head - count + 1, head + 1):
+            frame = self.read(seq)
+            if frame is not None and (since is None or frame.ts_recv >= since):
+                frames.append(frame)
+        return frames
+
+    def close(self):
+        try:
+            self.shm.close()
+        except BufferError:
+            # A zero-copy reader still holds a view; the mapping goes away with the process.
+            pass
+        if self.owner:
+            try:
+                self.shm.unlink()
+            except FileNotFoundError:
+                pass
+
+
+class FrameRingRegistry:
+    def __init__(self, slots=RING_SLOTS, slot_bytes=SLOT_BYTES, budget=SHM_BUDGET, enabled=True):
+        self.slots = slots
+        self.slot_bytes = slot_bytes
+        self.budget = budget
+        self.enabled = enabled and slots > 1 and ring_size(slots, slot_bytes) <= budget
+        self.writers = {}     # Map: { device_id: FrameRing } for devices whose socket is in this process
+        self.readers = {}     # Map: { device_id: FrameRing } attached from the process that owns the device
+        self.stats = {'over_budget': 0, 'create_failed': 0}
+
+    def _reserved(self):
+        return sum(ring.shm.size for ring in self.writers.values())
+
+    def write(self, device_id, image_bytes, meta):
+        # Returns (segment name, ring seq) or None when there is no ring or the frame did not fit.
+        if not self.enabled:
+            return None
+        ring = self.writers.get(device_id)
+        if ring is None:
+            ring = self._create(device_id)
+            if ring is None:
+                return None
+        seq = ring.write(image_bytes, meta.get('seq'), meta.get('ts_capture'), meta.get('ts_recv'))
+        return (ring.name, seq) if seq else None
+
+    def _create(self, device_id):
+        if self._reserved() + ring_size(self.slots, self.slot_bytes) > self.budget:
+            # Callers fall back to sending the JPEG itself.
+            self.stats['over_budget'] += 1
+            return None
+        # Never replace a segment one of our own devices is using, only leftovers of a dead process.
+        owned = {ring.name for ring in self.writers.values()}
+        try:
+            ring = FrameRing.create(device_id, self.slots, self.slot_bytes,
+                                    replace_stale=_segment_name(device_id) not in owned)
+        except OSError as e:
+            self.stats['create_failed'] += 1
+            logger.error(f"Cannot create frame ring for {device_id}: {e}")
+            return None
+        self.writers[device_id] = ring
+        return ring
+
+    def writer(self, device_id):
+        return self.writers.get(device_id)
+
+    def close_writer(self, device_id):
+        # The device left this process (disconnected or moved to another worker).
+        ring = self.writers.pop(device_id, None)
+        if ring:
+            ring.close()
+
+    def attach(self, device_id, name):
+        ring = self.readers.get(device_id)
+        if ring is not None and ring.name != name:
+            # The owner restarted or the device moved: let go of the old segment's pages.
+            self.detach(device_id)
+            ring = None
+        if ring is None:
+            try:
+                ring = self.readers[device_id] = FrameRing.attach(name)
+            except (FileNotFoundError, ValueError):
+                return None
+        return ring
+
+    def detach(self, device_id):
+        ring = self.readers.pop(device_id, None)
+        if ring:
+            ring.close()
+
+    def read(self, device_id, name, seq, copy=True):
+        ring = self.attach(device_id, name)
+        return ring.read(seq, copy) if ring else None
+
+    def recent(self, device_id, count=None, since=None):
+        ring = self.writers.get(device_id)
+        return ring.recent(count, since) if ring else []
+
+    def close(self):
+        for ring in list(self.writers.values()) + list(self.readers.values()):
+            ring.close()
+        self.writers.clear()
+        self.readers.clear()
+
+    def get_stats(self):
+        return {
+            'enabled': self.enabled,
+            'reserved_bytes': self._reserved(),
+            'budget_bytes': self.budget,
+            'writers': {
+                device_id: {'name': ring.name, 'head': ring.head, 'slots': ring.slots, **ring.stats}
+                for device_id, ring in self.writers.items()
+            },
+            'readers': {device_id: ring.name for device_id, ring in self.readers.items()},
+            **self.stats,
+        }
+
+
+frame_rings = FrameRingRegistry(enabled=state_backend.shared)
@@ -0,0 +1,118 @@
+import bisect
+import time
+
+# Pipeline stages, in order. Timestamps are server clock except capture (device clock) and
+# paint (measured in the browser as a delta, so its clock never mixes with ours).
+STAGES = (
+    'capture_to_receive',   # device capture -> server video_frame handler (includes device clock skew)
+    'receive_to_emit',      # server receive -> emit to a viewer (mailbox wait + backpressure)
+    'receive_to_paint',     # browser: frame received -> painted
+    'emit_to_ack',          # server emit -> paint ack back at the server (emit -> paint + uplink)
+    'capture_to_ack',       # device capture -> paint ack: end to end, upper bound
+)
+
+# Log-spaced bucket upper bounds from 0.5 ms to ~60 s, ~12% apart.
+BUCKET_BOUNDS_MS = []
+_b = 0.5
+while _b < 60000:
+    BUCKET_BOUNDS_MS.append(round(_b, 2))
+    _b *= 1.12
+
+MAX_VALID_MS = 120000
+
+
+class LatencyHistogram:
+    def __init__(self):
+        self.counts = [0] * (len(BUCKET_BOUNDS_MS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, ms):
+        self.counts[bisect.bisect_left(BUCKET_BOUNDS_MS, ms)] += 1
+        self.count += 1
+        self.total += ms
+        if ms > self.max:
+            self.max = ms
+
+    def merge(self, other):
+        for i, c in enumerate(other.counts):
+            self.counts[i] += c
+        self.count += other.count
+        self.total += other.total
+        self.max = max(self.max, other.max)
+
+    def percentile(self, p):
+        if not self.count:
+            return None
+        rank = p / 100.0 * self.count
+        seen = 0
+        for i, c in enumerate(self.counts):
+            seen += c
+            if seen >= rank and c:
+                bound = BUCKET_BOUNDS_MS[i] if i < len(BUCKET_BOUNDS_MS) else self.max
+                return round(min(bound, self.max), 1)
+        return round(self.max, 1)
+
+    def summary(self):
+        return {
+            'count': self.count,
+            'mean': round(self.total / self.count, 1) if self.count else None,
+            'p50': self.percentile(50),
+            'p90': self.percentile(90),
+            'p99': self.percentile(99),
+            'max': round(self.max, 1),
+        }
+
+
+class LatencyTracer:
+    # Two rotating windows per device/stage, so percentiles cover the last one to two windows.
+    def __init__(self, window=60.0):
+        self.window = window
+        self.current = {}      # Map: { (device_id, stage): LatencyHistogram }
+        self.previous = {}
+        self._rotated_at = time.monotonic()
+
+    def _rotate(self):
+        now = time.monotonic()
+        if now - self._rotated_at >= self.window:
+            # A whole idle window means the previous data is stale too.
+            self.previous = self.current if now - self._rotated_at < 2 * self.window else {}
+            self.current = {}
+            self._rotated_at = now
+
+    def record(self, device_id, stage, ms):
+        if ms is None or ms < 0 or ms > MAX_VALID_MS:
+            return
+        self._rotate()
+        key = (device_id, stage)
+        hist = self.current.get(key)
+        if hist is None:
+            hist = self.current[key] = LatencyHistogram()
+        hist.add(ms)
+
+    def record_span(self, device_id, stage, start_ts, end_ts):
+        if start_ts:
+            self.record(device_id, stage, (end_ts - start_ts) * 1000.0)
+
+    def snapshot(self):
+        self._rotate()
+        merged = {}
+        for source in (self.previous, self.current):
+            for key, hist in source.items():
+                target = merged.get(key)
+                if target is None:
+                    target = merged[key] = LatencyHistogram()
+                target.merge(hist)
+
+        result = {}
+        for (device_id, stage), hist in sorted(merged.items()):
+            result.setdefault(device_id, {})[stage] = hist.summary()
+        return result
+
+    def reset(self):
+        self.current, self.previous = {}, {}
+        self._rotated_at = time.monotonic()
+
+
+latency_tracer = LatencyTracer()
@@ -0,0 +1,146 @@
+import os
+import sys
+import time
+import asyncio
+import logging
+import threading
+import traceback
+from collections import Counter, deque
+
+from src.core.metrics import LOOP_STALLS
+
+logger = logging.getLogger("LoopWatchdog")
+
+STALL_THRESHOLD = 0.1      # Loop delay (s) that counts as a stall
+HEARTBEAT_INTERVAL = 0.05
+SAMPLE_INTERVAL = 0.01
+STACK_DEPTH = 12
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+
+
+def _is_app_frame(filename):
+    return filename.startswith(PROJECT_ROOT) and 'site-packages' not in filename and filename != __file__
+
+
+class LoopWatchdog:
+    # The loop beats every HEARTBEAT_INTERVAL; a watcher thread that sees the beat go stale samples the
+    # loop thread's stack via sys._current_frames(), so a blocking call is caught while it is still running.
+    def __init__(self, threshold=STALL_THRESHOLD, interval=HEARTBEAT_INTERVAL,
+                 sample_interval=SAMPLE_INTERVAL, max_offenders=50):
+        self.threshold = threshold
+        self.interval = interval
+        self.sample_interval = sample_interval
+        self.max_offenders = max_offenders
+
+        self.offenders = {}            # Map: { call site: { count, total_ms, max_ms, last_seen, stack } }
+        self.recent = deque(maxlen=50)
+        self.stats = {'stalls': 0, 'samples': 0, 'worst_ms': 0.0}
+
+        self._samples = []             # (call site, stack) taken during the current stall
+        self._lock = threading.Lock()
+        self._last_beat = time.monotonic()
+        self._loop_thread_id = None
+        self._task = None
+        self._thread = None
+        self._stop = threading.Event()
+
+    def _sample_stack(self):
+        frame = sys._current_frames().get(self._loop_thread_id)
+        if frame is None:
+            return
+        stack = traceback.extract_stack(frame)[-STACK_DEPTH:]
+        # Attribute to the innermost frame in our own code; fall back to the innermost frame at all.
+        site_frame = next((f for f in reversed(stack) if _is_app_frame(f.filename)), stack[-1] if stack else None)
+        if site_frame is None:
+            return
+        site = f"{os.path.relpath(site_frame.filename, PROJECT_ROOT)}:{site_frame.lineno} in {site_frame.name}"
+        with self._lock:
+            self._samples.append((site, stack))
+
+    def _watch(self):
+        while not self._stop.wait(self.sample_interval):
+            if time.monotonic() - self._last_beat > self.interval + self.threshold:
+                self._sample_stack()
+
+    async def _heartbeat(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            self._last_beat = time.monotonic()
+            expected = loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            lag = loop.time() - expected
+            if lag >= self.threshold:
+                self._record_stall(lag)
+            elif self._samples:
+                with self._lock:
+                    self._samples = []
+
+    def _record_stall(self, lag):
+        with self._lock:
+            samples, self._samples = self._samples, []
+
+        lag_ms = lag * 1000
+        self.stats['stalls'] += 1
+        self.stats['samples'] += len(samples)
+        self.stats['worst_ms'] = max(self.stats['worst_ms'], lag_ms)
+        LOOP_STALLS.inc()
+
+        if samples:
+            # Sampling-profiler attribution: the call site seen most often during the stall.
+            site = Counter(s for s, _ in samples).most_common(1)[0][0]
+            stack = next(st for s, st in samples if s == site)
+        else:
+            site, stack = '<not sampled>', []
+        formatted = [f"{os.path.relpath(f.filename, PROJECT_ROOT) if _is_app_frame(f.filename) else f.filename}:{f.lineno} in {f.name}" for f in stack]
+
+        offender = self.offenders.get(site)
+        is_new = offender is None
+        if is_new:
+            if len(self.offenders) >= self.max_offenders:
+                del self.offenders[min(self.offenders, key=lambda k: self.offenders[k]['total_ms'])]
+            offender = self.offenders[site] = {'site': site, 'count': 0, 'total_ms': 0.0, 'max_ms': 0.0, 'last_seen': 0, 'stack': formatted}
+        offender['count'] += 1
+        offender['total_ms'] += lag_ms
+        offender['last_seen'] = time.time()
+        if lag_ms >= offender['max_ms']:
+            offender['max_ms'] = lag_ms
+            offender['stack'] = formatted or offender['stack']
+
+        self.recent.append({'time': time.time(), 'lag_ms': round(lag_ms, 1), 'site': site})
+
+        if is_new and formatted:
+            logger.warning(f"Event loop blocked {lag_ms:.0f} ms at {site}\n  " + "\n  ".join(formatted))
+        else:
+            logger.warning(f"Event loop blocked {lag_ms:.0f} ms at {site}")
+
+    def worst_offenders(self, limit=10):
+        ranked = sorted(self.offenders.values(), key=lambda o: o['total_ms'], reverse=True)[:limit]
+        return [dict(o, total_ms=round(o['total_ms'], 1), max_ms=round(o['max_ms'], 1)) for o in ranked]
+
+    def get_report(self, limit=10):
+        return {
+            'threshold_ms': self.threshold * 1000,
+            'stalls': self.stats['stalls'],
+            'worst_ms': round(self.stats['worst_ms'], 1),
+            'offenders': self.worst_offenders(limit),
+            'recent': list(self.recent)[-limit:],
+        }
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._loop_thread_id = threading.get_ident()
+            self._last_beat = time.monotonic()
+            self._task = asyncio.create_task(self._heartbeat())
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._task:
+            self._task.cancel()
+
+
+loop_watchdog = LoopWatchdog()
@@ -0,0 +1,322 @@
+import os
+import re
+import sqlite3
+import logging
+import threading
+from datetime import datetime
+
+logger = logging.getLogger("MediaIndex")
+
+STORAGE_ROOT = 'server_storage'
+INDEXED_FOLDERS = ('images', 'videos', 'annotated_videos')
+DATASET_ROOT = 'received_dataset'
+DATASET_FOLDER = 'dataset'     # received_dataset/<sub_folder>/<file>, indexed with device_id = sub_folder
+
+# An upsert rather than INSERT OR REPLACE: REPLACE deletes without firing the usage triggers.
+_UPSERT_MEDIA = (
+    "INSERT INTO media (device_id, folder, filename, date, time, size, prefix, ext) VALUES (?, ?, ?, ?, ?, ?, ?, ?) "
+    "ON CONFLICT (device_id, folder, filename) DO UPDATE SET date = excluded.date, time = excluded.time, size = excluded.size"
+)
+
+_TS_PATTERN = re.compile(r'(\d{8})_(\d{6})')
+MEDIA_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.mp4')
+
+
+def parse_media_timestamp(filename):
+    if not filename.lower().endswith(MEDIA_EXTENSIONS):
+        return None
+    match = _TS_PATTERN.search(filename)
+    if not match:
+        return None
+    try:
+        return datetime.strptime(f"{match.group(1)}_{match.group(2)}", "%Y%m%d_%H%M%S")
+    except ValueError:
+        return None
+
+
+def _name_parts(filename):
+    # (prefix, ext) as the history pages glob them: 'img_..._.jpg' -> ('img_', '.jpg'). Case is kept, like glob.
+    head, sep, _ = filename.partition('_')
+    return head + sep if sep else '', os.path.splitext(filename)[1]
+
+
+def _media_row(device_id, folder, filename, dt, size):
+    return (device_id, folder, filename, dt.strftime("%Y%m%d"), dt.strftime("%H%M%S"), size, *_name_parts(filename))
+
+
+class MediaIndex:
+    def __init__(self, db_path="data/media_index.db", storage_root=STORAGE_ROOT):
+        self.db_path = db_path
+        self.storage_root = storage_root
+        self._lock = threading.Lock()
+
+        db_dir = os.path.dirname(db_path)
+        if db_dir and not os.path.exists(db_dir):
+            os.makedirs(db_dir, exist_ok=True)
+
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._create_schema()
+
+    def _create_schema(self):
+        with self._lock, self._conn:
+            has_usage = self._conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'usage'"
+            ).fetchone() is not None
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS media (
+                    device_id TEXT NOT NULL,
+                    folder TEXT NOT NULL,
+                    filename TEXT NOT NULL,
+                    date TEXT NOT NULL,
+                    time TEXT NOT NULL,
+                    size INTEGER NOT NULL DEFAULT 0,
+                    prefix TEXT NOT NULL DEFAULT '',
+                    ext TEXT NOT NULL DEFAULT '',
+                    PRIMARY KEY (device_id, folder, filename)
+                )
+            """)
+            columns = {row[1] for row in self._conn.execute("PRAGMA table_info(media)")}
+            if 'prefix' not in columns:
+                # Indexes written before the prefix/ext columns existed.
+                self._conn.execute("ALTER TABLE media ADD COLUMN prefix TEXT NOT NULL DEFAULT ''")
+                self._conn.execute("ALTER TABLE media ADD COLUMN ext TEXT NOT NULL DEFAULT ''")
+                self._conn.executemany(
+                    "UPDATE media SET prefix = ?, ext = ? WHERE rowid = ?",
+                    [(*_name_parts(filename), rowid) for rowid, filename in self._conn.execute("SELECT rowid, filename FROM media")]
+                )
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_media_day ON media (device_id, folder, date, time)"
+            )
+            # Covers get_dates: the day list never touches the table rows.
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_media_kind ON media (device_id, folder, prefix, ext, date)"
+            )
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)"
+            )
+            # Per-day totals kept by triggers, so quota checks never sum (or stat) individual files.
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS usage (
+                    device_id TEXT NOT NULL,
+                    folder TEXT NOT NULL,
+                    date TEXT NOT NULL,
+                    files INTEGER NOT NULL DEFAULT 0,
+                    bytes INTEGER NOT NULL DEFAULT 0,
+                    PRIMARY KEY (device_id, folder, date)
+                )
+            """)
+            self._conn.executescript("""
+                CREATE TRIGGER IF NOT EXISTS media_usage_insert AFTER INSERT ON media BEGIN
+                    INSERT INTO usage (device_id, folder, date, files, bytes)
+                    VALUES (new.device_id, new.folder, new.date, 1, new.size)
+                    ON CONFLICT (device_id, folder, date) DO UPDATE
+                    SET files = files + 1, bytes = bytes + new.size;
+                END;
+                CREATE TRIGGER IF NOT EXISTS media_usage_delete AFTER DELETE ON media BEGIN
+                    UPDATE usage SET files = files - 1, bytes = bytes - old.size
+                    WHERE device_id = old.device_id AND folder = old.folder AND date = old.date;
+                    DELETE FROM usage
+                    WHERE device_id = old.device_id AND folder = old.folder AND date = old.date AND files <= 0;
+                END;
+                CREATE TRIGGER IF NOT EXISTS media_usage_update AFTER UPDATE ON media BEGIN
+                    UPDATE usage SET files = files - 1, bytes = bytes - old.size
+                    WHERE device_id = old.device_id AND folder = old.folder AND date = old.date;
+                    INSERT INTO usage (device_id, folder, date, files, bytes)
+                    VALUES (new.device_id, new.folder, new.date, 1, new.size)
+                    ON CONFLICT (device_id, folder, date) DO UPDATE
+                    SET files = files + 1, bytes = bytes + new.size;
+                END;
+            """)
+            if not has_usage:
+                self._conn.execute(
+                    "INSERT INTO usage (device_id, folder, date, files, bytes) "
+                    "SELECT device_id, folder, date, COUNT(*), SUM(size) FROM media GROUP BY device_id, folder, date"
+                )
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS archives (
+                    path TEXT PRIMARY KEY,
+                    device_id TEXT NOT NULL,
+                    folder TEXT NOT NULL,
+                    date TEXT NOT NULL,
+                    files INTEGER NOT NULL,
+                    bytes INTEGER NOT NULL
+                )
+            """)
+
+    def add(self, device_id, folder, filename, size=None, timestamp=None):
+        dt = timestamp or parse_media_timestamp(filename)
+        if dt is None:
+            return False
+
+        if size is None:
+            try:
+                size = os.path.getsize(os.path.join(self.storage_root, device_id, folder, filename))
+            except OSError:
+                size = 0
+
+        with self._lock, self._conn:
+            self._conn.execute(_UPSERT_MEDIA, _media_row(device_id, folder, filename, dt, size))
+        return True
+
+    def remove(self, device_id, folder, filename):
+        with self._lock, self._conn:
+            self._conn.execute(
+                "DELETE FROM media WHERE device_id = ? AND folder = ? AND filename = ?",
+                (device_id, folder, filename)
+            )
+
+    def remove_many(self, device_id, folder, filenames):
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "DELETE FROM media WHERE device_id = ? AND folder = ? AND filename = ?",
+                [(device_id, folder, f) for f in filenames]
+            )
+
+    def get_usage(self, folders=None):
+        # [(device_id, folder, date, files, bytes)], oldest day first.
+        query = "SELECT device_id, folder, date, files, bytes FROM usage"
+        params = ()
+        if folders:
+            query += f" WHERE folder IN ({','.join('?' * len(folders))})"
+            params = tuple(folders)
+        with self._lock:
+            return self._conn.execute(query + " ORDER BY date, device_id, folder", params).fetchall()
+
+    def add_archive(self, path, device_id, folder, date_compact, files, size):
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO archives (path, device_id, folder, date, files, bytes) VALUES (?, ?, ?, ?, ?, ?)",
+                (path, device_id, folder, date_compact, files, size)
+            )
+
+    def remove_archive(self, path):
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM archives WHERE path = ?", (path,))
+
+    def get_archives(self, folders=None):
+        # [(path, device_id, folder, date, files, bytes)], oldest day first.
+        query = "SELECT path, device_id, folder, date, files, bytes FROM archives"
+        params = ()
+        if folders:
+            query += f" WHERE folder IN ({','.join('?' * len(folders))})"
+            params = tuple(folders)
+        with self._lock:
+            return self._conn.execute(query + " ORDER BY date, device_id, folder", params).fetchall()
+
+    @staticmethod
+    def _kind_filter(prefix, ext):
+        # prefix='img_', ext='.jpg' is the old img_*.jpg glob; None matches any.
+        clause, params = "", ()
+        if prefix is not None:
+            clause, params = clause + " AND prefix = ?", params + (prefix,)
+        if ext is not None:
+            clause, params = clause + " AND ext = ?", params + (ext,)
+        return clause, params
+
+    def get_dates(self, device_id, folder='images', prefix=None, ext=None):
+        clause, params = self._kind_filter(prefix, ext)
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT DISTINCT date FROM media WHERE device_id = ? AND folder = ?{clause} ORDER BY date",
+                (device_id, folder) + params
+            ).fetchall()
+        return [f"{d[:4]}/{d[4:6]}/{d[6:]}" for (d,) in rows]
+
+    def get_files(self, device_id, folder, date_compact, prefix=None, ext=None):
+        clause, params = self._kind_filter(prefix, ext)
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT filename, time FROM media WHERE device_id = ? AND folder = ? AND date = ?{clause} ORDER BY filename",
+                (device_id, folder, date_compact) + params
+            ).fetchall()
+        return [
+            (fname, datetime.strptime(f"{date_compact}_{time_str}", "%Y%m%d_%H%M%S"))
+            for fname, time_str in rows
+        ]
+
+    def is_backfilled(self):
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM meta WHERE key = 'backfilled'").fetchone()
+        return row is not None
+
+    def backfill(self, force=False):
+        if not force and self.is_backfilled():
+            return 0
+        if not os.path.exists(self.storage_root):
+            return 0
+
+        total = 0
+        for device_id in os.listdir(self.storage_root):
+            device_dir = os.path.join(self.storage_root, device_id)
+            if not os.path.isdir(device_dir):
+                continue
+
+            for folder in INDEXED_FOLDERS:
+                folder_dir = os.path.join(device_dir, folder)
+                if not os.path.isdir(folder_dir):
+                    continue
+
+                rows = []
+                with os.scandir(folder_dir) as it:
+                    for entry in it:
+                        if not entry.is_file():
+                            continue
+                        dt = parse_media_timestamp(entry.name)
+                        if dt is None:
+                            continue
+                        rows.append(_media_row(device_id, folder, entry.name, dt, entry.stat().st_size))
+
+                with self._lock, self._conn:
+                    self._conn.executemany(
+                        _UPSERT_MEDIA,
+                        rows
+                    )
+                total += len(rows)
+
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO meta (key, value) VALUES ('backfilled', ?)",
+                (datetime.now().isoformat(),)
+            )
+
+        logger.info(f"Media index backfill complete: {total} files.")
+        return total
+
+    def backfill_datasets(self, root=DATASET_ROOT, force=False):
+        # Dataset files carry no timestamp in their names; they are dated by mtime (= when received).
+        with self._lock:
+            done = self._conn.execute("SELECT value FROM meta WHERE key = 'backfilled_dataset'").fetchone()
+        if (done and not force) or not os.path.isdir(root):
+            return 0
+
+        rows = []
+        for dirpath, dirnames, filenames in os.walk(root):
+            # Skip in-flight uploads (.uploading/) and other hidden directories.
+            dirnames[:] = [d for d in dirnames if not d.startswith('.')]
+            sub_folder = os.path.relpath(dirpath, root)
+            if sub_folder == '.':
+                continue
+            for name in filenames:
+                if name.endswith('.part'):
+                    continue
+                try:
+                    st = os.stat(os.path.join(dirpath, name))
+                except OSError:
+                    continue
+                dt = datetime.fromtimestamp(st.st_mtime)
+                rows.append(_media_row(sub_folder, DATASET_FOLDER, name, dt, st.st_size))
+
+        with self._lock, self._conn:
+            self._conn.executemany(_UPSERT_MEDIA, rows)
+            self._conn.execute(
+                "INSERT OR REPLACE INTO meta (key, value) VALUES ('backfilled_dataset', ?)",
+                (datetime.now().isoformat(),)
+            )
+
+        logger.info(f"Dataset index backfill complete: {len(rows)} files.")
+        return len(rows)
+
+
+media_index = MediaIndex()
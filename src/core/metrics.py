@@ -0,0 +1,265 @@
+import math
+import time
+import asyncio
+import threading
+from contextlib import contextmanager
+
+# Minimal in-process metrics with Prometheus text exposition (format 0.0.4); no client library needed.
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+LOOP_LAG_INTERVAL = 0.5
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_value(value):
+    if value == math.inf:
+        return '+Inf'
+    if value == -math.inf:
+        return '-Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+def _label_str(names, values, extra=()):
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    pairs.extend(f'{n}="{_escape(v)}"' for n, v in extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def render(self):
+        lines = []
+        for metric in self.metrics:
+            lines.append(f'# HELP {metric.exposed_name} {metric.documentation}')
+            lines.append(f'# TYPE {metric.exposed_name} {metric.kind}')
+            lines.extend(metric.samples())
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = MetricsRegistry()
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=(), registry=REGISTRY):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children = {}     # Map: { label values tuple: child }
+        self._lock = threading.Lock()
+        registry.register(self)
+
+    @property
+    def exposed_name(self):
+        return self.name
+
+    def labels(self, *values):
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f"{self.name} expects labels {self.labelnames}")
+            with self._lock:
+                child = self._children.setdefault(tuple(str(v) for v in values), self._new_child())
+        return child
+
+    def remove(self, *values):
+        with self._lock:
+            self._children.pop(tuple(str(v) for v in values), None)
+
+    def _new_child(self):
+        raise NotImplementedError
+
+
+class _Value:
+    def __init__(self):
+        self.value = 0.0
+
+    def inc(self, amount=1):
+        self.value += amount
+
+    def dec(self, amount=1):
+        self.value -= amount
+
+    def set(self, value):
+        self.value = value
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    @property
+    def exposed_name(self):
+        # HELP, TYPE and samples must share one name, or scrapers treat the counter as untyped.
+        return f'{self.name}_total'
+
+    def _new_child(self):
+        return _Value()
+
+    def inc(self, amount=1):
+        self.labels().inc(amount)
+
+    def samples(self):
+        for values, child in list(self._children.items()):
+            yield f'{self.exposed_name}{_label_str(self.labelnames, values)} {_format_value(child.value)}'
+
+
+class Gauge(_Metric):
+    kind = 'gauge'
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._function = None
+
+    def _new_child(self):
+        return _Value()
+
+    def set(self, value):
+        self.labels().set(value)
+
+    def inc(self, amount=1):
+        self.labels().inc(amount)
+
+    def dec(self, amount=1):
+        self.labels().dec(amount)
+
+    def set_function(self, function):
+        # Read at scrape time: returns a number, or { label values tuple: number } for labelled gauges.
+        self._function = function
+
+    def samples(self):
+        if self._function is not None:
+            result = self._function()
+            items = result.items() if isinstance(result, dict) else [((), result)]
+            for values, value in items:
+                values = values if isinstance(values, tuple) else (values,)
+                yield f'{self.name}{_label_str(self.labelnames, values)} {_format_value(value)}'
+            return
+        for values, child in list(self._children.items()):
+            yield f'{self.name}{_label_str(self.labelnames, values)} {_format_value(child.value)}'
+
+
+class _HistogramValue:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        self.sum += value
+        self.count += 1
+
+    @contextmanager
+    def time(self):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start)
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS, registry=REGISTRY):
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        super().__init__(name, documentation, labelnames, registry)
+
+    def _new_child(self):
+        return _HistogramValue(self.buckets)
+
+    def observe(self, value):
+        self.labels().observe(value)
+
+    def time(self):
+        return self.labels().time()
+
+    def samples(self):
+        for values, child in list(self._children.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets, child.counts):
+                cumulative += count
+                labels = _label_str(self.labelnames, values, [('le', _format_value(float(bound)))])
+                yield f'{self.name}_bucket{labels} {cumulative}'
+            labels = _label_str(self.labelnames, values)
+            yield f'{self.name}_sum{labels} {_format_value(child.sum)}'
+            yield f'{self.name}_count{labels} {child.count}'
+
+
+# --- Server metrics ---
+
+DEVICES_CONNECTED = Gauge('qai_devices_connected', 'Devices with a registered socket session.')
+VIEWERS = Gauge('qai_viewers', 'Live-view subscribers per device room.', ['device_id'])
+
+FRAMES_RECEIVED = Counter('qai_frames_received', 'Frames received from devices.', ['device_id'])
+FRAMES_SENT = Counter('qai_frames_sent', 'Frames emitted to live viewers.', ['device_id'])
+FRAMES_DROPPED = Counter('qai_frames_dropped', 'Frames overwritten in a viewer mailbox before delivery.', ['device_id'])
+
+UPLOAD_BYTES = Counter('qai_upload_bytes', 'Bytes written by completed uploads.', ['kind'])
+UPLOAD_FAILURES = Counter('qai_upload_failures', 'Uploads that failed before completion.', ['kind'])
+UPLOAD_DURATION = Histogram(
+    'qai_upload_duration_seconds', 'Wall time of completed uploads.', ['kind'],
+    buckets=(0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+)
+
+COMMAND_LATENCY = Histogram('qai_command_latency_seconds', 'Time to deliver (and ack) a device command.', ['command'])
+COMMAND_FAILURES = Counter('qai_command_failures', 'Device commands that were not delivered.', ['command', 'reason'])
+CONFIG_UPDATES_COALESCED = Counter('qai_config_updates_coalesced', 'Config updates merged into a pending batch instead of sent on their own.')
+
+HISTORY_QUERY = Histogram('qai_history_query_seconds', 'Media lookups behind the history pages.', ['page', 'query'])
+
+LOOP_LAG = Histogram(
+    'qai_event_loop_lag_seconds', 'Event loop scheduling delay, sampled periodically.',
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+)
+LOOP_LAG_MAX = Gauge('qai_event_loop_lag_max_seconds', 'Worst event loop delay since the previous scrape.')
+LOOP_STALLS = Counter('qai_event_loop_stalls', 'Loop stalls over the watchdog threshold.')
+
+
+class LoopLagSampler:
+    def __init__(self, interval=LOOP_LAG_INTERVAL):
+        self.interval = interval
+        self.max_since_scrape = 0.0
+        self._task = None
+        LOOP_LAG_MAX.set_function(self._read_and_reset)
+
+    def _read_and_reset(self):
+        value, self.max_since_scrape = self.max_since_scrape, 0.0
+        return value
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            expected = loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, loop.time() - expected)
+            LOOP_LAG.observe(lag)
+            if lag > self.max_since_scrape:
+                self.max_since_scrape = lag
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+
+loop_lag_sampler = LoopLagSampler()
+
+
+def render_metrics():
+    return REGISTRY.render()
@@ -0,0 +1,242 @@
+import os
+import re
+import json
+import time
+import uuid
+import asyncio
+import hashlib
+import logging
+import contextlib
+
+import aiofiles
+import aiofiles.os
+
+from src.core.upload_manager import UPLOADING_DIR
+
+logger = logging.getLogger("ResumableUpload")
+
+PARTIAL_ROOT = "upload_tmp"             # Upload state files; the data is staged next to its destination
+CHUNK_SIZE = 1024 * 1024
+_UPLOAD_ID = re.compile(r'[0-9a-f]{32}')
+
+
+class UploadOffsetMismatch(Exception):
+    def __init__(self, expected):
+        super().__init__(f"Offset mismatch, expected {expected}")
+        self.expected = expected
+
+
+class UploadChecksumMismatch(ValueError):
+    def __init__(self, state):
+        super().__init__("Checksum mismatch")
+        self.state = state
+
+
+class ResumableUploadManager:
+    def __init__(self, partial_root=PARTIAL_ROOT, ttl=6 * 3600, gc_interval=600):
+        self.partial_root = partial_root
+        self.ttl = ttl
+        self.gc_interval = gc_interval
+
+        # The state files are the source of truth: with several workers, the start, appends and finalize
+        # of one upload can each land on a different process. This is a cache, re-read where it matters.
+        self.sessions = {}      # Map: { upload_id: state dict }
+        self._locks = {}        # Map: { upload_id: asyncio.Lock }
+        self._start_locks = {}  # Map: { dest_path: [asyncio.Lock, users] }
+        self._gc_task = None
+
+        os.makedirs(self.partial_root, exist_ok=True)
+        self.sessions = self._scan_states()
+        if self.sessions:
+            logger.info(f"Restored {len(self.sessions)} partial uploads.")
+
+    def _state_path(self, upload_id):
+        return os.path.join(self.partial_root, f"{upload_id}.json")
+
+    def _data_path(self, state):
+        # Staged in <destination dir>/.uploading so finalize is a rename on the same volume. States written
+        # before that kept the data under partial_root.
+        return state.get('data_path') or os.path.join(self.partial_root, f"{state['upload_id']}.part")
+
+    def _scan_states(self):
+        sessions = {}
+        for name in os.listdir(self.partial_root):
+            if not name.endswith('.json'):
+                continue
+            try:
+                with open(os.path.join(self.partial_root, name), 'r', encoding='utf-8') as f:
+                    state = json.load(f)
+                sessions[state['upload_id']] = state
+            except FileNotFoundError:
+                pass
+            except Exception as e:
+                logger.warning(f"Skipping unreadable upload state {name}: {e}")
+        return sessions
+
+    async def _load(self, upload_id):
+        if not isinstance(upload_id, str) or not _UPLOAD_ID.fullmatch(upload_id):
+            return None
+        try:
+            async with aiofiles.open(self._state_path(upload_id), 'r', encoding='utf-8') as f:
+                state = json.loads(await f.read())
+        except FileNotFoundError:
+            # Finalized or discarded, possibly by another worker.
+            self.sessions.pop(upload_id, None)
+            return None
+        self.sessions[upload_id] = state
+        return state
+
+    async def _save_state(self, state):
+        state['updated_at'] = time.time()
+        tmp_path = self._state_path(state['upload_id']) + '.tmp'
+        async with aiofiles.open(tmp_path, 'w', encoding='utf-8') as f:
+            await f.write(json.dumps(state))
+        await aiofiles.os.replace(tmp_path, self._state_path(state['upload_id']))
+
+    def _lock(self, upload_id):
+        lock = self._locks.get(upload_id)
+        if lock is None:
+            lock = self._locks[upload_id] = asyncio.Lock()
+        return lock
+
+    async def get(self, upload_id):
+        return await self._load(upload_id)
+
+    @property
+    def writing(self):
+        # Upload ids with an append or finalize in progress.
+        return [upload_id for upload_id, lock in self._locks.items() if lock.locked()]
+
+    @contextlib.asynccontextmanager
+    async def _start_lock(self, dest_path):
+        entry = self._start_locks.setdefault(dest_path, [asyncio.Lock(), 0])
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                yield
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0:
+                del self._start_locks[dest_path]
+
+    async def start(self, dest_path, meta, total_size=None):
+        # One session per destination: a device retrying /upload/start resumes instead of starting over.
+        async with self._start_lock(dest_path):
+            self.sessions = await asyncio.to_thread(self._scan_states)
+            for state in self.sessions.values():
+                if state['dest_path'] == dest_path:
+                    return state
+
+            upload_id = uuid.uuid4().hex
+            state = {
+                'upload_id': upload_id,
+                'dest_path': dest_path,
+                'data_path': os.path.join(os.path.dirname(dest_path), UPLOADING_DIR, f"{upload_id}.part"),
+                'meta': meta,
+                'total_size': total_size,
+                'offset': 0,
+                'chunks': 0,
+                'created_at': time.time(),
+            }
+            await aiofiles.os.makedirs(os.path.dirname(state['data_path']), exist_ok=True)
+            async with aiofiles.open(state['data_path'], 'wb'):
+                pass
+            await self._save_state(state)
+            self.sessions[upload_id] = state
+            return state
+
+    async def append(self, upload_id, offset, upload_file):
+        async with self._lock(upload_id):
+            state = await self._load(upload_id)
+            if state is None:
+                self._locks.pop(upload_id, None)
+                raise KeyError(upload_id)
+            if offset != state['offset']:
+                raise UploadOffsetMismatch(state['offset'])
+
+            written = 0
+            # r+b + truncate discards any tail left by a write that crashed before its state was saved.
+            async with aiofiles.open(self._data_path(state), 'r+b') as out:
+                await out.seek(offset)
+                while True:
+                    chunk = await upload_file.read(CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    await out.write(chunk)
+                    written += len(chunk)
+                await out.truncate()
+
+            state['offset'] = offset + written
+            state['chunks'] = state.get('chunks', 0) + 1
+            await self._save_state(state)
+            return state
+
+    def _sha256(self, path):
+        h = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(CHUNK_SIZE), b''):
+                h.update(block)
+        return h.hexdigest()
+
+    async def finalize(self, upload_id, sha256):
+        async with self._lock(upload_id):
+            state = await self._load(upload_id)
+            if state is None:
+                self._locks.pop(upload_id, None)
+                raise KeyError(upload_id)
+
+            if state['total_size'] is not None and state['offset'] != state['total_size']:
+                raise UploadOffsetMismatch(state['offset'])
+
+            data_path = self._data_path(state)
+            digest = await asyncio.to_thread(self._sha256, data_path)
+            if digest.lower() != sha256.lower():
+                await self.discard(upload_id)
+                raise UploadChecksumMismatch(state)
+
+            await aiofiles.os.makedirs(os.path.dirname(state['dest_path']), exist_ok=True)
+            await aiofiles.os.replace(data_path, state['dest_path'])
+            await self.discard(upload_id)
+            return state
+
+    async def _remove_files(self, state):
+        for path in (self._data_path(state), self._state_path(state['upload_id'])):
+            try:
+                await aiofiles.os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    async def discard(self, upload_id):
+        state = self.sessions.pop(upload_id, None)
+        self._locks.pop(upload_id, None)
+        if state is not None:
+            await self._remove_files(state)
+
+    async def collect_garbage(self):
+        # Fresh from disk: appends may be going to another worker, which only shows in the state files.
+        self.sessions = await asyncio.to_thread(self._scan_states)
+        now = time.time()
+        expired = [
+            upload_id for upload_id, state in self.sessions.items()
+            if now - state.get('updated_at', state['created_at']) > self.ttl
+            and not self._lock(upload_id).locked()
+        ]
+        for upload_id in expired:
+            logger.info(f"Discarding abandoned upload {upload_id} ({self.sessions[upload_id]['dest_path']})")
+            await self.discard(upload_id)
+        return len(expired)
+
+    async def _gc_loop(self):
+        while True:
+            try:
+                await self.collect_garbage()
+            except Exception as e:
+                logger.error(f"Partial upload GC failed: {e}")
+            await asyncio.sleep(self.gc_interval)
+
+    def start_gc(self):
+        if self._gc_task is None or self._gc_task.done():
+            self._gc_task = asyncio.create_task(self._gc_loop())
+
+
+resumable_upload_manager = ResumableUploadManager()
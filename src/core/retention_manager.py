@@ -0,0 +1,352 @@
+import os
+import json
+import time
+import fcntl
+import asyncio
+import logging
+import tarfile
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+
+from src.core.media_index import media_index, STORAGE_ROOT, INDEXED_FOLDERS, DATASET_ROOT, DATASET_FOLDER
+from src.core.thumbnail_manager import thumbnail_manager
+from src.core.upload_manager import upload_manager
+from src.core.resumable_upload_manager import resumable_upload_manager
+
+logger = logging.getLogger("RetentionManager")
+
+RETENTION_CONFIG = 'configs/retention.json'
+LOCK_PATH = 'data/retention.lock'
+ARCHIVE_FOLDER = 'archive'              # server_storage/<device>/archive/<folder>/<YYYYMMDD>.tar.gz,
+                                        # received_dataset_archive/<sub_folder>/<YYYYMMDD>.tar.gz
+DATASET_GROUP = '*dataset*'             # received_dataset shares one quota across its sub folders
+
+STARTUP_DELAY = 60.0
+BATCH_FILES = 200                       # Files per delete/archive step; the loop and uploads run in between
+BATCH_PAUSE = 0.05
+MAX_UPLOAD_WAIT = 10.0                  # Cameras upload all day: wait for a gap this long at most, then go on
+UPLOAD_POLL = 0.5
+
+
+def _parse_date(date_compact):
+    return datetime.strptime(date_compact, "%Y%m%d").date()
+
+
+class RetentionManager:
+    # Applies age / size / archive policies to server_storage and received_dataset from the per-day totals
+    # in the media index, so a pass costs a query over days, not a walk over files.
+    def __init__(self, config_path=RETENTION_CONFIG, storage_root=STORAGE_ROOT, dataset_root=DATASET_ROOT,
+                 lock_path=LOCK_PATH):
+        self.config_path = config_path
+        self.storage_root = storage_root
+        self.dataset_root = dataset_root
+        self.lock_path = lock_path
+        # One thread: deletes and archive writes are paced, never parallel.
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="retention")
+
+        self.config = {}
+        self._config_mtime = None
+        self._task = None
+        self._wake = None
+        self.running = False
+        self.last_pass = None
+        self.stats = {'passes': 0, 'skipped_locked': 0, 'days_deleted': 0, 'days_archived': 0,
+                      'archives_dropped': 0, 'files_deleted': 0, 'bytes_freed': 0, 'upload_waits': 0, 'errors': 0}
+
+        self.load_config()
+
+    # --- Policy ---
+
+    def load_config(self):
+        try:
+            mtime = os.path.getmtime(self.config_path)
+        except OSError:
+            self.config, self._config_mtime = {}, None
+            return self.config
+        if mtime == self._config_mtime:
+            return self.config
+        try:
+            with open(self.config_path, 'r', encoding='utf-8') as f:
+                config = json.load(f)
+        except Exception as e:
+            logger.error(f"Failed to load retention config: {e}")
+            return self.config
+        self.config, self._config_mtime = config, mtime
+        logger.info(f"Loaded retention config (enabled={config.get('enabled', False)}).")
+        return config
+
+    @property
+    def enabled(self):
+        return bool(self.config.get('enabled', False))
+
+    def policy(self, device_id, folder):
+        # Map: { max_age_days, archive_after_days, evict_last }; device entries override the defaults per key.
+        if folder == DATASET_FOLDER:
+            return self.config.get('dataset', {})
+        policy = dict(self.config.get('default', {}).get(folder, {}))
+        policy.update(self.config.get('devices', {}).get(device_id, {}).get(folder, {}))
+        return policy
+
+    def quota(self, group):
+        if group == DATASET_GROUP:
+            return self.config.get('dataset', {}).get('max_bytes')
+        device = self.config.get('devices', {}).get(group, {})
+        return device.get('max_bytes', self.config.get('default', {}).get('max_bytes'))
+
+    def plan(self, today=None):
+        # Returns [(action, device_id, folder, date, bytes, archive path or None)], deletes before archives.
+        today = today or datetime.now().date()
+        groups = {}   # Map: { device_id or DATASET_GROUP: [item dicts] }
+        for device_id, folder, date, files, size in media_index.get_usage(INDEXED_FOLDERS + (DATASET_FOLDER,)):
+            group = DATASET_GROUP if folder == DATASET_FOLDER else device_id
+            groups.setdefault(group, []).append(
+                {'device_id': device_id, 'folder': folder, 'date': date, 'bytes': size, 'path': None})
+        for path, device_id, folder, date, files, size in media_index.get_archives():
+            group = DATASET_GROUP if folder == DATASET_FOLDER else device_id
+            groups.setdefault(group, []).append(
+                {'device_id': device_id, 'folder': folder, 'date': date, 'bytes': size, 'path': path})
+
+        actions = []
+        for group, items in groups.items():
+            kept = []
+            for item in items:
+                policy = self.policy(item['device_id'], item['folder'])
+                age = (today - _parse_date(item['date'])).days
+                max_age, archive_after = policy.get('max_age_days'), policy.get('archive_after_days')
+                if max_age is not None and age > max_age:
+                    actions.append(('drop_archive' if item['path'] else 'delete', item))
+                    continue
+                if not item['path'] and archive_after is not None and age > archive_after:
+                    item['archive'] = True
+                kept.append(item)
+
+            max_bytes = self.quota(group)
+            total = sum(item['bytes'] for item in kept)
+            if max_bytes is not None and total > max_bytes:
+                # Oldest first, types marked evict_last (annotated videos) only once the rest is gone.
+                # Today is left alone so the quota never fights uploads that are landing right now.
+                candidates = sorted(
+                    (item for item in kept if item['date'] != today.strftime("%Y%m%d")),
+                    key=lambda item: (bool(self.policy(item['device_id'], item['folder']).get('evict_last')), item['date'])
+                )
+                for item in candidates:
+                    if total <= max_bytes:
+                        break
+                    total -= item['bytes']
+                    item['archive'] = False
+                    actions.append(('drop_archive' if item['path'] else 'delete', item))
+                if total > max_bytes:
+                    logger.warning(f"{group} is still {total - max_bytes} bytes over quota after eviction")
+
+            actions.extend(('archive', item) for item in kept if item.get('archive'))
+
+        order = {'drop_archive': 0, 'delete': 1, 'archive': 2}
+        actions.sort(key=lambda a: (order[a[0]], a[1]['date']))
+        return [(kind, item['device_id'], item['folder'], item['date'], item['bytes'], item['path'])
+                for kind, item in actions]
+
+    # --- Paths ---
+
+    def _file_path(self, device_id, folder, filename):
+        if folder == DATASET_FOLDER:
+            return os.path.join(self.dataset_root, device_id, filename)
+        return os.path.join(self.storage_root, device_id, folder, filename)
+
+    def _archive_path(self, device_id, folder, date):
+        if folder == DATASET_FOLDER:
+            directory = os.path.join(f"{self.dataset_root}_archive", device_id)
+        else:
+            directory = os.path.join(self.storage_root, device_id, ARCHIVE_FOLDER, folder)
+        os.makedirs(directory, exist_ok=True)
+        path, n = os.path.join(directory, f"{date}.tar.gz"), 1
+        while os.path.exists(path):
+            # A later pass archiving files that arrived late for an already archived day.
+            path, n = os.path.join(directory, f"{date}-{n}.tar.gz"), n + 1
+        return path
+
+    # --- Execution ---
+
+    async def _yield_to_uploads(self):
+        # Only sees uploads handled by this process. With several device workers, uploads on the others
+        # are not waited for; the batch size, pause and archive rate cap are what bound the disk load then.
+        deadline = time.monotonic() + MAX_UPLOAD_WAIT
+        waited = False
+        while (upload_manager.active or resumable_upload_manager.writing) and time.monotonic() < deadline:
+            waited = True
+            await asyncio.sleep(UPLOAD_POLL)
+        if waited:
+            self.stats['upload_waits'] += 1
+
+    def _unlink_batch(self, device_id, folder, filenames):
+        for filename in filenames:
+            paths = [self._file_path(device_id, folder, filename)]
+            if folder == 'images':
+                paths.append(thumbnail_manager.thumb_path(device_id, filename))
+            for path in paths:
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+
+    def _tar_batch(self, tar, device_id, folder, filenames):
+        size = 0
+        for filename in filenames:
+            path = self._file_path(device_id, folder, filename)
+            try:
+                tar.add(path, arcname=filename)
+                size += os.path.getsize(path)
+            except FileNotFoundError:
+                pass
+        return size
+
+    def _discard_archive(self, tar, tmp_path):
+        try:
+            tar.close()
+        except Exception as e:
+            logger.warning(f"Closing partial archive {tmp_path} failed: {e}")
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+
+    async def _delete_files(self, device_id, folder, filenames):
+        loop = asyncio.get_running_loop()
+        for i in range(0, len(filenames), BATCH_FILES):
+            batch = filenames[i:i + BATCH_FILES]
+            await self._yield_to_uploads()
+            await loop.run_in_executor(self.executor, self._unlink_batch, device_id, folder, batch)
+            media_index.remove_many(device_id, folder, batch)
+            self.stats['files_deleted'] += len(batch)
+            await asyncio.sleep(BATCH_PAUSE)
+
+    def _day_files(self, device_id, folder, date):
+        return [filename for filename, _ in media_index.get_files(device_id, folder, date)]
+
+    async def _archive_day(self, device_id, folder, date):
+        loop = asyncio.get_running_loop()
+        filenames = self._day_files(device_id, folder, date)
+        path = self._archive_path(device_id, folder, date)
+        tmp_path = f"{path}.part"
+        rate = self.config.get('archive_mb_per_second', 16) * 1024 * 1024
+
+        # JPEG/MP4 barely compress: level 1 keeps the CPU cost low, the win is one file per day.
+        tar = await loop.run_in_executor(self.executor, lambda: tarfile.open(tmp_path, 'w:gz', compresslevel=1))
+        try:
+            for i in range(0, len(filenames), BATCH_FILES):
+                await self._yield_to_uploads()
+                started = time.monotonic()
+                size = await loop.run_in_executor(
+                    self.executor, self._tar_batch, tar, device_id, folder, filenames[i:i + BATCH_FILES])
+                # Read-rate cap: sleep off whatever the batch finished ahead of it.
+                await asyncio.sleep(max(BATCH_PAUSE, size / rate - (time.monotonic() - started)))
+            await loop.run_in_executor(self.executor, tar.close)
+        except BaseException:
+            # On cancellation a _tar_batch can still be running in the executor; queueing the cleanup
+            # behind it (one thread) keeps the tarfile from being closed and removed under it.
+            await loop.run_in_executor(self.executor, self._discard_archive, tar, tmp_path)
+            raise
+
+        os.replace(tmp_path, path)
+        media_index.add_archive(path, device_id, folder, date, len(filenames), os.path.getsize(path))
+        await self._delete_files(device_id, folder, filenames)
+
+    async def _apply(self, kind, device_id, folder, date, size, path):
+        if kind == 'drop_archive':
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            media_index.remove_archive(path)
+            self.stats['archives_dropped'] += 1
+        elif kind == 'delete':
+            await self._delete_files(device_id, folder, self._day_files(device_id, folder, date))
+            self.stats['days_deleted'] += 1
+        elif kind == 'archive':
+            await self._archive_day(device_id, folder, date)
+            self.stats['days_archived'] += 1
+            return 0
+        self.stats['bytes_freed'] += size
+        return size
+
+    async def run_once(self):
+        self.load_config()
+        if not self.enabled or self.running:
+            return None
+
+        os.makedirs(os.path.dirname(self.lock_path) or '.', exist_ok=True)
+        with open(self.lock_path, 'w') as lock_file:
+            try:
+                # Several workers share the same disk; one pass at a time across all of them.
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                self.stats['skipped_locked'] += 1
+                return None
+
+            self.running = True
+            started = time.time()
+            summary = {'started': started, 'actions': 0, 'bytes_freed': 0, 'errors': 0}
+            try:
+                actions = self.plan()
+                for action in actions:
+                    try:
+                        summary['bytes_freed'] += await self._apply(*action)
+                        summary['actions'] += 1
+                    except Exception as e:
+                        summary['errors'] += 1
+                        self.stats['errors'] += 1
+                        logger.error(f"Retention {action[0]} {action[1]}/{action[2]}/{action[3]} failed: {e}")
+            finally:
+                self.running = False
+                summary['duration_s'] = round(time.time() - started, 3)
+                self.last_pass = summary
+                self.stats['passes'] += 1
+
+        if summary['actions']:
+            logger.info(f"Retention pass: {summary['actions']} actions, {summary['bytes_freed']} bytes freed "
+                        f"in {summary['duration_s']}s")
+        return summary
+
+    async def _loop(self):
+        await asyncio.sleep(STARTUP_DELAY)
+        while True:
+            try:
+                await self.run_once()
+            except Exception as e:
+                logger.error(f"Retention pass failed: {e}")
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=self.config.get('interval_seconds', 3600))
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._wake = asyncio.Event()
+            self._task = asyncio.create_task(self._loop())
+
+    def trigger(self):
+        if self._wake is not None:
+            self._wake.set()
+
+    def get_usage(self):
+        # Map: { device_id: { folder: bytes, 'archive': bytes } }, dataset sub folders under DATASET_GROUP.
+        usage = {}
+        for device_id, folder, date, files, size in media_index.get_usage():
+            group = usage.setdefault(DATASET_GROUP if folder == DATASET_FOLDER else device_id, {})
+            group[folder] = group.get(folder, 0) + size
+        for path, device_id, folder, date, files, size in media_index.get_archives():
+            group = usage.setdefault(DATASET_GROUP if folder == DATASET_FOLDER else device_id, {})
+            group[ARCHIVE_FOLDER] = group.get(ARCHIVE_FOLDER, 0) + size
+        return usage
+
+    def get_stats(self):
+        return {
+            'enabled': self.enabled,
+            'running': self.running,
+            'last_pass': self.last_pass,
+            'usage': self.get_usage(),
+            **self.stats,
+        }
+
+
+retention_manager = RetentionManager()
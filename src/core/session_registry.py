@@ -0,0 +1,62 @@
+import logging
+
+logger = logging.getLogger("SessionRegistry")
+
+
+class SessionRegistry:
+    def __init__(self):
+        self.sid_to_device = {}    # Map: { sid: (device_id, generation) }
+        self.device_to_sid = {}    # Map: { device_id: current sid }
+        self.generations = {}      # Map: { device_id: last issued generation }
+
+    def register(self, sid, device_id):
+        # Re-registering on the same sid under another id drops the old binding first.
+        old = self.sid_to_device.get(sid)
+        if old and old[0] != device_id:
+            self.unregister(sid)
+
+        generation = self.generations.get(device_id, 0) + 1
+        self.generations[device_id] = generation
+
+        previous_sid = self.device_to_sid.get(device_id)
+        self.device_to_sid[device_id] = sid
+        self.sid_to_device[sid] = (device_id, generation)
+
+        if previous_sid == sid:
+            previous_sid = None
+        return generation, previous_sid
+
+    def unregister(self, sid):
+        entry = self.sid_to_device.pop(sid, None)
+        if entry is None:
+            return None, False
+
+        device_id, _ = entry
+        is_current = self.device_to_sid.get(device_id) == sid
+        if is_current:
+            del self.device_to_sid[device_id]
+        return device_id, is_current
+
+    def get_sid(self, device_id):
+        return self.device_to_sid.get(device_id)
+
+    def get_device(self, sid):
+        entry = self.sid_to_device.get(sid)
+        return entry[0] if entry else None
+
+    def get_generation(self, sid):
+        entry = self.sid_to_device.get(sid)
+        return entry[1] if entry else None
+
+    def is_current(self, sid):
+        entry = self.sid_to_device.get(sid)
+        return entry is not None and self.device_to_sid.get(entry[0]) == sid
+
+    def is_connected(self, device_id):
+        return device_id in self.device_to_sid
+
+    def connected_devices(self):
+        return list(self.device_to_sid)
+
+    def __len__(self):
+        return len(self.device_to_sid)
@@ -0,0 +1,332 @@
+import os
+import asyncio
+import logging
+import itertools
+
+import orjson
+import socketio
+from socketio.async_pubsub_manager import AsyncPubSubManager
+
+from src.core.state_broker import MAX_SUBSCRIBER_BUFFER, encode_message, read_message
+
+logger = logging.getLogger("StateBackend")
+
+# memory:// (single process, default), unix:///path/to/broker.sock, or redis://host:6379/0
+STATE_BACKEND_URL = os.environ.get('QAI_STATE_BACKEND', 'memory://')
+RECONNECT_DELAY = 1.0
+CONNECT_ATTEMPTS = 20
+REQUEST_TIMEOUT = 2.0
+
+
+class MemoryBackend:
+    # Single process: there is nobody to publish to, and hashes are plain dicts.
+    shared = False
+
+    def __init__(self):
+        self.hashes = {}          # Map: { key: { field: value } }
+
+    async def start(self):
+        pass
+
+    async def close(self):
+        pass
+
+    def publish(self, channel, body):
+        pass
+
+    def subscribe(self, channel, callback):
+        pass
+
+    def unsubscribe(self, channel, callback=None):
+        pass
+
+    def hset(self, key, field, value, ephemeral=False):
+        self.hashes.setdefault(key, {})[field] = value
+
+    def hdel(self, key, field):
+        self.hashes.get(key, {}).pop(field, None)
+
+    async def hgetall(self, key):
+        return dict(self.hashes.get(key, {}))
+
+    def client_manager(self, channel):
+        return None
+
+
+class BrokerBackend:
+    # Client of StateBroker over a Unix socket. Writes are fire-and-forget and ordered;
+    # subscriptions and ephemeral fields are replayed after a reconnect.
+    shared = True
+
+    def __init__(self, path, reconnect_delay=RECONNECT_DELAY):
+        self.path = path
+        self.reconnect_delay = reconnect_delay
+        self.callbacks = {}       # Map: { channel: [callback(channel, body)] }
+        self.ephemeral = {}       # Map: { (key, field): value } owned by this process
+        self.stats = {'published': 0, 'received': 0, 'dropped': 0, 'reconnects': 0}
+
+        self._reader = None
+        self._writer = None
+        self._pending = {}        # Map: { request id: Future }
+        self._ids = itertools.count()
+        self._task = None
+
+    async def _connect(self):
+        self._reader, self._writer = await asyncio.open_unix_connection(self.path)
+        for channel in self.callbacks:
+            self._write({'op': 'sub', 'ch': channel})
+        for (key, field), value in self.ephemeral.items():
+            self._write({'op': 'hset', 'key': key, 'field': field, 'value': value, 'ephemeral': True})
+
+    async def start(self):
+        if self._task is not None and not self._task.done():
+            return
+        # The broker may be starting alongside us; give it a moment before giving up.
+        for attempt in range(CONNECT_ATTEMPTS):
+            try:
+                await self._connect()
+                break
+            except OSError:
+                if attempt == CONNECT_ATTEMPTS - 1:
+                    raise
+                await asyncio.sleep(self.reconnect_delay / 4)
+        logger.info(f"Connected to state broker at {self.path}")
+        self._task = asyncio.create_task(self._run())
+
+    async def close(self):
+        if self._task:
+            self._task.cancel()
+        if self._writer:
+            self._writer.close()
+            self._writer = None
+
+    async def _run(self):
+        while True:
+            try:
+                while True:
+                    header, body = await read_message(self._reader)
+                    op = header.get('op')
+                    if op == 'msg':
+                        self.stats['received'] += 1
+                        for callback in list(self.callbacks.get(header['ch'], ())):
+                            try:
+                                callback(header['ch'], body)
+                            except Exception as e:
+                                logger.error(f"Subscriber for {header['ch']} failed: {e}")
+                    elif op == 'reply':
+                        future = self._pending.pop(header['id'], None)
+                        if future and not future.done():
+                            future.set_result(header['value'])
+            except (asyncio.IncompleteReadError, ConnectionError, OSError) as e:
+                logger.warning(f"Lost state broker connection ({e}); reconnecting")
+
+            self._writer = None
+            for future in self._pending.values():
+                if not future.done():
+                    future.set_exception(ConnectionError("state broker connection lost"))
+            self._pending.clear()
+
+            while True:
+                await asyncio.sleep(self.reconnect_delay)
+                try:
+                    await self._connect()
+                    self.stats['reconnects'] += 1
+                    logger.info("Reconnected to state broker")
+                    break
+                except OSError:
+                    continue
+
+    def _write(self, header, body=b'', droppable=False):
+        writer = self._writer
+        if writer is None or writer.transport.is_closing():
+            self.stats['dropped'] += 1
+            return False
+        if droppable and writer.transport.get_write_buffer_size() > MAX_SUBSCRIBER_BUFFER:
+            self.stats['dropped'] += 1
+            return False
+        writer.write(encode_message(header, body))
+        return True
+
+    def publish(self, channel, body):
+        if self._write({'op': 'pub', 'ch': channel}, body, droppable=True):
+            self.stats['published'] += 1
+
+    def subscribe(self, channel, callback):
+        callbacks = self.callbacks.setdefault(channel, [])
+        if not callbacks:
+            self._write({'op': 'sub', 'ch': channel})
+        callbacks.append(callback)
+
+    def unsubscribe(self, channel, callback=None):
+        callbacks = self.callbacks.get(channel, [])
+        if callback in callbacks:
+            callbacks.remove(callback)
+        if callback is None or not callbacks:
+            self.callbacks.pop(channel, None)
+            self._write({'op': 'unsub', 'ch': channel})
+
+    def hset(self, key, field, value, ephemeral=False):
+        if ephemeral:
+            self.ephemeral[(key, field)] = value
+        else:
+            self.ephemeral.pop((key, field), None)
+        self._write({'op': 'hset', 'key': key, 'field': field, 'value': value, 'ephemeral': ephemeral})
+
+    def hdel(self, key, field):
+        self.ephemeral.pop((key, field), None)
+        self._write({'op': 'hdel', 'key': key, 'field': field})
+
+    async def hgetall(self, key, timeout=REQUEST_TIMEOUT):
+        request_id = next(self._ids)
+        future = asyncio.get_running_loop().create_future()
+        self._pending[request_id] = future
+        if not self._write({'op': 'hgetall', 'id': request_id, 'key': key}):
+            self._pending.pop(request_id, None)
+            raise ConnectionError("state broker not connected")
+        try:
+            return await asyncio.wait_for(future, timeout)
+        finally:
+            self._pending.pop(request_id, None)
+
+    def client_manager(self, channel):
+        return BrokerClientManager(self, channel)
+
+
+class RedisBackend:
+    # Redis (or anything speaking its protocol). Commands go through one ordered send queue so the
+    # synchronous publish/hset API matches BrokerBackend.
+    shared = True
+
+    def __init__(self, url, queue_size=10000):
+        try:
+            from redis import asyncio as aioredis
+        except ImportError:
+            raise RuntimeError("QAI_STATE_BACKEND=redis:// requires the 'redis' package (pip install redis)")
+        self.url = url
+        self.redis = aioredis.Redis.from_url(url)
+        self.pubsub = self.redis.pubsub()
+        self.callbacks = {}       # Map: { channel: [callback(channel, body)] }
+        self.stats = {'published': 0, 'received': 0, 'dropped': 0}
+        self._queue = asyncio.Queue(maxsize=queue_size)
+        self._tasks = []
+
+    async def start(self):
+        if self._tasks:
+            return
+        await self.redis.ping()
+        if self.callbacks:
+            await self.pubsub.subscribe(*self.callbacks)
+        self._tasks = [asyncio.create_task(self._send_loop()), asyncio.create_task(self._listen_loop())]
+        logger.info(f"Connected to Redis state backend at {self.url}")
+
+    async def close(self):
+        for task in self._tasks:
+            task.cancel()
+        await self.pubsub.aclose()
+        await self.redis.aclose()
+
+    def _enqueue(self, method, *args):
+        try:
+            self._queue.put_nowait((method, args))
+            return True
+        except asyncio.QueueFull:
+            self.stats['dropped'] += 1
+            return False
+
+    async def _send_loop(self):
+        while True:
+            method, args = await self._queue.get()
+            try:
+                await method(*args)
+            except Exception as e:
+                logger.warning(f"Redis command failed: {e}")
+
+    async def _listen_loop(self):
+        while True:
+            if not self.pubsub.subscribed:
+                await asyncio.sleep(0.1)
+                continue
+            try:
+                message = await self.pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0)
+            except Exception as e:
+                logger.warning(f"Redis subscription error: {e}")
+                await asyncio.sleep(RECONNECT_DELAY)
+                continue
+            if not message:
+                continue
+            self.stats['received'] += 1
+            channel = message['channel'].decode()
+            for callback in list(self.callbacks.get(channel, ())):
+                try:
+                    callback(channel, message['data'])
+                except Exception as e:
+                    logger.error(f"Subscriber for {channel} failed: {e}")
+
+    def publish(self, channel, body):
+        if self._enqueue(self.redis.publish, channel, body):
+            self.stats['published'] += 1
+
+    def subscribe(self, channel, callback):
+        callbacks = self.callbacks.setdefault(channel, [])
+        if not callbacks and self._tasks:
+            self._enqueue(self.pubsub.subscribe, channel)
+        callbacks.append(callback)
+
+    def unsubscribe(self, channel, callback=None):
+        callbacks = self.callbacks.get(channel, [])
+        if callback in callbacks:
+            callbacks.remove(callback)
+        if callback is None or not callbacks:
+            self.callbacks.pop(channel, None)
+            self._enqueue(self.pubsub.unsubscribe, channel)
+
+    def hset(self, key, field, value, ephemeral=False):
+        # Redis has no connection-scoped fields, so ephemeral is best effort: owners and viewers re-stamp
+        # device records and interest fields periodically, and ClusterSync treats old ones as gone.
+        self._enqueue(self.redis.hset, key, field, orjson.dumps(value))
+
+    def hdel(self, key, field):
+        self._enqueue(self.redis.hdel, key, field)
+
+    async def hgetall(self, key):
+        raw = await self.redis.hgetall(key)
+        return {field.decode(): orjson.loads(value) for field, value in raw.items()}
+
+    def client_manager(self, channel):
+        return socketio.AsyncRedisManager(self.url, channel=channel)
+
+
+class BrokerClientManager(AsyncPubSubManager):
+    # python-socketio client manager over BrokerBackend: emits to rooms or sids owned by another
+    # worker (including callbacks and disconnects) travel over the broker.
+    name = 'qai-broker'
+
+    def __init__(self, backend, channel='socketio', write_only=False, logger=None):
+        super().__init__(channel=channel, write_only=write_only, logger=logger)
+        self.backend = backend
+
+    async def _publish(self, data):
+        self.backend.publish(self.channel, orjson.dumps(data))
+
+    async def _listen(self):
+        queue = asyncio.Queue()
+        callback = lambda channel, body: queue.put_nowait(body)
+        self.backend.subscribe(self.channel, callback)
+        try:
+            while True:
+                yield orjson.loads(await queue.get())
+        finally:
+            self.backend.unsubscribe(self.channel, callback)
+
+
+def create_backend(url=STATE_BACKEND_URL):
+    if not url or url.startswith('memory://'):
+        return MemoryBackend()
+    if url.startswith('unix://'):
+        return BrokerBackend(url[len('unix://'):])
+    if url.startswith(('redis://', 'rediss://')):
+        return RedisBackend(url)
+    raise ValueError(f"Unsupported QAI_STATE_BACKEND: {url}")
+
+
+state_backend = create_backend()
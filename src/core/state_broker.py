@@ -0,0 +1,149 @@
+import os
+import sys
+import socket
+import struct
+import asyncio
+import logging
+
+import orjson
+
+logger = logging.getLogger("StateBroker")
+
+# Wire framing shared with BrokerBackend: (header length, body length), orjson header, raw body.
+FRAME = struct.Struct('<II')
+MAX_SUBSCRIBER_BUFFER = 8 * 1024 * 1024
+EXPIRED_PREFIX = '__expired__:'
+
+
+def encode_message(header, body=b''):
+    head = orjson.dumps(header)
+    return FRAME.pack(len(head), len(body)) + head + body
+
+
+async def read_message(reader):
+    head_len, body_len = FRAME.unpack(await reader.readexactly(FRAME.size))
+    header = orjson.loads(await reader.readexactly(head_len))
+    body = await reader.readexactly(body_len) if body_len else b''
+    return header, body
+
+
+class _Connection:
+    def __init__(self, writer):
+        self.writer = writer
+        self.channels = set()
+        self.ephemeral = set()    # (key, field) removed when this connection goes away
+        self.dropped = 0
+
+
+class StateBroker:
+    # Local stand-in for Redis: channels with fan-out (never echoed back to the publisher) and
+    # hashes whose fields can be tied to the lifetime of the connection that wrote them.
+    def __init__(self, path):
+        self.path = path
+        self.subscribers = {}     # Map: { channel: set(_Connection) }
+        self.hashes = {}          # Map: { key: { field: value } }
+        self.owners = {}          # Map: { (key, field): _Connection } for ephemeral fields
+        self.connections = set()
+        self._server = None
+
+    async def start(self):
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        self._server = await asyncio.start_unix_server(self._handle, path=self.path)
+        logger.info(f"State broker listening on {self.path}")
+
+    async def serve_forever(self):
+        await self.start()
+        async with self._server:
+            await self._server.serve_forever()
+
+    async def close(self):
+        if self._server:
+            self._server.close()
+            await self._server.wait_closed()
+
+    def _send(self, conn, header, body=b'', droppable=True):
+        transport = conn.writer.transport
+        if transport.is_closing():
+            return
+        if droppable and transport.get_write_buffer_size() > MAX_SUBSCRIBER_BUFFER:
+            # Slow subscriber: drop rather than buffer without bound (frames are latest-wins anyway).
+            conn.dropped += 1
+            return
+        conn.writer.write(encode_message(header, body))
+
+    def _publish(self, channel, body, sender=None):
+        for conn in self.subscribers.get(channel, ()):
+            if conn is not sender:
+                self._send(conn, {'op': 'msg', 'ch': channel}, body)
+
+    async def _handle(self, reader, writer):
+        conn = _Connection(writer)
+        self.connections.add(conn)
+        try:
+            while True:
+                header, body = await read_message(reader)
+                op = header.get('op')
+                if op == 'pub':
+                    self._publish(header['ch'], body, sender=conn)
+                elif op == 'sub':
+                    self.subscribers.setdefault(header['ch'], set()).add(conn)
+                    conn.channels.add(header['ch'])
+                elif op == 'unsub':
+                    self.subscribers.get(header['ch'], set()).discard(conn)
+                    conn.channels.discard(header['ch'])
+                elif op == 'hset':
+                    self.hashes.setdefault(header['key'], {})[header['field']] = header['value']
+                    self._set_owner((header['key'], header['field']), conn if header.get('ephemeral') else None)
+                elif op == 'hdel':
+                    self.hashes.get(header['key'], {}).pop(header['field'], None)
+                    self._set_owner((header['key'], header['field']), None)
+                elif op == 'hgetall':
+                    self._send(conn, {'op': 'reply', 'id': header['id'], 'value': self.hashes.get(header['key'], {})}, droppable=False)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        except Exception as e:
+            logger.error(f"Broker connection error: {e}")
+        finally:
+            self._drop(conn)
+            writer.close()
+
+    def _set_owner(self, item, conn):
+        # The last writer owns an ephemeral field; an older owner going away must not delete it.
+        previous = self.owners.pop(item, None)
+        if previous is not None:
+            previous.ephemeral.discard(item)
+        if conn is not None:
+            self.owners[item] = conn
+            conn.ephemeral.add(item)
+
+    def _drop(self, conn):
+        self.connections.discard(conn)
+        for channel in conn.channels:
+            self.subscribers.get(channel, set()).discard(conn)
+
+        expired = {}
+        for key, field in conn.ephemeral:
+            self.owners.pop((key, field), None)
+            if self.hashes.get(key, {}).pop(field, None) is not None:
+                expired.setdefault(key, []).append(field)
+        for key, fields in expired.items():
+            self._publish(EXPIRED_PREFIX + key, orjson.dumps(fields))
+
+
+def broker_running(path):
+    try:
+        with socket.socket(socket.AF_UNIX) as sock:
+            sock.connect(path)
+        return True
+    except OSError:
+        return False
+
+
+def run_broker(path):
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(StateBroker(path).serve_forever())
+
+
+if __name__ == '__main__':
+    run_broker(sys.argv[1] if len(sys.argv) > 1 else '/tmp/qai_state.sock')
@@ -0,0 +1,108 @@
+import time
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+
+logger = logging.getLogger("StreamVariants")
+
+MAIN_VARIANT = 'main'
+
+# 'main' is the camera's own JPEG, relayed untouched.
+STREAM_VARIANTS = {
+    'mid': {'height': 480, 'fps': 10, 'quality': 70},
+    'sub': {'height': 320, 'fps': 5, 'quality': 60},
+}
+
+
+def normalize_variant(variant):
+    return variant if variant in STREAM_VARIANTS else MAIN_VARIANT
+
+
+def transcode_jpeg(image_bytes, height, quality):
+    img = cv2.imdecode(np.frombuffer(image_bytes, dtype=np.uint8), cv2.IMREAD_COLOR)
+    if img is None:
+        return None
+
+    h, w = img.shape[:2]
+    if h > height:
+        img = cv2.resize(img, (int(w * height / h), height), interpolation=cv2.INTER_AREA)
+
+    ok, buf = cv2.imencode('.jpg', img, [cv2.IMWRITE_JPEG_QUALITY, quality])
+    return buf.tobytes() if ok else None
+
+
+class VariantTranscoder:
+    def __init__(self, max_workers=2):
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="variant")
+        self.on_frame = None       # Callback: (device_id, frame_bytes, variant, meta)
+
+        self.subscribers = {}      # Map: { (device_id, variant): count }
+        self._busy = set()         # Keys with a transcode in flight
+        self._last_emit = {}       # Map: { (device_id, variant): monotonic time }
+        self._tasks = set()
+        self.stats = {'transcoded': 0, 'skipped': 0, 'failed': 0}
+
+    def acquire(self, device_id, variant):
+        if variant == MAIN_VARIANT:
+            return
+        key = (device_id, variant)
+        self.subscribers[key] = self.subscribers.get(key, 0) + 1
+
+    def release(self, device_id, variant):
+        if variant == MAIN_VARIANT:
+            return
+        key = (device_id, variant)
+        count = self.subscribers.get(key, 0) - 1
+        if count > 0:
+            self.subscribers[key] = count
+        else:
+            self.subscribers.pop(key, None)
+            self._last_emit.pop(key, None)
+
+    def active_variants(self, device_id):
+        return [variant for (dev_id, variant) in self.subscribers if dev_id == device_id]
+
+    def submit(self, device_id, image_bytes, meta=None):
+        if not self.subscribers:
+            return
+
+        now = time.monotonic()
+        for variant in self.active_variants(device_id):
+            key = (device_id, variant)
+            spec = STREAM_VARIANTS[variant]
+
+            # Latest-frame-wins: skip while a transcode is running or the variant's fps budget is spent.
+            if key in self._busy or now - self._last_emit.get(key, 0.0) < 1.0 / spec['fps']:
+                self.stats['skipped'] += 1
+                continue
+
+            self._busy.add(key)
+            self._last_emit[key] = now
+            task = asyncio.create_task(self._transcode(key, image_bytes, spec, meta))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _transcode(self, key, image_bytes, spec, meta=None):
+        device_id, variant = key
+        try:
+            loop = asyncio.get_running_loop()
+            frame = await loop.run_in_executor(
+                self.executor, transcode_jpeg, image_bytes, spec['height'], spec['quality']
+            )
+            if frame is None:
+                self.stats['failed'] += 1
+                return
+            self.stats['transcoded'] += 1
+            if self.on_frame and key in self.subscribers:
+                self.on_frame(device_id, frame, variant, meta)
+        except Exception as e:
+            self.stats['failed'] += 1
+            logger.error(f"Transcode {device_id}/{variant} failed: {e}")
+        finally:
+            self._busy.discard(key)
+
+
+variant_transcoder = VariantTranscoder()
@@ -0,0 +1,201 @@
+import os
+import math
+import time
+import asyncio
+import sqlite3
+import logging
+import threading
+
+logger = logging.getLogger("TelemetryStore")
+
+# Rollup resolution (seconds) -> how long its buckets are kept (seconds).
+RETENTION = {
+    1: 6 * 3600,
+    60: 7 * 24 * 3600,
+    3600: 180 * 24 * 3600,
+}
+FLUSH_INTERVAL = 1.0
+PRUNE_INTERVAL = 300.0
+MAX_POINTS = 720
+
+
+class TelemetryStore:
+    def __init__(self, db_path="data/telemetry.db", retention=RETENTION,
+                 flush_interval=FLUSH_INTERVAL, prune_interval=PRUNE_INTERVAL):
+        self.db_path = db_path
+        self.retention = dict(retention)
+        self.resolutions = sorted(self.retention)
+        self.flush_interval = flush_interval
+        self.prune_interval = prune_interval
+
+        self._pending = {}            # Map: { (device_id, metric, second): [count, sum, min, max] }
+        self._lock = threading.Lock()
+        self._flush_task = None
+        self._last_prune = 0
+        self.stats = {'recorded': 0, 'flushes': 0, 'rows_written': 0, 'pruned': 0, 'skipped': 0}
+
+        db_dir = os.path.dirname(db_path)
+        if db_dir and not os.path.exists(db_dir):
+            os.makedirs(db_dir, exist_ok=True)
+
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._create_schema()
+
+    def _create_schema(self):
+        with self._lock, self._conn:
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS rollup (
+                    device_id TEXT NOT NULL,
+                    metric TEXT NOT NULL,
+                    resolution INTEGER NOT NULL,
+                    bucket INTEGER NOT NULL,
+                    count INTEGER NOT NULL,
+                    sum REAL NOT NULL,
+                    min REAL NOT NULL,
+                    max REAL NOT NULL,
+                    PRIMARY KEY (device_id, metric, resolution, bucket)
+                ) WITHOUT ROWID
+            """)
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_rollup_age ON rollup (resolution, bucket)"
+            )
+
+    def record(self, device_id, metric, value, ts=None):
+        # Runs on the event loop: only touches an in-memory dict, the flush task does the I/O.
+        key = (device_id, metric, int(ts if ts is not None else time.time()))
+        agg = self._pending.get(key)
+        if agg is None:
+            self._pending[key] = [1, value, value, value]
+        else:
+            agg[0] += 1
+            agg[1] += value
+            if value < agg[2]:
+                agg[2] = value
+            if value > agg[3]:
+                agg[3] = value
+        self.stats['recorded'] += 1
+
+    def record_many(self, device_id, values, ts=None):
+        # Numeric fields only; booleans (alarm flags) are stored as 0/1 so their activity can be charted.
+        # NaN/inf (or ints too big for a REAL) are skipped per sample: one would fail the whole flush.
+        for metric, value in values.items():
+            if not isinstance(value, (int, float)):
+                continue
+            try:
+                value = float(value)
+            except OverflowError:
+                value = math.nan
+            if not math.isfinite(value):
+                self.stats['skipped'] += 1
+                continue
+            self.record(device_id, metric, value, ts)
+
+    def _rollup(self, batch):
+        rows = {}
+        for (device_id, metric, second), (count, total, lo, hi) in batch.items():
+            for res in self.resolutions:
+                key = (device_id, metric, res, second - second % res)
+                agg = rows.get(key)
+                if agg is None:
+                    rows[key] = [count, total, lo, hi]
+                else:
+                    agg[0] += count
+                    agg[1] += total
+                    agg[2] = min(agg[2], lo)
+                    agg[3] = max(agg[3], hi)
+        return [key + tuple(agg) for key, agg in rows.items()]
+
+    def _write(self, batch):
+        rows = self._rollup(batch)
+        with self._lock, self._conn:
+            self._conn.executemany("""
+                INSERT INTO rollup (device_id, metric, resolution, bucket, count, sum, min, max)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (device_id, metric, resolution, bucket) DO UPDATE SET
+                    count = count + excluded.count,
+                    sum = sum + excluded.sum,
+                    min = MIN(min, excluded.min),
+                    max = MAX(max, excluded.max)
+            """, rows)
+        return len(rows)
+
+    def prune(self, now=None):
+        now = now if now is not None else time.time()
+        removed = 0
+        with self._lock, self._conn:
+            for res, keep in self.retention.items():
+                cur = self._conn.execute(
+                    "DELETE FROM rollup WHERE resolution = ? AND bucket < ?", (res, int(now - keep))
+                )
+                removed += cur.rowcount
+        self.stats['pruned'] += removed
+        return removed
+
+    async def flush(self):
+        if not self._pending:
+            return 0
+        batch, self._pending = self._pending, {}
+        written = await asyncio.to_thread(self._write, batch)
+        self.stats['flushes'] += 1
+        self.stats['rows_written'] += written
+        return written
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+                if time.time() - self._last_prune >= self.prune_interval:
+                    self._last_prune = time.time()
+                    removed = await asyncio.to_thread(self.prune)
+                    if removed:
+                        logger.info(f"Pruned {removed} expired telemetry buckets")
+            except Exception as e:
+                logger.error(f"Telemetry flush failed: {e}")
+
+    def start(self):
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.create_task(self._flush_loop())
+
+    def pick_resolution(self, start, end, max_points=MAX_POINTS):
+        # Finest rollup that still covers the window and keeps the chart under max_points.
+        now = time.time()
+        for res in self.resolutions:
+            if start >= now - self.retention[res] and (end - start) / res <= max_points:
+                return res
+        return self.resolutions[-1]
+
+    def get_metrics(self, device_id):
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT DISTINCT metric FROM rollup WHERE device_id = ? AND resolution = ? ORDER BY metric",
+                (device_id, self.resolutions[-1])
+            ).fetchall()
+        return [r[0] for r in rows]
+
+    def query(self, device_id, metric, start, end=None, resolution=None):
+        end = end if end is not None else time.time()
+        if resolution not in self.retention:
+            resolution = self.pick_resolution(start, end)
+
+        with self._lock:
+            rows = self._conn.execute("""
+                SELECT bucket, count, sum, min, max FROM rollup
+                WHERE device_id = ? AND metric = ? AND resolution = ? AND bucket >= ? AND bucket <= ?
+                ORDER BY bucket
+            """, (device_id, metric, resolution, int(start - start % resolution), int(end))).fetchall()
+
+        return {
+            'device_id': device_id,
+            'metric': metric,
+            'resolution': resolution,
+            'points': [
+                {'t': bucket, 'count': count, 'avg': total / count, 'min': lo, 'max': hi, 'sum': total}
+                for bucket, count, total, lo, hi in rows
+            ],
+        }
+
+
+telemetry_store = TelemetryStore()
@@ -0,0 +1,91 @@
+import os
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+
+logger = logging.getLogger("ThumbnailManager")
+
+STORAGE_ROOT = 'server_storage'
+
+
+class ThumbnailManager:
+    def __init__(self, storage_root=STORAGE_ROOT, max_width=320, quality=70, max_workers=2):
+        self.storage_root = storage_root
+        self.max_width = max_width
+        self.quality = quality
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="thumb")
+        self._pending = {}   # Map: { thumb_path: asyncio.Future }
+        self._tasks = set()
+
+    def source_path(self, device_id, filename):
+        return os.path.join(self.storage_root, device_id, 'images', filename)
+
+    def thumb_path(self, device_id, filename):
+        return os.path.join(self.storage_root, device_id, 'thumbnails', filename)
+
+    def _render(self, src_path, dst_path):
+        src_mtime = os.stat(src_path).st_mtime
+        img = cv2.imread(src_path, cv2.IMREAD_REDUCED_COLOR_2)
+        if img is None:
+            return False
+
+        h, w = img.shape[:2]
+        if w > self.max_width:
+            new_h = int(h * self.max_width / w)
+            img = cv2.resize(img, (self.max_width, new_h), interpolation=cv2.INTER_AREA)
+
+        ok, buf = cv2.imencode('.jpg', img, [cv2.IMWRITE_JPEG_QUALITY, self.quality])
+        if not ok:
+            return False
+
+        os.makedirs(os.path.dirname(dst_path), exist_ok=True)
+        tmp_path = f"{dst_path}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(buf.tobytes())
+        # Stamp the thumbnail with its source's mtime so a re-uploaded image is seen as newer.
+        os.utime(tmp_path, (src_mtime, src_mtime))
+        os.replace(tmp_path, dst_path)
+        return True
+
+    def _is_fresh(self, src_path, dst_path):
+        try:
+            thumb_mtime = os.stat(dst_path).st_mtime
+        except OSError:
+            return False
+        try:
+            return thumb_mtime >= os.stat(src_path).st_mtime
+        except OSError:
+            return True
+
+    async def ensure(self, device_id, filename):
+        src_path = self.source_path(device_id, filename)
+        dst_path = self.thumb_path(device_id, filename)
+        if self._is_fresh(src_path, dst_path):
+            return dst_path
+
+        pending = self._pending.get(dst_path)
+        if pending is None:
+            loop = asyncio.get_running_loop()
+            pending = loop.run_in_executor(
+                self.executor, self._render, src_path, dst_path
+            )
+            self._pending[dst_path] = pending
+            pending.add_done_callback(lambda _: self._pending.pop(dst_path, None))
+
+        try:
+            ok = await asyncio.shield(pending)
+        except Exception as e:
+            logger.error(f"Thumbnail failed for {device_id}/{filename}: {e}")
+            return None
+        return dst_path if ok else None
+
+    def schedule(self, device_id, filename):
+        task = asyncio.create_task(self.ensure(device_id, filename))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+
+thumbnail_manager = ThumbnailManager()
@@ -0,0 +1,140 @@
+import os
+import time
+import uuid
+import asyncio
+import logging
+from collections import deque
+
+import aiofiles
+import aiofiles.os
+
+from src.core.metrics import UPLOAD_BYTES, UPLOAD_DURATION, UPLOAD_FAILURES
+
+logger = logging.getLogger("UploadManager")
+
+CHUNK_SIZE = 1024 * 1024
+# Temp files live in a hidden sibling directory so nothing scanning the destination sees half-written uploads.
+UPLOADING_DIR = '.uploading'
+
+
+class UploadManager:
+    def __init__(self, history_size=200, lag_interval=0.05):
+        self.active = {}                          # Map: { upload_id: record }
+        self.recent = deque(maxlen=history_size)
+        self.totals = {'uploads': 0, 'bytes': 0, 'failed': 0}
+
+        self.lag_interval = lag_interval
+        self._lag_task = None
+
+    async def save_stream(self, upload_file, dest_path, kind='upload'):
+        record = {
+            'id': uuid.uuid4().hex[:12],
+            'kind': kind,
+            'path': dest_path,
+            'bytes': 0,
+            'chunks': 0,
+            'started': time.time(),
+            'max_write_ms': 0.0,
+            'loop_lag_max_ms': 0.0,
+        }
+        self.active[record['id']] = record
+        self._ensure_lag_monitor()
+
+        dest_dir, dest_name = os.path.split(dest_path)
+        tmp_dir = os.path.join(dest_dir, UPLOADING_DIR)
+        tmp_path = os.path.join(tmp_dir, f"{dest_name}.{record['id']}.part")
+        t0 = time.perf_counter()
+        try:
+            await aiofiles.os.makedirs(tmp_dir, exist_ok=True)
+
+            async with aiofiles.open(tmp_path, 'wb') as out:
+                while True:
+                    chunk = await upload_file.read(CHUNK_SIZE)
+                    if not chunk:
+                        break
+
+                    w0 = time.perf_counter()
+                    await out.write(chunk)
+                    write_ms = (time.perf_counter() - w0) * 1000
+
+                    record['bytes'] += len(chunk)
+                    record['chunks'] += 1
+                    record['max_write_ms'] = max(record['max_write_ms'], write_ms)
+
+            await aiofiles.os.replace(tmp_path, dest_path)
+
+        except Exception:
+            self.record_failed(kind)
+            try:
+                await aiofiles.os.remove(tmp_path)
+            except OSError:
+                pass
+            raise
+
+        finally:
+            self.active.pop(record['id'], None)
+
+        return self._complete(record, time.perf_counter() - t0)
+
+    def record_completed(self, kind, path, size, started, chunks=0):
+        # Uploads that reached disk some other way (resumable chunks) count in the same totals and metrics.
+        record = {
+            'id': uuid.uuid4().hex[:12],
+            'kind': kind,
+            'path': path,
+            'bytes': size,
+            'chunks': chunks,
+            'started': started,
+            'max_write_ms': 0.0,
+            'loop_lag_max_ms': 0.0,
+        }
+        return self._complete(record, time.time() - started)
+
+    def _complete(self, record, duration):
+        record['duration_s'] = round(duration, 4)
+        record['throughput_mbps'] = round(record['bytes'] / (1024 * 1024) / duration, 3) if duration > 0 else 0.0
+        record['max_write_ms'] = round(record['max_write_ms'], 3)
+        record['loop_lag_max_ms'] = round(record['loop_lag_max_ms'], 3)
+
+        self.totals['uploads'] += 1
+        self.totals['bytes'] += record['bytes']
+        self.recent.append(record)
+        UPLOAD_BYTES.labels(record['kind']).inc(record['bytes'])
+        UPLOAD_DURATION.labels(record['kind']).observe(duration)
+        return record
+
+    def record_failed(self, kind):
+        self.totals['failed'] += 1
+        UPLOAD_FAILURES.labels(kind).inc()
+
+    def _ensure_lag_monitor(self):
+        if self._lag_task is None or self._lag_task.done():
+            self._lag_task = asyncio.create_task(self._monitor_lag())
+
+    async def _monitor_lag(self):
+        # Samples loop lag only while uploads are in flight and charges it to each of them.
+        loop = asyncio.get_running_loop()
+        while self.active:
+            expected = loop.time() + self.lag_interval
+            await asyncio.sleep(self.lag_interval)
+            lag_ms = max(0.0, (loop.time() - expected) * 1000)
+            for record in self.active.values():
+                if lag_ms > record['loop_lag_max_ms']:
+                    record['loop_lag_max_ms'] = lag_ms
+
+    def get_stats(self):
+        recent = list(self.recent)
+        throughputs = sorted(r['throughput_mbps'] for r in recent)
+        return {
+            'totals': dict(self.totals),
+            'active': [
+                {k: v for k, v in r.items() if k != 'path'} | {'elapsed_s': round(time.time() - r['started'], 3)}
+                for r in self.active.values()
+            ],
+            'recent': recent[-20:],
+            'median_throughput_mbps': throughputs[len(throughputs) // 2] if throughputs else 0.0,
+            'max_loop_lag_ms': max((r['loop_lag_max_ms'] for r in recent), default=0.0),
+        }
+
+
+upload_manager = UploadManager()
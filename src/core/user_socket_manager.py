@@ -1,16 +1,96 @@
 import socketio
 import logging
-import base64
+import asyncio
+import time
+import math
+from src.core.stream_variants import variant_transcoder, normalize_variant, MAIN_VARIANT
+from src.core.latency_tracer import latency_tracer
+from src.core.metrics import VIEWERS, FRAMES_SENT, FRAMES_DROPPED
+from src.core.state_backend import state_backend
+from src.core.cluster_sync import cluster_sync
+from src.core.factory_manager import factory_manager
 logger = logging.getLogger("UserSocket")
 
+# Packets already queued in engine.io for a viewer before we stop handing it new frames.
+MAX_TRANSPORT_BACKLOG = 2
+
+def _as_float(value):
+    try:
+        value = float(value)
+    except (TypeError, ValueError, OverflowError):
+        return None
+    return value if math.isfinite(value) else None
+
+class FrameMailbox:
+    def __init__(self, manager, sid, device_id, variant=MAIN_VARIANT, max_fps=None):
+        self.manager = manager
+        self.sid = sid
+        self.device_id = device_id
+        self.variant = variant
+        self.min_interval = 1.0 / max_fps if max_fps and max_fps > 0 else 0.0
+
+        self.frame = None
+        self.event = asyncio.Event()
+        self.sent = 0
+        self.dropped = 0
+        self._sent_metric = FRAMES_SENT.labels(device_id)
+        self._dropped_metric = FRAMES_DROPPED.labels(device_id)
+
+        self.task = asyncio.create_task(self._run())
+
+    def put(self, payload):
+        if self.frame is not None:
+            self.dropped += 1
+            self._dropped_metric.inc()
+        self.frame = payload
+        self.event.set()
+
+    async def _run(self):
+        while True:
+            await self.event.wait()
+
+            # Slow viewer: let newer frames overwrite the slot until its transport drains.
+            while self.manager.transport_backlog(self.sid) > MAX_TRANSPORT_BACKLOG:
+                await asyncio.sleep(0.02)
+
+            self.event.clear()
+            payload, self.frame = self.frame, None
+            if payload is None:
+                continue
+
+            if 'seq' in payload:
+                payload = dict(payload, ts_emit=time.time())
+                latency_tracer.record_span(self.device_id, 'receive_to_emit', payload['ts_recv'], payload['ts_emit'])
+
+            try:
+                # Every worker fans out to its own viewers; frames never need the message queue.
+                await self.manager.sio.emit("video_frame", payload, to=self.sid, ignore_queue=True)
+                self.sent += 1
+                self._sent_metric.inc()
+            except Exception as e:
+                logger.warning(f"Frame delivery to {self.sid} failed: {e}")
+
+            # Per-viewer fps cap: frames arriving during the pause overwrite each other.
+            if self.min_interval:
+                await asyncio.sleep(self.min_interval)
+
+    def close(self):
+        self.task.cancel()
+
+
 class UserSocketManager:
     def __init__(self):
         self.sio = socketio.AsyncServer(
             async_mode="asgi",
-            cors_allowed_origins="*"
+            cors_allowed_origins="*",
+            client_manager=state_backend.client_manager('qai:socketio:user')
         )
         self.app = socketio.ASGIApp(self.sio)
 
+        self.mailboxes = {}     # Map: { device_id: { sid: FrameMailbox } }
+        self.dropped_closed = {}  # Map: { device_id: dropped frames of viewers that already left }
+        VIEWERS.set_function(lambda: {(device_id,): len(viewers) for device_id, viewers in self.mailboxes.items()})
+
         self._register()
 
     def _register(self):
@@ -22,24 +102,93 @@ class UserSocketManager:
         @self.sio.event
         async def disconnect(sid):
             logger.info(f"👋 User disconnected: {sid}")
+            for device_id in list(self.mailboxes):
+                self._remove_viewer(sid, device_id)
 
         @self.sio.event
-        async def join_device(sid, device_id: str):
-            logger.info(f"👁 User {sid} watching {device_id}")
+        async def join_device(sid, data):
+            device_id, variant, max_fps = self._parse_subscription(data)
+            if not isinstance(device_id, str) or not factory_manager.is_allowed(device_id):
+                return
+            logger.info(f"👁 User {sid} watching {device_id} ({variant})")
             await self.sio.enter_room(sid, f"device_{device_id}")
 
+            self._remove_viewer(sid, device_id)
+            self.mailboxes.setdefault(device_id, {})[sid] = FrameMailbox(self, sid, device_id, variant, max_fps)
+            variant_transcoder.acquire(device_id, variant)
+            cluster_sync.acquire(device_id)
+
+        @self.sio.event
+        async def frame_painted(sid, data):
+            # Sampled paint acks from viewers; they echo the frame's server timestamps back.
+            if not isinstance(data, dict) or not isinstance(data.get('device_id'), str):
+                return
+            device_id, now = data['device_id'], time.time()
+            if not factory_manager.is_allowed(device_id):
+                return
+            latency_tracer.record(device_id, 'receive_to_paint', _as_float(data.get('paint_ms')))
+            latency_tracer.record_span(device_id, 'emit_to_ack', _as_float(data.get('ts_emit')), now)
+            latency_tracer.record_span(device_id, 'capture_to_ack', _as_float(data.get('ts_capture')), now)
+
         @self.sio.event
-        async def leave_device(sid, device_id: str):
+        async def leave_device(sid, data):
+            device_id, _, _ = self._parse_subscription(data)
             await self.sio.leave_room(sid, f"device_{device_id}")
+            self._remove_viewer(sid, device_id)
 
-    async def broadcast_frame(self, device_id: str, image_bytes: bytes):
-        await self.sio.emit(
-            "video_frame",
-            {
-                "device_id": device_id,
-                "image": image_bytes
-            },
-            room=f"device_{device_id}"
-        )
+    def _parse_subscription(self, data):
+        # Old clients send the bare device id; new ones may send { device_id, variant, max_fps }.
+        if isinstance(data, dict):
+            try:
+                max_fps = float(data.get('max_fps') or 0) or None
+            except (TypeError, ValueError):
+                max_fps = None
+            return data.get('device_id'), normalize_variant(data.get('variant')), max_fps
+        return data, MAIN_VARIANT, None
+
+    def _remove_viewer(self, sid, device_id):
+        viewers = self.mailboxes.get(device_id)
+        if not viewers or sid not in viewers:
+            return
+        mailbox = viewers.pop(sid)
+        mailbox.close()
+        variant_transcoder.release(device_id, mailbox.variant)
+        cluster_sync.release(device_id)
+        self.dropped_closed[device_id] = self.dropped_closed.get(device_id, 0) + mailbox.dropped
+        if not viewers:
+            del self.mailboxes[device_id]
+
+    def transport_backlog(self, sid):
+        try:
+            eio_sid = self.sio.manager.eio_sid_from_sid(sid, "/")
+            return self.sio.eio.sockets[eio_sid].queue.qsize()
+        except Exception:
+            return 0
+
+    def publish_frame(self, device_id: str, image_bytes: bytes, variant: str = MAIN_VARIANT, meta: dict = None):
+        viewers = self.mailboxes.get(device_id)
+        if not viewers:
+            return
+
+        payload = {
+            "device_id": device_id,
+            "image": image_bytes
+        }
+        if meta:
+            payload.update(meta)
+        for mailbox in viewers.values():
+            if mailbox.variant == variant:
+                mailbox.put(payload)
+
+    def get_fanout_stats(self):
+        stats = {}
+        for device_id in set(self.mailboxes) | set(self.dropped_closed):
+            viewers = self.mailboxes.get(device_id, {})
+            stats[device_id] = {
+                "viewers": len(viewers),
+                "sent": sum(m.sent for m in viewers.values()),
+                "dropped": self.dropped_closed.get(device_id, 0) + sum(m.dropped for m in viewers.values()),
+            }
+        return stats
 
-user_socket_manager = UserSocketManager()
\ No newline at end of file
+user_socket_manager = UserSocketManager()
@@ -0,0 +1,70 @@
+# Negotiated at register_device: devices that send {'device_id': ..., 'wire': 'binary'} get a
+# device_index in the ack and may use the video_frame_bin / telemetry_bin events from then on.
+# Devices that register with a bare id string keep using the dict-based events.
+WIRE_LEGACY = 'legacy'
+WIRE_BINARY = 'binary'
+WIRE_VERSION = 2
+
+# Both events go through the server's normal Socket.IO packet codec; nothing here changes it.
+# video_frame_bin(device_index, seq, capture_ts, jpeg): the numbers ride in the packet text and the JPEG
+# is the only binary attachment, handed to the handler as-is. It is no smaller or cheaper to decode than
+# the dict video_frame (about 2 B/msg larger); what it adds is the frame seq and capture time, used to
+# drop out-of-order frames and for latency tracing.
+# telemetry_bin(device_index, mode, data): plain packet text; dropping the id string and key names saves
+# about 25 B/msg. As a binary attachment the small JSON body would cost more than it saves.
+
+
+class WireFormatError(ValueError):
+    pass
+
+
+def pack_frame(device_index, seq, capture_ts, jpeg):
+    return [device_index, seq & 0xFFFFFFFF, capture_ts, jpeg]
+
+
+def unpack_frame(args):
+    if len(args) != 4:
+        raise WireFormatError(f"Expected device index, seq, capture time and JPEG, got {len(args)} args")
+    device_index, seq, capture_ts, jpeg = args
+    if type(device_index) is not int or type(seq) is not int:
+        raise WireFormatError("Device index and seq must be integers")
+    if capture_ts is not None and type(capture_ts) not in (int, float):
+        raise WireFormatError("Capture time must be a number")
+    if not isinstance(jpeg, bytes) or not jpeg:
+        raise WireFormatError("Frame must be non-empty binary")
+    return device_index, seq & 0xFFFFFFFF, capture_ts, jpeg
+
+
+def pack_telemetry(device_index, mode, data):
+    return [device_index, mode, data]
+
+
+def unpack_telemetry(args):
+    if len(args) != 3:
+        raise WireFormatError(f"Expected device index, mode and data, got {len(args)} args")
+    device_index, mode, data = args
+    if type(device_index) is not int or not isinstance(mode, str) or not isinstance(data, dict):
+        raise WireFormatError("Telemetry must be (int, str, dict)")
+    return device_index, mode, data
+
+
+class DeviceIndexTable:
+    # Small integer ids handed out once per device id and kept for the process lifetime,
+    # so a reconnecting device gets the same index back.
+    def __init__(self):
+        self.index_of = {}       # Map: { device_id: index }
+        self.devices = []        # List: index -> device_id
+
+    def assign(self, device_id):
+        index = self.index_of.get(device_id)
+        if index is None:
+            if len(self.devices) > 0xFFFF:
+                raise OverflowError("Device index space exhausted")
+            index = self.index_of[device_id] = len(self.devices)
+            self.devices.append(device_id)
+        return index
+
+    def lookup(self, index):
+        if 0 <= index < len(self.devices):
+            return self.devices[index]
+        return None
@@ -1,9 +1,9 @@
-import os
-import glob
 from datetime import datetime
 from nicegui import ui
 
-STORAGE_ROOT = 'server_storage'
+from src.core.media_index import media_index
+from src.utils.media_pairing import VideoMatcher
+from src.core.metrics import HISTORY_QUERY
 
 vn_locale = {
     'days': 'Chủ nhật_Thứ hai_Thứ ba_Thứ tư_Thứ năm_Thứ sáu_Thứ bảy'.split('_'),
@@ -16,115 +16,41 @@ vn_locale = {
 }
 
 def get_available_dates(device_id):
-    img_dir = os.path.join(STORAGE_ROOT, device_id, 'images')
-    if not os.path.exists(img_dir): return []
-    found_dates = set()
-    files = glob.glob(os.path.join(img_dir, "img_*.jpg"))
-    for f_path in files:
-        try:
-            fname = os.path.basename(f_path)
-            parts = fname.split('_') 
-            # img_YYYYMMDD_HHMMSS.jpg -> parts[1] là date
-            if len(parts) >= 2:
-                date_str = parts[1] 
-                fmt_date = f"{date_str[:4]}/{date_str[4:6]}/{date_str[6:]}"
-                found_dates.add(fmt_date)
-        except: continue
-    return list(found_dates)
+    return media_index.get_dates(device_id, 'images', prefix='img_', ext='.jpg')
 
 def get_data_for_date(device_id, date_obj):
     date_str_compact = date_obj.strftime("%Y%m%d")
-    
-    path_img = os.path.join(STORAGE_ROOT, device_id, 'images')
-    path_org = os.path.join(STORAGE_ROOT, device_id, 'videos')           
-    path_ann = os.path.join(STORAGE_ROOT, device_id, 'annotated_videos') 
 
-    def load_video_map(folder_path, url_prefix):
+    def load_video_map(folder, url_prefix):
         v_map = {}
-        if not os.path.exists(folder_path): return v_map
-        
-        pattern = os.path.join(folder_path, f"evidence_*{date_str_compact}_*.mp4")
-        
-        for v_path in glob.glob(pattern):
-            try:
-                fname = os.path.basename(v_path)
-                parts = fname.split('_')
-                time_str = parts[-1].split('.')[0] 
-                
-                dt_vid = datetime.strptime(f"{date_str_compact}_{time_str}", "%Y%m%d_%H%M%S")
-                v_map[dt_vid] = f"/media/{device_id}/{url_prefix}/{fname}"
-            except: continue
+        for fname, dt_vid in media_index.get_files(device_id, folder, date_str_compact, prefix='evidence_', ext='.mp4'):
+            v_map[dt_vid] = f"/media/{device_id}/{url_prefix}/{fname}"
         return v_map
 
-    map_org = load_video_map(path_org, 'videos')
-    map_ann = load_video_map(path_ann, 'annotated_videos')
+    map_org = load_video_map('videos', 'videos')
+    map_ann = load_video_map('annotated_videos', 'annotated_videos')
 
-    used_org_keys = set()
-    used_ann_keys = set()
+    org_matcher = VideoMatcher(map_org, window=120.0)
+    ann_matcher = VideoMatcher(map_ann, window=120.0)
 
     def find_videos(img_dt):
-        result = {'org': None, 'ann': None}
-        
-        best_org_dt = None
-        min_diff_org = 120.0 
-        
-        for vid_dt, url in map_org.items():
-            if vid_dt in used_org_keys: 
-                continue
-
-            diff = (vid_dt - img_dt).total_seconds()
-            
-            if 0 <= diff < min_diff_org:
-                min_diff_org = diff
-                result['org'] = url
-                best_org_dt = vid_dt
+        return {'org': org_matcher.match(img_dt), 'ann': ann_matcher.match(img_dt)}
 
-        if best_org_dt:
-            used_org_keys.add(best_org_dt)
+    grouped_slots = {i: [] for i in range(12)}
 
-        best_ann_dt = None
-        min_diff_ann = 120.0
+    for fname, dt in media_index.get_files(device_id, 'images', date_str_compact, prefix='img_', ext='.jpg'):
+        slot_idx = dt.hour // 2
         
-        for vid_dt, url in map_ann.items():
-            if vid_dt in used_ann_keys: 
-                continue
-
-            diff = (vid_dt - img_dt).total_seconds()
-            
-            if 0 <= diff < min_diff_ann:
-                min_diff_ann = diff
-                result['ann'] = url
-                best_ann_dt = vid_dt
+        videos = find_videos(dt)
         
-        if best_ann_dt:
-            used_ann_keys.add(best_ann_dt)
-                
-        return result
-
-    grouped_slots = {i: [] for i in range(12)}
-    img_pattern = os.path.join(path_img, f"img_{date_str_compact}_*.jpg")
-    img_files = sorted(glob.glob(img_pattern)) 
-
-    for f_path in img_files:
-        try:
-            fname = os.path.basename(f_path)
-            parts = fname.split('_')
-            if len(parts) < 3: continue
-            time_part = parts[2].split('.')[0]
-            
-            dt = datetime.strptime(f"{date_str_compact}_{time_part}", "%Y%m%d_%H%M%S")
-            slot_idx = dt.hour // 2
-            
-            videos = find_videos(dt)
-            
-            grouped_slots[slot_idx].append({
-                'image_url': f"/media/{device_id}/images/{fname}",
-                'video_org': videos['org'], 
-                'video_ann': videos['ann'], 
-                'display_time': dt.strftime("%H:%M:%S"),
-                'raw_dt': dt
-            })
-        except: continue
+        grouped_slots[slot_idx].append({
+            'image_url': f"/media/{device_id}/images/{fname}",
+            'thumb_url': f"/api/thumbnail/{device_id}/{fname}",
+            'video_org': videos['org'], 
+            'video_ann': videos['ann'], 
+            'display_time': dt.strftime("%H:%M:%S"),
+            'raw_dt': dt
+        })
         
     return grouped_slots
 
@@ -147,7 +73,8 @@ def history_page(device_id: str):
         'data': {},
         'current_date': datetime.now().strftime("%Y/%m/%d")
     }
-    available_dates = get_available_dates(device_id)
+    with HISTORY_QUERY.labels('admin_history', 'dates').time():
+        available_dates = get_available_dates(device_id)
 
     # --- LAYOUT CHÍNH ---
     with ui.element('div').classes('w-full min-h-screen flex flex-col md:flex-row bg-slate-900'):
@@ -227,7 +154,7 @@ def history_page(device_id: str):
                     
                     # 1. ẢNH NỀN (Click để xem Ảnh to)
                     # cursor-zoom-in để người dùng biết là bấm vào xem ảnh
-                    img = ui.image(item['image_url']).classes('w-full h-full object-cover cursor-zoom-in opacity-90 group-hover:opacity-100 transition-opacity')
+                    img = ui.image(item['thumb_url']).classes('w-full h-full object-cover cursor-zoom-in opacity-90 group-hover:opacity-100 transition-opacity')
                     img.on('click', lambda _, u=item['image_url']: show_image(u))
 
                     # 2. ACTION BAR (Góc Trên Phải) - Chứa các nút Video
@@ -292,7 +219,8 @@ def history_page(device_id: str):
             
             lbl_date_display.set_text(d_obj.strftime("%d/%m/%Y"))
             
-            data = get_data_for_date(device_id, d_obj)
+            with HISTORY_QUERY.labels('admin_history', 'day').time():
+                data = get_data_for_date(device_id, d_obj)
             state['data'] = data
             
             total = sum(len(items) for items in data.values())
@@ -1,4 +1,4 @@
-from nicegui import ui, app
+from nicegui import ui, app, context
 from datetime import datetime
 
 from src.core.factory_manager import factory_manager
@@ -14,47 +14,47 @@ def format_last_seen(timestamp):
         return "Invalid"
 
 
+def get_card_style(is_online):
+    if is_online:
+        return {
+            'status_label': "ONLINE",
+            'badge_class': "bg-teal-100 text-teal-800 border border-teal-200",
+            'icon_bg': "bg-teal-100 text-teal-700",
+            'icon_name': "videocam",
+            'dot_class': "bg-teal-500 shadow-[0_0_10px_rgba(20,184,166,0.6)]",
+            'border_class': "border-slate-200 hover:border-teal-400",
+        }
+    return {
+        'status_label': "OFFLINE",
+        'badge_class': "bg-red-100 text-red-700 border border-red-200",
+        'icon_bg': "bg-red-100 text-red-600",
+        'icon_name': "videocam_off",
+        'dot_class': "bg-red-500",
+        'border_class': "border-slate-200 hover:border-red-400",
+    }
+
+
 def render_device_card(device_id):
-    data = device_socket_manager.device_data.get(device_id, {})
-    raw_status = data.get('status', 'offline')
-    last_seen = data.get('last_seen', 0)
-    ip = data.get('configs', {}).get('ip', 'N/A') 
-    is_online = (raw_status == 'online')
+    status = device_socket_manager.get_status(device_id)
+    is_online = (status['status'] == 'online')
+    style = get_card_style(is_online)
 
-    if is_online:
-        status_label = "ONLINE"
-        badge_class = "bg-teal-100 text-teal-800 border border-teal-200"
-        icon_bg = "bg-teal-100 text-teal-700"
-        icon_name = "videocam"
-        dot_class = "bg-teal-500 shadow-[0_0_10px_rgba(20,184,166,0.6)]"
-        border_class = "border-slate-200 hover:border-teal-400"
-    else:
-        status_label = "OFFLINE"
-        badge_class = "bg-red-100 text-red-700 border border-red-200"
-        icon_bg = "bg-red-100 text-red-600"
-        icon_name = "videocam_off"
-        dot_class = "bg-red-500"
-        border_class = "border-slate-200 hover:border-red-400"
-
-    with ui.card().classes(
-        f'''
-        w-full p-3 sm:p-4 rounded-xl border {border_class}
-        bg-white shadow-md hover:shadow-lg
-        hover:-translate-y-0.5 transition-all duration-300
-        cursor-pointer group
-        '''
-    ).on('click', lambda: ui.navigate.to(f'/device/{device_id}')):
+    card_base = 'w-full p-3 sm:p-4 rounded-xl border bg-white shadow-md hover:shadow-lg hover:-translate-y-0.5 transition-all duration-300 cursor-pointer group'
+    icon_base = 'w-10 h-10 sm:w-12 sm:h-12 rounded-xl flex items-center justify-center border border-black/5 shrink-0'
+    badge_base = 'px-2 py-0.5 rounded-md text-[10px] mt-0.5 font-bold uppercase tracking-wider w-fit'
+    dot_base = 'w-2.5 h-2.5 rounded-full ring-2 ring-white'
+
+    card = ui.card().classes(f"{card_base} {style['border_class']}") \
+        .on('click', lambda: ui.navigate.to(f'/device/{device_id}'))
+
+    with card:
 
         with ui.row().classes('w-full items-center justify-between no-wrap gap-3'):
 
             with ui.row().classes('items-center gap-3 flex-1 overflow-hidden'):
-                with ui.element('div').classes(
-                    f'''
-                    w-10 h-10 sm:w-12 sm:h-12 rounded-xl {icon_bg}
-                    flex items-center justify-center border border-black/5 shrink-0
-                    '''
-                ):
-                    ui.icon(icon_name).classes('text-[22px]')
+                icon_box = ui.element('div').classes(f"{icon_base} {style['icon_bg']}")
+                with icon_box:
+                    icon = ui.icon(style['icon_name']).classes('text-[22px]')
 
                 with ui.column().classes('gap-1 min-w-0'):
                     ui.label(device_id).classes(
@@ -66,25 +66,43 @@ def render_device_card(device_id):
                     
                     with ui.row().classes('items-center gap-1.5'):
                         ui.icon('hub').classes('text-[10px] text-slate-400') 
-                        ui.label(ip).classes('text-[11px] text-slate-500 font-mono leading-none')
+                        ip_label = ui.label(status['ip']).classes('text-[11px] text-slate-500 font-mono leading-none')
 
-                    with ui.element('div').classes(
-                        f'''
-                        px-2 py-0.5 rounded-md text-[10px] mt-0.5
-                        font-bold uppercase tracking-wider w-fit {badge_class}
-                        '''
-                    ):
-                        ui.label(status_label)
+                    badge = ui.element('div').classes(f"{badge_base} {style['badge_class']}")
+                    with badge:
+                        badge_label = ui.label(style['status_label'])
 
             with ui.row().classes('items-center gap-2 shrink-0'):
-                if not is_online:
-                    ui.label(format_last_seen(last_seen)).classes(
-                        'text-[11px] font-mono font-medium text-slate-500'
-                    )
-
-                ui.element('div').classes(
-                    f'w-2.5 h-2.5 rounded-full ring-2 ring-white {dot_class}'
+                last_seen_label = ui.label(format_last_seen(status['last_seen'])).classes(
+                    'text-[11px] font-mono font-medium text-slate-500'
                 )
+                last_seen_label.set_visibility(not is_online)
+
+                dot = ui.element('div').classes(f"{dot_base} {style['dot_class']}")
+
+    current = {'online': is_online}
+
+    def update(new_status):
+        ip_label.set_text(new_status['ip'])
+        last_seen_label.set_text(format_last_seen(new_status['last_seen']))
+
+        online = (new_status['status'] == 'online')
+        if online == current['online']:
+            return
+        current['online'] = online
+
+        new_style = get_card_style(online)
+        card.classes(replace=f"{card_base} {new_style['border_class']}")
+        icon_box.classes(replace=f"{icon_base} {new_style['icon_bg']}")
+        icon.set_name(new_style['icon_name'])
+        badge.classes(replace=f"{badge_base} {new_style['badge_class']}")
+        badge_label.set_text(new_style['status_label'])
+        dot.classes(replace=f"{dot_base} {new_style['dot_class']}")
+        last_seen_label.set_visibility(not online)
+
+    return update
+
+
 @ui.page('/')
 def dashboard():
     app.add_static_files('/assets', 'assets')
@@ -131,10 +149,22 @@ def dashboard():
                     'text-[10px] font-bold text-slate-400 uppercase tracking-widest'
                 )
 
-    # CONTENT
-    with ui.column().classes(
-        'w-full max-w-7xl mx-auto px-3 sm:px-6 pt-3 pb-6 gap-6'
-    ):
+        with ui.row().classes('items-center gap-1'):
+            ui.button('WALL', icon='grid_view', on_click=lambda: ui.navigate.to('/wall')) \
+                .props('flat dense no-caps color=white') \
+                .classes('text-xs font-bold')
+            ui.button('FLEET', icon='settings_remote', on_click=lambda: ui.navigate.to('/admin/fleet')) \
+                .props('flat dense no-caps color=white') \
+                .classes('text-xs font-bold')
+            ui.button('DIAG', icon='monitor_heart', on_click=lambda: ui.navigate.to('/admin/diagnostics')) \
+                .props('flat dense no-caps color=white') \
+                .classes('text-xs font-bold')
+
+    card_updaters = {}   # Map: { device_id: update(status) }
+
+    @ui.refreshable
+    def render_lines():
+        card_updaters.clear()
         lines = factory_manager.get_all_lines()
 
         if not lines:
@@ -199,8 +229,13 @@ def dashboard():
                             'w-full grid-cols-1 md:grid-cols-2 lg:grid-cols-3 gap-4'
                         ):
                             for dev_id in devices:
-                                render_device_card(dev_id)
-        
+                                card_updaters[dev_id] = render_device_card(dev_id)
+
+    # CONTENT
+    with ui.column().classes(
+        'w-full max-w-7xl mx-auto px-3 sm:px-6 pt-3 pb-6 gap-6'
+    ):
+        render_lines()
 
     with ui.footer().classes(
         'bg-[#0B1120]/80 backdrop-blur-md h-10 w-full flex items-center justify-center border-t border-white/5'
@@ -213,4 +248,19 @@ def dashboard():
             with ui.row().classes('items-center gap-1.5'):
                 ui.label('KOUKI BUILD').classes('text-[10px] font-bold text-slate-500 leading-none')
 
-        
+    def on_status(status):
+        update = card_updaters.get(status['device_id'])
+        if update:
+            update(status)
+
+    def on_factory_change(diff):
+        render_lines.refresh()
+
+    device_socket_manager.add_status_listener(on_status)
+    factory_manager.add_listener(on_factory_change)
+
+    def cleanup():
+        device_socket_manager.remove_status_listener(on_status)
+        factory_manager.remove_listener(on_factory_change)
+
+    context.client.on_delete(cleanup)
@@ -1,9 +1,16 @@
 from nicegui import ui, context, app
-from src.core.device_socket_manager import device_socket_manager
+from src.core.device_socket_manager import device_socket_manager, DeviceOfflineError
+from src.core.config_coalescer import config_coalescer
+from src.core.telemetry_store import telemetry_store
+from src.core.clip_recorder import clip_recorder
+from src.utils.auth import is_admin_password, is_operator_password
+from datetime import datetime
 import asyncio
 import time
 
-async def send_command(device_id, cmd, payload=None, target_client=None):
+CONFIG_FETCH_TIMEOUT = 3.0
+
+async def send_command(device_id, cmd, payload=None, target_client=None, coalesce=False):
     client = target_client
     if client is None:
         try:
@@ -11,7 +18,15 @@ async def send_command(device_id, cmd, payload=None, target_client=None):
         except RuntimeError:
             client = None
 
-    success = await device_socket_manager.send_command(device_id, cmd, payload)
+    if coalesce and cmd == 'update_config':
+        future, is_new_batch = config_coalescer.submit(device_id, payload or {})
+        if not is_new_batch:
+            return True
+        success = await future
+    else:
+        # Pending slider updates go out first so commands keep the order they were issued in.
+        await config_coalescer.flush(device_id)
+        success = await device_socket_manager.send_command(device_id, cmd, payload)
     
     if client:
         with client: 
@@ -23,6 +38,9 @@ async def send_command(device_id, cmd, payload=None, target_client=None):
     
     return success
 
+def send_config(device_id, updates):
+    return send_command(device_id, 'update_config', updates, coalesce=True)
+
 ui.add_head_html('''
     <meta name="viewport" content="width=device-width, initial-scale=1.0, maximum-scale=1.0, user-scalable=no">
     
@@ -51,10 +69,15 @@ async def check_and_open_config(device_id):
         return
 
     current_client = context.client
-    
-    fetch_task = asyncio.create_task(
-        send_command(device_id, cmd='get_config', target_client=current_client)
-    )
+
+    async def fetch_config():
+        try:
+            await device_socket_manager.request_config(device_id, timeout=CONFIG_FETCH_TIMEOUT)
+            return True
+        except (asyncio.TimeoutError, DeviceOfflineError):
+            return False
+
+    fetch_task = asyncio.create_task(fetch_config())
     
     with ui.dialog() as pwd_dialog, ui.card().classes('w-80 p-6 rounded-xl shadow-xl'):
         ui.label('Xác thực quyền truy cập').classes('text-lg font-bold text-slate-800 mb-1')
@@ -66,14 +89,14 @@ async def check_and_open_config(device_id):
         async def on_submit():
             val = pwd_input.value
             
-            if val == '1' or val == 'admin':
+            is_admin_mode = is_admin_password(val)
+            if is_admin_mode or is_operator_password(val):
                 pwd_dialog.close()
                 
-                is_admin_mode = (val == 'admin')
-                
                 n = ui.notification('Đang đồng bộ dữ liệu...', spinner=True, timeout=None)
                 try:
-                    await fetch_task 
+                    if not await fetch_task:
+                        ui.notify('Không nhận được cấu hình mới, hiển thị dữ liệu gần nhất.', type='warning', position='top')
                     render_config_modal(device_id, current_client, is_admin=is_admin_mode)
                     
                 finally:
@@ -136,7 +159,7 @@ def render_config_modal(device_id, client, is_admin=False):
                                     ui.label('Thời gian nhắm mắt').classes('text-xs font-bold text-slate-500 uppercase')
                                     drowsy_label = ui.label().classes('text-sm font-bold text-green-600')
                                 s_drowsy = ui.slider(min=0.5, max=5.0, step=0.1, value=conf.get('drowsy_time_threshold', 1.5)) \
-                                    .on('update:model-value', lambda e: send_command(device_id, 'update_config', {'drowsy_time_threshold': e.args}))
+                                    .on('update:model-value', lambda e: send_config(device_id, {'drowsy_time_threshold': e.args}))
                                 drowsy_label.bind_text_from(s_drowsy, 'value', backward=lambda v: f'{v:.1f}s')
                             
                             with ui.column().classes('w-full bg-white p-4 rounded-xl border shadow-sm gap-4'):
@@ -150,7 +173,7 @@ def render_config_modal(device_id, client, is_admin=False):
                                             1: 'Tắt thủ công'
                                         }, 
                                         value=conf.get('alert_mode', 0),
-                                        on_change=lambda e: send_command(device_id, 'update_config', {'alert_mode': e.value})
+                                        on_change=lambda e: send_config(device_id, {'alert_mode': e.value})
                                     ).props('outlined bg-white dense behavior=menu').classes('w-full')
 
                                 ui.separator()
@@ -161,7 +184,7 @@ def render_config_modal(device_id, client, is_admin=False):
                                         alert_label = ui.label().classes('text-sm font-bold text-orange-600')
                                     
                                     s_alert = ui.slider(min=1.0, max=15.0, step=0.5, value=conf.get('alert_time', 3.0)) \
-                                        .on('update:model-value', lambda e: send_command(device_id, 'update_config', {'alert_time': e.args}))
+                                        .on('update:model-value', lambda e: send_config(device_id, {'alert_time': e.args}))
                                     
                                     alert_label.bind_text_from(s_alert, 'value', backward=lambda v: f'{v:.1f}s')
 
@@ -177,7 +200,7 @@ def render_config_modal(device_id, client, is_admin=False):
                                         ui.label('Sử dụng vùng cắt (Crop)').classes('text-sm font-bold text-slate-700')
                                         ui.label(f'Res: {max_w}x{max_h}').classes('text-[10px] text-slate-400')
                                     ui.switch(value=conf.get('crop_enabled', True),
-                                            on_change=lambda e: send_command(device_id, 'update_config', {'crop_enabled': e.value}))
+                                            on_change=lambda e: send_config(device_id, {'crop_enabled': e.value}))
                                 
                                 with ui.column().classes('w-full bg-white p-4 rounded-xl border shadow-sm gap-4'):
                                     def crop_slider(label, key, max_val, color):
@@ -187,7 +210,7 @@ def render_config_modal(device_id, client, is_admin=False):
                                                 val_lbl = ui.label().classes(f'text-xs font-bold text-{color}-600')
                                             sl = ui.slider(min=0, max=max_val, step=10, value=conf.get(key, 0)) \
                                                 .props(f'color={color}') \
-                                                .on('update:model-value', lambda e, k=key: send_command(device_id, 'update_config', {k: int(e.args)}))
+                                                .on('update:model-value', lambda e, k=key: send_config(device_id, {k: int(e.args)}))
                                             val_lbl.bind_text_from(sl, 'value', backward=lambda v: f'{int(v)} px')
 
                                     crop_slider('Tọa độ X', 'crop_x', max_w, 'blue')
@@ -205,7 +228,7 @@ def render_config_modal(device_id, client, is_admin=False):
                                         ui.label('Ngưỡng YOLO').classes('text-xs font-medium text-slate-500')
                                         det_lbl = ui.label().classes('text-xs font-bold text-blue-600')
                                     s_det = ui.slider(min=0.1, max=1.0, step=0.01, value=conf.get('det_conf_threshold', 0.5)) \
-                                        .on('update:model-value', lambda e: send_command(device_id, 'update_config', {'det_conf_threshold': e.args}))
+                                        .on('update:model-value', lambda e: send_config(device_id, {'det_conf_threshold': e.args}))
                                     det_lbl.bind_text_from(s_det, 'value', backward=lambda v: f'{int(v*100)}%')
 
                                     with ui.row().classes('w-full justify-between items-center mt-2'):
@@ -213,7 +236,7 @@ def render_config_modal(device_id, client, is_admin=False):
                                         cls_lbl = ui.label().classes('text-xs font-bold text-orange-600')
                                     s_cls = ui.slider(min=0.01, max=1.0, step=0.01, value=conf.get('cls_threshold', 0.2)) \
                                         .props('color=orange') \
-                                        .on('update:model-value', lambda e: send_command(device_id, 'update_config', {'cls_threshold': e.args}))
+                                        .on('update:model-value', lambda e: send_config(device_id, {'cls_threshold': e.args}))
                                     cls_lbl.bind_text_from(s_cls, 'value', backward=lambda v: f'{int(v*100)}%')
 
                                     with ui.row().classes('w-full justify-between items-center mt-2'):
@@ -221,14 +244,14 @@ def render_config_modal(device_id, client, is_admin=False):
                                         fps_lbl = ui.label().classes('text-xs font-bold text-purple-600')
                                     s_fps = ui.slider(min=5, max=30, step=1, value=conf.get('frame_rate', 15)) \
                                         .props('color=purple') \
-                                        .on('update:model-value', lambda e: send_command(device_id, 'update_config', {'frame_rate': int(e.args)}))
+                                        .on('update:model-value', lambda e: send_config(device_id, {'frame_rate': int(e.args)}))
                                     fps_lbl.bind_text_from(s_fps, 'value', backward=lambda v: f'{int(v)} FPS')
 
                                 with ui.column().classes('w-full bg-white p-4 rounded-xl border shadow-sm gap-2'):
                                     ui.label('Logic cảnh báo').classes('text-sm font-bold text-slate-700')
                                     ui.select({0: 'Cả 2 mắt cùng đóng', 1: 'Chỉ cần 1 mắt đóng'}, 
                                         value=conf.get('logic_mode', 0), 
-                                        on_change=lambda e: send_command(device_id, 'update_config', {'logic_mode': e.value})) \
+                                        on_change=lambda e: send_config(device_id, {'logic_mode': e.value})) \
                                     .props('outlined bg-white dense behavior=menu').classes('w-full')
                                 
                             # TAB DATA
@@ -240,9 +263,8 @@ def render_config_modal(device_id, client, is_admin=False):
 
                                     ui.switch(
                                         value=conf.get('data_collection_enabled', True),
-                                        on_change=lambda e: send_command(
+                                        on_change=lambda e: send_config(
                                             device_id,
-                                            'update_config',
                                             {'data_collection_enabled': e.value}
                                         )
                                     ).props('color=green')
@@ -263,9 +285,8 @@ def render_config_modal(device_id, client, is_admin=False):
                                     ).props('color=blue') \
                                     .on(
                                         'update:model-value',
-                                        lambda e: send_command(
+                                        lambda e: send_config(
                                             device_id,
-                                            'update_config',
                                             {'data_collection_interval': int(e.args)}
                                         )
                                     )
@@ -341,6 +362,15 @@ def render_config_modal(device_id, client, is_admin=False):
         
         dialog.open()
 
+def record_clip(device_id):
+    result = device_socket_manager.record_clip(device_id)
+    if result is None:
+        ui.notify(f"Không thể ghi clip: {device_id} offline hoặc đang bận.", type='negative', position='top')
+    elif isinstance(result, str):
+        ui.notify(f"🎥 Đang ghi {result} (trước và sau {int(clip_recorder.post_seconds)}s)", type='positive', position='top')
+    else:
+        ui.notify("🎥 Đã yêu cầu ghi clip", type='positive', position='top')
+
 async def check_and_reboot(device_id):
     device_data = device_socket_manager.device_data.get(device_id, {})
     if device_data.get('status') != 'online':
@@ -368,7 +398,7 @@ async def check_and_reboot(device_id):
         with ui.row().classes('w-full bg-slate-50 p-4 justify-between items-center border-t border-slate-100 mt-4'):
             
             async def on_submit():
-                if pwd_input.value == 'admin': 
+                if is_admin_password(pwd_input.value):
                     pwd_dialog.close()
                     ui.notify(f'🚀 Đang gửi lệnh REBOOT tới {device_id}...', type='warning', position='top')
                     await send_command(device_id, cmd='reboot')
@@ -390,6 +420,61 @@ async def check_and_reboot(device_id):
     pwd_dialog.open()
 
 
+TREND_WINDOWS = {60: '1 giờ', 24 * 60: '24 giờ', 7 * 24 * 60: '7 ngày'}
+# Counters are charted as a per-second rate instead of avg/min/max of the recorded values.
+COUNTER_METRICS = {'server_frames'}
+
+async def open_trends(device_id):
+    metrics = await asyncio.to_thread(telemetry_store.get_metrics, device_id)
+    if not metrics:
+        ui.notify(f"Chưa có dữ liệu telemetry cho {device_id}", type='warning', position='top')
+        return
+
+    with ui.dialog() as dialog, ui.card().classes('w-full max-w-3xl p-4 rounded-xl gap-3'):
+        with ui.row().classes('w-full items-center justify-between'):
+            ui.label(f'Xu hướng · {device_id}').classes('text-lg font-bold text-slate-800')
+            ui.button(icon='close', on_click=dialog.close).props('flat round dense color=slate-500')
+
+        with ui.row().classes('w-full gap-3'):
+            metric_select = ui.select(metrics, value='server_frames' if 'server_frames' in metrics else metrics[0]) \
+                .props('outlined dense').classes('flex-1')
+            window_toggle = ui.toggle(TREND_WINDOWS, value=60).props('unelevated no-caps toggle-color=primary')
+
+        chart = ui.echart({
+            'tooltip': {'trigger': 'axis'},
+            'legend': {'data': ['avg', 'min', 'max']},
+            'xAxis': {'type': 'category', 'data': []},
+            'yAxis': {'type': 'value'},
+            'series': [
+                {'name': 'avg', 'type': 'line', 'showSymbol': False, 'data': []},
+                {'name': 'min', 'type': 'line', 'showSymbol': False, 'lineStyle': {'type': 'dashed'}, 'data': []},
+                {'name': 'max', 'type': 'line', 'showSymbol': False, 'lineStyle': {'type': 'dashed'}, 'data': []},
+            ],
+        }).classes('w-full h-72')
+        caption = ui.label().classes('text-[10px] font-mono text-slate-400')
+
+    async def load():
+        minutes = window_toggle.value
+        end = time.time()
+        series = await asyncio.to_thread(telemetry_store.query, device_id, metric_select.value, end - minutes * 60, end)
+        points = series['points']
+        fmt = '%H:%M:%S' if series['resolution'] < 60 else '%m-%d %H:%M'
+        chart.options['xAxis']['data'] = [datetime.fromtimestamp(p['t']).strftime(fmt) for p in points]
+        if metric_select.value in COUNTER_METRICS:
+            chart.options['series'][0]['data'] = [round(p['sum'] / series['resolution'], 2) for p in points]
+            chart.options['series'][1]['data'] = chart.options['series'][2]['data'] = []
+        else:
+            for i, key in enumerate(('avg', 'min', 'max')):
+                chart.options['series'][i]['data'] = [round(p[key], 2) for p in points]
+        chart.update()
+        caption.set_text(f"{len(points)} điểm · độ phân giải {series['resolution']} s")
+
+    metric_select.on_value_change(load)
+    window_toggle.on_value_change(load)
+    dialog.open()
+    await load()
+
+
 @ui.page('/device/{device_id}')
 def device_detail_page(device_id: str):
     ui.colors(primary='#3b82f6', secondary='#64748b', accent='#f59e0b', positive='#10b981')
@@ -428,6 +513,7 @@ def device_detail_page(device_id: str):
                     }});
 
                     socket.emit("join_device", "{device_id}");
+                    let lastPaintAck = 0;
 
                     socket.on("video_frame", (data) => {{
                         if (data.device_id !== "{device_id}") return;
@@ -447,6 +533,21 @@ def device_detail_page(device_id: str):
                             // 3. Tạo đường dẫn ảo và gán vào ảnh
                             const url = URL.createObjectURL(blob);
                             imgElement.src = url;
+
+                            // 4. Đo độ trễ: gửi xác nhận vẽ (lấy mẫu ~1 lần/giây)
+                            const receivedAt = performance.now();
+                            if (data.seq !== undefined && receivedAt - lastPaintAck >= 1000) {{
+                                lastPaintAck = receivedAt;
+                                imgElement.decode().then(() => requestAnimationFrame(() => {{
+                                    socket.emit("frame_painted", {{
+                                        device_id: data.device_id,
+                                        seq: data.seq,
+                                        ts_capture: data.ts_capture,
+                                        ts_emit: data.ts_emit,
+                                        paint_ms: performance.now() - receivedAt
+                                    }});
+                                }})).catch(() => {{}});
+                            }}
                         }}
                     }});
 
@@ -486,4 +587,7 @@ def device_detail_page(device_id: str):
                 control_btn('history', 'Lịch sử', 'purple', lambda: ui.navigate.to(f'{device_id}/history'))
                 control_btn('notifications_off', 'Tắt Còi', 'red', 
                             lambda: send_command(device_id, 'update_config', {'alarm_status': False}))
+                control_btn('show_chart', 'Xu hướng', 'blue', lambda: open_trends(device_id))
+                if clip_recorder.enabled:
+                    control_btn('videocam', 'Ghi clip', 'red', lambda: record_clip(device_id))
                 control_btn('power_settings_new', 'Hệ thống', 'red', lambda: check_and_reboot(device_id))
\ No newline at end of file
@@ -0,0 +1,104 @@
+from nicegui import ui
+
+from src.core.latency_tracer import latency_tracer, STAGES
+from src.core.user_socket_manager import user_socket_manager
+from src.core.loop_watchdog import loop_watchdog
+
+REFRESH_INTERVAL = 2.0
+
+LATENCY_COLUMNS = [
+    {'name': 'device_id', 'label': 'Thiết bị', 'field': 'device_id', 'align': 'left', 'sortable': True},
+    {'name': 'stage', 'label': 'Giai đoạn', 'field': 'stage', 'align': 'left'},
+    {'name': 'count', 'label': 'Mẫu', 'field': 'count'},
+    {'name': 'p50', 'label': 'p50 (ms)', 'field': 'p50'},
+    {'name': 'p90', 'label': 'p90 (ms)', 'field': 'p90'},
+    {'name': 'p99', 'label': 'p99 (ms)', 'field': 'p99'},
+    {'name': 'max', 'label': 'max (ms)', 'field': 'max'},
+]
+
+FANOUT_COLUMNS = [
+    {'name': 'device_id', 'label': 'Thiết bị', 'field': 'device_id', 'align': 'left', 'sortable': True},
+    {'name': 'viewers', 'label': 'Người xem', 'field': 'viewers'},
+    {'name': 'sent', 'label': 'Đã gửi', 'field': 'sent'},
+    {'name': 'dropped', 'label': 'Bỏ qua', 'field': 'dropped'},
+]
+
+
+def latency_rows():
+    rows = []
+    for device_id, stages in latency_tracer.snapshot().items():
+        for stage in STAGES:
+            if stage in stages:
+                rows.append({'id': f'{device_id}/{stage}', 'device_id': device_id, 'stage': stage, **stages[stage]})
+    return rows
+
+
+def fanout_rows():
+    return [{'device_id': device_id, **stats} for device_id, stats in sorted(user_socket_manager.get_fanout_stats().items())]
+
+
+def render_offenders(report):
+    ui.label(f"Ngưỡng {report['threshold_ms']:.0f} ms · {report['stalls']} lần · tệ nhất {report['worst_ms']} ms") \
+        .classes('text-[11px] text-slate-400')
+    if not report['offenders']:
+        ui.label('Chưa ghi nhận lần chặn nào.').classes('text-xs text-slate-500 italic')
+        return
+
+    for offender in report['offenders']:
+        title = f"{offender['site']} — {offender['count']} lần, tổng {offender['total_ms']} ms, max {offender['max_ms']} ms"
+        with ui.expansion(title).props('dense').classes('w-full text-xs font-mono bg-slate-50 rounded-lg'):
+            ui.code('\n'.join(offender['stack']) or '(không lấy được stack)', language='text').classes('w-full text-[11px]')
+
+
+@ui.page('/admin/diagnostics')
+def diagnostics_page():
+    ui.colors(primary='#3b82f6')
+
+    with ui.column().classes('w-full max-w-6xl mx-auto p-4 gap-4'):
+        with ui.row().classes('w-full items-center justify-between'):
+            with ui.row().classes('items-center gap-3'):
+                ui.button(icon='arrow_back_ios_new', on_click=lambda: ui.navigate.to('/')) \
+                    .props('flat round dense color=slate-600')
+                with ui.column().classes('gap-0'):
+                    ui.label('Chẩn đoán hệ thống').classes('text-lg font-bold text-slate-800 leading-tight')
+                    ui.label('DIAGNOSTICS').classes('text-[10px] font-bold text-slate-400 tracking-widest')
+
+            ui.button('RESET', icon='restart_alt', on_click=lambda: (latency_tracer.reset(), refresh())) \
+                .props('flat dense no-caps color=slate-600').classes('text-xs font-bold')
+
+        with ui.card().classes('w-full p-4 rounded-xl border shadow-sm gap-2'):
+            ui.label('Độ trễ khung hình (camera → trình duyệt)').classes('text-sm font-bold text-slate-700')
+            ui.label('capture_* dùng đồng hồ của camera nên bao gồm cả độ lệch giờ. '
+                     'emit_to_ack gồm cả chiều về của xác nhận.').classes('text-[11px] text-slate-400')
+            latency_table = ui.table(columns=LATENCY_COLUMNS, rows=latency_rows(), row_key='id') \
+                .props('dense flat').classes('w-full')
+
+        with ui.card().classes('w-full p-4 rounded-xl border shadow-sm gap-2'):
+            ui.label('Phân phối khung hình tới người xem').classes('text-sm font-bold text-slate-700')
+            fanout_table = ui.table(columns=FANOUT_COLUMNS, rows=fanout_rows(), row_key='device_id') \
+                .props('dense flat').classes('w-full')
+
+        with ui.card().classes('w-full p-4 rounded-xl border shadow-sm gap-2'):
+            ui.label('Event loop bị chặn (watchdog)').classes('text-sm font-bold text-slate-700')
+            offenders_container = ui.column().classes('w-full gap-1')
+
+    shown = {'stalls': None}
+
+    def refresh_offenders():
+        report = loop_watchdog.get_report()
+        shown['stalls'] = report['stalls']
+        offenders_container.clear()
+        with offenders_container:
+            render_offenders(report)
+
+    def refresh():
+        latency_table.rows = latency_rows()
+        fanout_table.rows = fanout_rows()
+        latency_table.update()
+        fanout_table.update()
+        # Only rebuild on new stalls so open stack traces stay expanded.
+        if loop_watchdog.stats['stalls'] != shown['stalls']:
+            refresh_offenders()
+
+    refresh_offenders()
+    ui.timer(REFRESH_INTERVAL, refresh)
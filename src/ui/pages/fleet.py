@@ -0,0 +1,124 @@
+import json
+from nicegui import ui
+
+from src.core.factory_manager import factory_manager
+from src.core.fleet_manager import fleet_manager, FLEET_MAX_PARALLEL, FLEET_TIMEOUT
+from src.utils.auth import is_admin_password
+
+FLEET_COMMANDS = {
+    'update_config': 'update_config (cập nhật cấu hình)',
+    'get_config': 'get_config',
+    'resend_datalog': 'resend_datalog',
+    'upload_dataset': 'upload_dataset',
+    'reboot': 'reboot (khởi động lại)',
+}
+
+STATUS_COLORS = {
+    'acked': 'text-teal-700 bg-teal-50',
+    'offline': 'text-slate-500 bg-slate-100',
+    'timeout': 'text-orange-700 bg-orange-50',
+    'error': 'text-red-700 bg-red-50',
+}
+
+
+@ui.page('/admin/fleet')
+def fleet_page():
+    ui.colors(primary='#3b82f6')
+
+    lines = factory_manager.get_all_lines()
+    all_devices = [dev for info in lines.values() for dev in info.get('devices', [])]
+
+    with ui.column().classes('w-full max-w-5xl mx-auto p-4 gap-4'):
+        with ui.row().classes('w-full items-center gap-3'):
+            ui.button(icon='arrow_back_ios_new', on_click=lambda: ui.navigate.to('/')) \
+                .props('flat round dense color=slate-600')
+            with ui.column().classes('gap-0'):
+                ui.label('Điều khiển hàng loạt').classes('text-lg font-bold text-slate-800 leading-tight')
+                ui.label('FLEET COMMAND').classes('text-[10px] font-bold text-slate-400 tracking-widest')
+
+        with ui.card().classes('w-full p-4 rounded-xl border shadow-sm gap-3'):
+            ui.label('Phạm vi').classes('text-xs font-bold text-slate-500 uppercase')
+            scope = ui.toggle({'all': 'Toàn nhà máy', 'lines': 'Theo line', 'devices': 'Theo thiết bị'}, value='lines') \
+                .props('unelevated no-caps toggle-color=primary')
+
+            line_select = ui.select(list(lines.keys()), multiple=True, label='Lines') \
+                .props('outlined dense use-chips').classes('w-full')
+            line_select.bind_visibility_from(scope, 'value', backward=lambda v: v == 'lines')
+
+            device_select = ui.select(all_devices, multiple=True, label='Thiết bị') \
+                .props('outlined dense use-chips').classes('w-full')
+            device_select.bind_visibility_from(scope, 'value', backward=lambda v: v == 'devices')
+
+            ui.separator()
+
+            ui.label('Lệnh').classes('text-xs font-bold text-slate-500 uppercase')
+            command_select = ui.select(FLEET_COMMANDS, value='update_config').props('outlined dense behavior=menu').classes('w-full')
+            payload_input = ui.textarea('Payload (JSON)', value='{"alert_mode": 0}') \
+                .props('outlined dense autogrow input-class="font-mono text-xs"').classes('w-full')
+
+            with ui.row().classes('w-full gap-4'):
+                parallel_input = ui.number('Song song tối đa', value=FLEET_MAX_PARALLEL, min=1, max=64, step=1) \
+                    .props('outlined dense').classes('w-40')
+                timeout_input = ui.number('Timeout (s)', value=FLEET_TIMEOUT, min=0.5, max=60, step=0.5) \
+                    .props('outlined dense').classes('w-40')
+                pwd_input = ui.input('Mật khẩu admin', password=True).props('outlined dense').classes('w-48')
+
+            run_button = ui.button('GỬI LỆNH', icon='send').props('unelevated color=primary').classes('w-full py-2 font-bold')
+
+        summary_row = ui.row().classes('w-full gap-2')
+        results_container = ui.column().classes('w-full gap-1')
+
+    def render_results(rollout):
+        summary_row.clear()
+        with summary_row:
+            ui.label(f"{rollout['targets']} thiết bị · {rollout['duration_ms']} ms").classes('text-sm font-bold text-slate-700')
+            for status, count in rollout['summary'].items():
+                ui.label(f'{status}: {count}').classes(f"text-xs font-bold px-2 py-0.5 rounded-md {STATUS_COLORS.get(status, '')}")
+            if rollout['stragglers']:
+                ui.label(f"Chậm: {', '.join(rollout['stragglers'])}").classes('text-xs text-orange-600')
+
+        results_container.clear()
+        with results_container:
+            for r in rollout['results']:
+                with ui.row().classes('w-full items-center justify-between bg-white border rounded-lg px-3 py-2'):
+                    ui.label(r['device_id']).classes('text-sm font-mono font-bold text-slate-700')
+                    with ui.row().classes('items-center gap-3'):
+                        ui.label(f"{r['latency_ms']} ms").classes('text-xs font-mono text-slate-400')
+                        ui.label(r['status']).classes(f"text-xs font-bold px-2 py-0.5 rounded-md {STATUS_COLORS.get(r['status'], '')}")
+
+    async def run():
+        if not is_admin_password(pwd_input.value):
+            ui.notify('Sai mật khẩu!', type='negative')
+            return
+
+        payload = None
+        if payload_input.value and payload_input.value.strip():
+            try:
+                payload = json.loads(payload_input.value)
+            except json.JSONDecodeError as e:
+                ui.notify(f'Payload không hợp lệ: {e}', type='negative')
+                return
+
+        targets = fleet_manager.resolve_targets(
+            lines=line_select.value if scope.value == 'lines' else None,
+            devices=device_select.value if scope.value == 'devices' else None,
+            all_devices=scope.value == 'all'
+        )
+        if not targets:
+            ui.notify('Chưa chọn thiết bị nào.', type='warning')
+            return
+
+        run_button.disable()
+        n = ui.notification(f'Đang gửi tới {len(targets)} thiết bị...', spinner=True, timeout=None)
+        try:
+            rollout = await fleet_manager.dispatch(
+                targets, command_select.value, payload,
+                max_parallel=int(parallel_input.value or FLEET_MAX_PARALLEL),
+                timeout=float(timeout_input.value or FLEET_TIMEOUT)
+            )
+            render_results(rollout)
+        finally:
+            n.dismiss()
+            run_button.enable()
+
+    run_button.on_click(run)
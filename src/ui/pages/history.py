@@ -1,9 +1,9 @@
-import os
-import glob
 from datetime import datetime
 from nicegui import ui
 
-STORAGE_ROOT = 'server_storage'
+from src.core.media_index import media_index
+from src.utils.media_pairing import VideoMatcher
+from src.core.metrics import HISTORY_QUERY
 
 vn_locale = {
     'days': 'Chủ nhật_Thứ hai_Thứ ba_Thứ tư_Thứ năm_Thứ sáu_Thứ bảy'.split('_'),
@@ -16,84 +16,29 @@ vn_locale = {
 }
 
 def get_available_dates(device_id):
-    img_dir = os.path.join(STORAGE_ROOT, device_id, 'images')
-    if not os.path.exists(img_dir): return []
-    found_dates = set()
-    files = glob.glob(os.path.join(img_dir, "img_*.jpg"))
-    for f_path in files:
-        try:
-            fname = os.path.basename(f_path)
-            parts = fname.split('_') 
-            if len(parts) >= 2:
-                date_str = parts[1] 
-                fmt_date = f"{date_str[:4]}/{date_str[4:6]}/{date_str[6:]}"
-                found_dates.add(fmt_date)
-        except: continue
-    return list(found_dates)
+    return media_index.get_dates(device_id, 'images', prefix='img_', ext='.jpg')
 
 def get_data_for_date(device_id, date_obj):
     date_str_compact = date_obj.strftime("%Y%m%d")
-    img_dir = os.path.join(STORAGE_ROOT, device_id, 'images')
-    vid_dir = os.path.join(STORAGE_ROOT, device_id, 'videos')
-
 
     video_map = {} 
-    vid_pattern = os.path.join(vid_dir, f"evidence_{date_str_compact}_*.mp4")
-    for v_path in glob.glob(vid_pattern):
-        try:
-            fname = os.path.basename(v_path)
-            parts = fname.split('_')
-            if len(parts) >= 3:
-                time_str = parts[2].split('.')[0]
-                dt_vid = datetime.strptime(f"{date_str_compact}_{time_str}", "%Y%m%d_%H%M%S")
-                video_map[dt_vid] = f"/media/{device_id}/videos/{fname}"
-        except: continue
-
-    used_video_keys = set()
-    def find_matching_video(img_dt):
-        best_url = None
-        best_vid_dt = None  
-        min_diff = 60.0
-        
-        for vid_dt, url in video_map.items():
-            if vid_dt in used_video_keys:
-                continue
-
-            diff = (vid_dt - img_dt).total_seconds()
-
-            if 0 <= diff < min_diff:
-                min_diff = diff
-                best_url = url
-                best_vid_dt = vid_dt 
-                
-        if best_vid_dt is not None:
-            used_video_keys.add(best_vid_dt)
-                
-        return best_url
+    for fname, dt_vid in media_index.get_files(device_id, 'videos', date_str_compact, prefix='evidence_', ext='.mp4'):
+        video_map[dt_vid] = f"/media/{device_id}/videos/{fname}"
 
+    video_matcher = VideoMatcher(video_map, window=60.0)
 
     grouped_slots = {i: [] for i in range(12)}
-    img_pattern = os.path.join(img_dir, f"img_{date_str_compact}_*.jpg")
-    img_files = sorted(glob.glob(img_pattern)) 
 
-    for f_path in img_files:
-        try:
-            fname = os.path.basename(f_path)
-            parts = fname.split('_')
-            if len(parts) < 3: continue
-            time_part = parts[2]
-    
-            dt = datetime.strptime(f"{date_str_compact}_{time_part}", "%Y%m%d_%H%M%S")
-            
-            slot_idx = dt.hour // 2
-            
-            grouped_slots[slot_idx].append({
-                'image_url': f"/media/{device_id}/images/{fname}",
-                'video_url': find_matching_video(dt), 
-                'display_time': dt.strftime("%H:%M:%S"),
-                'raw_dt': dt
-            })
-        except: continue
+    for fname, dt in media_index.get_files(device_id, 'images', date_str_compact, prefix='img_', ext='.jpg'):
+        slot_idx = dt.hour // 2
+        
+        grouped_slots[slot_idx].append({
+            'image_url': f"/media/{device_id}/images/{fname}",
+            'thumb_url': f"/api/thumbnail/{device_id}/{fname}",
+            'video_url': video_matcher.match(dt), 
+            'display_time': dt.strftime("%H:%M:%S"),
+            'raw_dt': dt
+        })
         
     return grouped_slots
 
@@ -117,7 +62,8 @@ def history_page(device_id: str):
         'data': {},
         'current_date': datetime.now().strftime("%Y/%m/%d")
     }
-    available_dates = get_available_dates(device_id)
+    with HISTORY_QUERY.labels('history', 'dates').time():
+        available_dates = get_available_dates(device_id)
 
     with ui.element('div').classes('w-full min-h-screen flex flex-col md:flex-row bg-slate-900'):
         
@@ -197,7 +143,7 @@ def history_page(device_id: str):
             for item in items:
                 with ui.element('div').classes('history-card group cursor-pointer aspect-video relative hover:ring-2 ring-blue-500 transition-all'):
                     
-                    img = ui.image(item['image_url']).classes('w-full h-full object-cover')
+                    img = ui.image(item['thumb_url']).classes('w-full h-full object-cover')
                     img.on('click', lambda _, i=item: show_media(i, 'image'))
 
                     if item['video_url']:
@@ -249,7 +195,8 @@ def history_page(device_id: str):
             
             lbl_date_display.set_text(d_obj.strftime("%d/%m/%Y"))
             
-            data = get_data_for_date(device_id, d_obj)
+            with HISTORY_QUERY.labels('history', 'day').time():
+                data = get_data_for_date(device_id, d_obj)
             state['data'] = data
             
             total = sum(len(items) for items in data.values())
@@ -0,0 +1,144 @@
+import json
+import math
+from nicegui import ui
+
+from src.core.factory_manager import factory_manager
+from src.core.device_socket_manager import device_socket_manager
+from src.core.stream_variants import normalize_variant
+
+WALL_FPS_OPTIONS = (1, 2, 5, 10)
+DEFAULT_WALL_FPS = 2
+
+
+def get_wall_devices(line_id=None):
+    lines = factory_manager.get_all_lines()
+    if line_id:
+        lines = {line_id: lines.get(line_id, {})}
+
+    devices = []
+    for l_id, info in lines.items():
+        for dev_id in info.get('devices', []):
+            devices.append((l_id, dev_id))
+    return devices
+
+
+@ui.page('/wall')
+def wall_page(line: str = None, fps: float = 2, variant: str = 'sub'):
+    ui.add_head_html('''
+        <style>
+            body { background-color: #020617; margin: 0; padding: 0; }
+            .wall-tile { background: #000; border: 1px solid #1e293b; border-radius: 8px; overflow: hidden; position: relative; }
+            .wall-tile img { width: 100%; height: 100%; object-fit: contain; display: block; }
+        </style>
+    ''')
+
+    # Query parameters come straight from the URL: keep them to values the selects and the stream accept.
+    fps = min(max(fps, WALL_FPS_OPTIONS[0]), WALL_FPS_OPTIONS[-1]) if math.isfinite(fps) and fps > 0 else DEFAULT_WALL_FPS
+    variant = normalize_variant(variant)
+
+    devices = get_wall_devices(line)
+    state = {'fps': fps, 'variant': variant}
+
+    with ui.header().classes('bg-slate-900/90 backdrop-blur-md text-white h-14 px-4 flex items-center justify-between border-b border-white/10'):
+        with ui.row().classes('items-center gap-3'):
+            ui.button(icon='arrow_back', on_click=lambda: ui.navigate.to('/')).props('flat round dense color=white')
+            with ui.column().classes('gap-0'):
+                ui.label('CAMERA WALL').classes('text-sm font-extrabold tracking-tight leading-none')
+                ui.label(f'{line or "ALL LINES"} · {len(devices)} CAMS').classes('text-[10px] font-bold text-slate-400 uppercase tracking-widest')
+
+        with ui.row().classes('items-center gap-2'):
+            ui.select({n: f'{n} FPS' for n in WALL_FPS_OPTIONS},
+                      value=int(fps) if int(fps) in WALL_FPS_OPTIONS else DEFAULT_WALL_FPS,
+                      on_change=lambda e: apply_settings(fps=e.value)) \
+                .props('dense dark outlined options-dense behavior=menu').classes('w-24')
+            ui.select({'sub': 'Low (320p)', 'mid': 'Medium (480p)', 'main': 'Full'}, value=variant,
+                      on_change=lambda e: apply_settings(variant=e.value)) \
+                .props('dense dark outlined options-dense behavior=menu').classes('w-36')
+
+    with ui.element('div').classes('w-full grid grid-cols-1 sm:grid-cols-2 lg:grid-cols-3 2xl:grid-cols-4 gap-2 p-2'):
+        if not devices:
+            ui.label('No devices assigned').classes('col-span-full text-center text-slate-500 italic py-10')
+
+        for line_id, dev_id in devices:
+            is_online = device_socket_manager.device_data.get(dev_id, {}).get('status') == 'online'
+            with ui.element('div').classes('wall-tile aspect-video cursor-pointer') \
+                    .on('click', lambda _, d=dev_id: ui.navigate.to(f'/device/{d}')):
+                ui.html(f'<img data-wall-img="{dev_id}"/>', sanitize=False).classes('w-full h-full')
+                with ui.row().classes('absolute top-0 left-0 w-full p-1.5 justify-between items-center bg-gradient-to-b from-black/80 to-transparent pointer-events-none'):
+                    ui.label(dev_id).classes('text-[11px] font-bold text-white font-mono')
+                    ui.label(line_id).classes('text-[9px] font-bold text-slate-300 uppercase')
+                ui.element('div').classes(
+                    f'absolute top-2 right-2 w-2 h-2 rounded-full {"bg-teal-500" if is_online else "bg-red-500"}'
+                )
+
+    def apply_settings(**changes):
+        state.update(changes)
+        ui.run_javascript(f'window.qaiWall && window.qaiWall.configure({json.dumps(state)});')
+
+    ui.run_javascript(f"""
+        (() => {{
+            if (window.qaiWall) window.qaiWall.destroy();
+
+            let settings = {json.dumps(state)};
+            const tiles = {{}};
+            const socket = io("/", {{
+                path: "/socket.io/user",
+                transports: ['websocket', 'polling']
+            }});
+
+            const subscribe = (id) => socket.emit("join_device", {{
+                device_id: id, variant: settings.variant, max_fps: settings.fps
+            }});
+
+            const tileIds = new Map();
+            document.querySelectorAll("[data-wall-img]").forEach((img) => {{
+                const id = img.dataset.wallImg;
+                tiles[id] = {{ img: img, visible: false, last: 0 }};
+                tileIds.set(img.closest(".wall-tile"), id);
+            }});
+
+            // Only tiles on screen are subscribed; scrolled-away tiles cost nothing server-side.
+            const observer = new IntersectionObserver((entries) => {{
+                entries.forEach((entry) => {{
+                    const id = tileIds.get(entry.target);
+                    const tile = tiles[id];
+                    if (!tile || tile.visible === entry.isIntersecting) return;
+                    tile.visible = entry.isIntersecting;
+                    if (document.hidden) return;
+                    if (tile.visible) subscribe(id);
+                    else socket.emit("leave_device", id);
+                }});
+            }}, {{ threshold: 0.1 }});
+            tileIds.forEach((_, el) => observer.observe(el));
+
+            const resubscribeAll = () => {{
+                Object.entries(tiles).forEach(([id, tile]) => {{
+                    if (tile.visible && !document.hidden) subscribe(id);
+                    else socket.emit("leave_device", id);
+                }});
+            }};
+            document.addEventListener("visibilitychange", resubscribeAll);
+            socket.on("connect", resubscribeAll);
+
+            socket.on("video_frame", (data) => {{
+                const tile = tiles[data.device_id];
+                if (!tile || !tile.visible) return;
+
+                const now = performance.now();
+                if (now - tile.last < 1000 / settings.fps * 0.8) return;
+                tile.last = now;
+
+                if (tile.img.src.startsWith("blob:")) URL.revokeObjectURL(tile.img.src);
+                tile.img.src = URL.createObjectURL(new Blob([data.image], {{ type: 'image/jpeg' }}));
+            }});
+
+            window.qaiWall = {{
+                configure: (next) => {{ settings = next; resubscribeAll(); }},
+                destroy: () => {{
+                    observer.disconnect();
+                    document.removeEventListener("visibilitychange", resubscribeAll);
+                    socket.disconnect();
+                }}
+            }};
+        }})();
+    """)
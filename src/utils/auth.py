@@ -0,0 +1,26 @@
+import os
+import hmac
+
+from fastapi import Header, HTTPException
+
+# Shared by the admin pages and the admin APIs under them.
+ADMIN_PASSWORD = os.environ.get('QAI_ADMIN_PASSWORD', 'admin')
+# Device page only: opens the config modal without the admin-only settings.
+OPERATOR_PASSWORD = os.environ.get('QAI_OPERATOR_PASSWORD', '1')
+
+
+def _matches(value, password):
+    return hmac.compare_digest((value or '').encode('utf-8'), password.encode('utf-8'))
+
+
+def is_admin_password(value):
+    return _matches(value, ADMIN_PASSWORD)
+
+
+def is_operator_password(value):
+    return _matches(value, OPERATOR_PASSWORD)
+
+
+async def require_admin(x_admin_password: str = Header(None)):
+    if not is_admin_password(x_admin_password):
+        raise HTTPException(status_code=401, detail="Admin password required (X-Admin-Password)")
@@ -27,7 +27,7 @@ class ColoredFormatter(logging.Formatter):
 
 def setup_logger(log_dir="logs", level=logging.INFO):
     if not os.path.exists(log_dir):
-        os.makedirs(log_dir)
+        os.makedirs(log_dir, exist_ok=True)
 
     root_logger = logging.getLogger()
     root_logger.setLevel(level)
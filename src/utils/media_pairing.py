@@ -0,0 +1,29 @@
+from bisect import bisect_left
+from datetime import timedelta
+
+
+# Pairs an image with the first unused video starting within `window` seconds after it.
+# Used videos are skipped through a path-compressed "next free index" table.
+class VideoMatcher:
+    def __init__(self, video_map, window):
+        self.times = sorted(video_map)
+        self.urls = [video_map[t] for t in self.times]
+        self.window = timedelta(seconds=window)
+        self._next_free = list(range(len(self.times) + 1))
+
+    def _find_free(self, idx):
+        root = idx
+        while self._next_free[root] != root:
+            root = self._next_free[root]
+        while self._next_free[idx] != root:
+            self._next_free[idx], idx = root, self._next_free[idx]
+        return root
+
+    def match(self, img_dt):
+        idx = self._find_free(bisect_left(self.times, img_dt))
+        if idx == len(self.times):
+            return None
+        if self.times[idx] - img_dt >= self.window:
+            return None
+        self._next_free[idx] = idx + 1
+        return self.urls[idx]
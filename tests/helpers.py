@@ -0,0 +1,16 @@
+import asyncio
+import os
+import tempfile
+
+
+async def wait_for(condition, timeout=2.0):
+    deadline = asyncio.get_running_loop().time() + timeout
+    while not condition():
+        if asyncio.get_running_loop().time() > deadline:
+            raise AssertionError("condition not met in time")
+        await asyncio.sleep(0.01)
+
+
+def socket_path():
+    # Unix socket paths are short (108 bytes), so stay out of pytest's deep tmp_path.
+    return os.path.join(tempfile.mkdtemp(prefix='qai'), 'broker.sock')
@@ -0,0 +1,197 @@
+import asyncio
+import time
+
+from src.core import cluster_sync as cs
+from src.core.cluster_sync import ClusterSync, DEVICES_KEY, INTEREST_KEY
+from src.core.state_broker import StateBroker
+from src.core.state_backend import BrokerBackend
+
+from tests.helpers import socket_path, wait_for
+
+
+class FakeSessions:
+    def __init__(self):
+        self.connected = set()
+
+    def is_connected(self, device_id):
+        return device_id in self.connected
+
+
+class FakeManager:
+    # Just the surface ClusterSync calls back into.
+    sio = None
+
+    def __init__(self):
+        self.sessions = FakeSessions()
+        self.statuses = []        # (device_id, record)
+        self.frames = []          # (device_id, image_bytes, meta)
+
+    def _apply_remote_status(self, device_id, record):
+        self.statuses.append((device_id, record))
+
+    def _apply_remote_frame(self, device_id, image_bytes, meta):
+        self.frames.append((device_id, image_bytes, meta))
+
+    def _apply_remote_telemetry(self, device_id, mode, data):
+        pass
+
+    def _resolve_command(self, request_id, result):
+        pass
+
+    def record_clip(self, device_id, reason):
+        pass
+
+
+async def make_worker(path, name):
+    backend = BrokerBackend(path, reconnect_delay=0.05)
+    await backend.start()
+    sync = ClusterSync(backend=backend, worker_id=f"otherhost:{name}:000000")
+    manager = FakeManager()
+    sync.bind(manager)
+    await sync.start()
+    return sync, manager
+
+
+def status(state='online'):
+    return {'status': state, 'last_seen': time.time(), 'ip': '10.0.0.1'}
+
+
+def test_ownership_handoff_ignores_late_offline():
+    async def scenario():
+        path = socket_path()
+        broker = StateBroker(path)
+        await broker.start()
+        a, _ = await make_worker(path, 'a')
+        b, _ = await make_worker(path, 'b')
+        viewer, manager = await make_worker(path, 'viewer')
+
+        a.publish_status('cam1', status(), sid='sid-a')
+        await wait_for(lambda: viewer.remote_sid('cam1') == 'sid-a')
+
+        # The device reconnects to worker b before a notices the old socket is gone.
+        b.publish_status('cam1', status(), sid='sid-b')
+        await wait_for(lambda: viewer.remote_sid('cam1') == 'sid-b')
+        a.publish_status('cam1', status('offline'))
+        b.publish_status('cam2', status(), sid='sid-b2')
+        await wait_for(lambda: viewer.remote_sid('cam2') == 'sid-b2')
+
+        assert viewer.remote_sid('cam1') == 'sid-b'
+        assert [r['status'] for d, r in manager.statuses if d == 'cam1'] == ['online', 'online']
+        await broker.close()
+
+    asyncio.run(scenario())
+
+
+def test_owner_crash_marks_devices_offline():
+    async def scenario():
+        path = socket_path()
+        broker = StateBroker(path)
+        await broker.start()
+        a, _ = await make_worker(path, 'a')
+        viewer, manager = await make_worker(path, 'viewer')
+
+        a.publish_status('cam1', status(), sid='sid-a')
+        await wait_for(lambda: viewer.remote_sid('cam1') == 'sid-a')
+        await a.backend.close()
+        await wait_for(lambda: viewer.remote_sid('cam1') is None)
+
+        assert manager.statuses[-1][1]['status'] == 'offline'
+        assert await viewer.backend.hgetall(DEVICES_KEY) == {}
+        await broker.close()
+
+    asyncio.run(scenario())
+
+
+def test_frames_follow_interest():
+    async def scenario():
+        path = socket_path()
+        broker = StateBroker(path)
+        await broker.start()
+        owner, _ = await make_worker(path, 'owner')
+        viewer, manager = await make_worker(path, 'viewer')
+
+        owner.publish_frame('cam1', b'jpeg-0', {'ts': 0})
+        viewer.acquire('cam1')
+        await wait_for(lambda: owner.remote_interest.get('cam1'))
+        owner.publish_frame('cam1', b'jpeg-1', {'ts': 1})
+        await wait_for(lambda: manager.frames)
+        viewer.release('cam1')
+        await wait_for(lambda: 'cam1' not in owner.remote_interest)
+
+        assert manager.frames == [('cam1', b'jpeg-1', {'ts': 1})]
+        assert owner.stats['frames_out'] == 1
+        await broker.close()
+
+    asyncio.run(scenario())
+
+
+def test_stale_interest_is_dropped():
+    async def scenario():
+        path = socket_path()
+        broker = StateBroker(path)
+        await broker.start()
+        owner, _ = await make_worker(path, 'owner')
+        viewer, _ = await make_worker(path, 'viewer')
+
+        viewer.acquire('cam1')
+        await wait_for(lambda: owner.remote_interest.get('cam1'))
+        # The viewer stops refreshing (hung, or its ephemeral field outlived it on Redis).
+        viewer._announce_interest = lambda device_id: None
+        owner.refresh_interest(now=time.time() + cs.STALE_INTEREST_AGE + 1)
+
+        assert 'cam1' not in owner.remote_interest
+        assert owner.stats['stale_interest'] == 1
+        await broker.close()
+
+    asyncio.run(scenario())
+
+
+def test_start_skips_interest_left_by_dead_workers():
+    async def scenario():
+        path = socket_path()
+        broker = StateBroker(path)
+        await broker.start()
+        seed = BrokerBackend(path)
+        await seed.start()
+        # Non-ephemeral, as on a backend without connection-scoped fields.
+        seed.hset(INTEREST_KEY, 'cam1|deadhost:1:000000', time.time() - cs.STALE_INTEREST_AGE - 1)
+        seed.hset(INTEREST_KEY, 'cam2|livehost:1:000000', time.time())
+        await wait_for(lambda: len(broker.hashes.get(INTEREST_KEY, {})) == 2)
+
+        owner, _ = await make_worker(path, 'owner')
+        await wait_for(lambda: len(broker.hashes[INTEREST_KEY]) == 1)
+
+        assert list(owner.remote_interest) == ['cam2']
+        assert list(broker.hashes[INTEREST_KEY]) == ['cam2|livehost:1:000000']
+        await seed.close(); await broker.close()
+
+    asyncio.run(scenario())
+
+
+def test_records_of_a_silent_owner_go_offline():
+    async def scenario():
+        path = socket_path()
+        broker = StateBroker(path)
+        await broker.start()
+        owner, _ = await make_worker(path, 'owner')
+        viewer, manager = await make_worker(path, 'viewer')
+
+        owner.publish_status('cam1', status(), sid='sid-1')
+        await wait_for(lambda: viewer.remote_sid('cam1') == 'sid-1')
+
+        # Records are judged by when the owner last re-stamped them, not by device activity.
+        await asyncio.sleep(0.05)
+        owner.refresh_records()
+        await wait_for(lambda: broker.hashes[DEVICES_KEY]['cam1']['refreshed'] > viewer.remote_owner['cam1']['refreshed'])
+        refreshed = broker.hashes[DEVICES_KEY]['cam1']['refreshed']
+        await viewer.check_records(now=refreshed + cs.STALE_RECORD_AGE - 1)
+        assert viewer.remote_sid('cam1') == 'sid-1'
+
+        # An owner that stopped refreshing (its fields outliving it, as on Redis) goes offline.
+        await viewer.check_records(now=refreshed + cs.STALE_RECORD_AGE + 1)
+        assert viewer.remote_sid('cam1') is None
+        assert manager.statuses[-1][1]['status'] == 'offline'
+        assert viewer.stats['stale_records'] == 1
+        await broker.close()
+
+    asyncio.run(scenario())
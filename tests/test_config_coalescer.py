@@ -0,0 +1,78 @@
+import asyncio
+
+from src.core.config_coalescer import ConfigCoalescer
+
+
+class FakeSend:
+    def __init__(self, result=True):
+        self.calls = []           # (device_id, command, payload)
+        self.result = result
+
+    async def __call__(self, device_id, command, payload):
+        self.calls.append((device_id, command, dict(payload)))
+        if isinstance(self.result, Exception):
+            raise self.result
+        return self.result
+
+
+def test_updates_in_one_window_are_sent_once():
+    async def scenario():
+        send = FakeSend()
+        coalescer = ConfigCoalescer(send, window=0.05)
+
+        first, is_new = coalescer.submit('cam1', {'conf': 0.5})
+        assert is_new
+        second, is_new = coalescer.submit('cam1', {'conf': 0.6, 'iou': 0.4})
+        assert not is_new and second is first
+        other, _ = coalescer.submit('cam2', {'conf': 0.1})
+
+        assert await first is True and await other is True
+        assert sorted(send.calls) == [
+            ('cam1', 'update_config', {'conf': 0.6, 'iou': 0.4}),
+            ('cam2', 'update_config', {'conf': 0.1}),
+        ]
+        assert coalescer.stats == {'submitted': 3, 'sent': 2} and coalescer.saved == 1
+
+    asyncio.run(scenario())
+
+
+def test_flush_sends_now_and_cancels_the_timer():
+    async def scenario():
+        send = FakeSend()
+        coalescer = ConfigCoalescer(send, window=10.0)
+        future, _ = coalescer.submit('cam1', {'conf': 0.5})
+        timer = coalescer.pending['cam1']['timer']
+
+        assert await coalescer.flush('cam1') is True
+        assert future.result() is True
+        await asyncio.sleep(0)
+        assert timer.cancelled()
+        assert await coalescer.flush('cam1') is True    # Nothing pending
+        assert len(send.calls) == 1
+
+    asyncio.run(scenario())
+
+
+def test_next_window_starts_a_new_batch():
+    async def scenario():
+        send = FakeSend()
+        coalescer = ConfigCoalescer(send, window=0.02)
+        first, _ = coalescer.submit('cam1', {'conf': 0.5})
+        await first
+        second, is_new = coalescer.submit('cam1', {'conf': 0.7})
+
+        assert is_new and second is not first
+        await second
+        assert [payload for _, _, payload in send.calls] == [{'conf': 0.5}, {'conf': 0.7}]
+
+    asyncio.run(scenario())
+
+
+def test_send_failure_resolves_false():
+    async def scenario():
+        coalescer = ConfigCoalescer(FakeSend(RuntimeError("socket gone")), window=0.01)
+        future, _ = coalescer.submit('cam1', {'conf': 0.5})
+        assert await future is False
+        assert not coalescer.pending
+
+    asyncio.run(scenario())
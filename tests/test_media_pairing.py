@@ -0,0 +1,59 @@
+import random
+from datetime import datetime, timedelta
+
+from src.utils.media_pairing import VideoMatcher
+
+
+BASE = datetime(2026, 1, 1, 8, 0, 0)
+
+
+def old_matcher(video_map, window):
+    # The linear scan the history pages used before VideoMatcher.
+    used = set()
+
+    def match(img_dt):
+        best_url, best_dt, min_diff = None, None, window
+        for vid_dt, url in video_map.items():
+            if vid_dt in used:
+                continue
+            diff = (vid_dt - img_dt).total_seconds()
+            if 0 <= diff < min_diff:
+                min_diff, best_url, best_dt = diff, url, vid_dt
+        if best_dt is not None:
+            used.add(best_dt)
+        return best_url
+    return match
+
+
+def at(seconds):
+    return BASE + timedelta(seconds=seconds)
+
+
+def test_window_edges():
+    matcher = VideoMatcher({at(0): 'same', at(60): 'edge'}, window=60.0)
+
+    assert matcher.match(at(0)) == 'same'     # A video starting with the image counts
+    assert matcher.match(at(0)) is None       # 'edge' is exactly one window away: out
+    assert matcher.match(at(1)) == 'edge'
+    assert matcher.match(at(61)) is None      # Videos before the image never match
+
+
+def test_each_video_is_used_once():
+    matcher = VideoMatcher({at(10): 'a', at(20): 'b'}, window=60.0)
+
+    assert [matcher.match(at(0)) for _ in range(3)] == ['a', 'b', None]
+
+
+def test_empty():
+    assert VideoMatcher({}, window=60.0).match(BASE) is None
+
+
+def test_same_pairs_as_the_old_scan():
+    rng = random.Random(7)
+    for _ in range(200):
+        window = rng.choice((60.0, 120.0))
+        video_map = {at(rng.randrange(0, 900)): f"v{i}" for i in range(rng.randrange(0, 15))}
+        images = sorted(at(rng.randrange(0, 900)) for _ in range(rng.randrange(0, 25)))
+
+        new, old = VideoMatcher(video_map, window), old_matcher(video_map, window)
+        assert [new.match(dt) for dt in images] == [old(dt) for dt in images]
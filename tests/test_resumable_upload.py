@@ -0,0 +1,116 @@
+import asyncio
+import hashlib
+import json
+import os
+import time
+
+import pytest
+
+from src.core.resumable_upload_manager import ResumableUploadManager, UploadOffsetMismatch, UploadChecksumMismatch
+
+
+class FakeUpload:
+    # The read(n) surface of starlette's UploadFile.
+    def __init__(self, data):
+        self.data = data
+
+    async def read(self, size):
+        chunk, self.data = self.data[:size], self.data[size:]
+        return chunk
+
+
+def dest(tmp_path):
+    return str(tmp_path / 'storage' / 'cam1' / 'images' / 'img_20260101_120000.jpg')
+
+
+def sha(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def test_offsets_resume_and_finalize(tmp_path):
+    async def scenario():
+        manager = ResumableUploadManager(partial_root=str(tmp_path / 'partial'))
+        data = os.urandom(3000)
+        state = await manager.start(dest(tmp_path), {'filename': 'x'}, total_size=len(data))
+        upload_id = state['upload_id']
+        assert (await manager.start(dest(tmp_path), {'filename': 'x'}))['upload_id'] == upload_id
+
+        await manager.append(upload_id, 0, FakeUpload(data[:1000]))
+        with pytest.raises(UploadOffsetMismatch) as e:
+            await manager.append(upload_id, 500, FakeUpload(data[500:]))
+        assert e.value.expected == 1000
+        with pytest.raises(UploadOffsetMismatch):
+            await manager.finalize(upload_id, sha(data))
+
+        # A write that landed without saving its state: the retry from the saved offset replaces it.
+        with open(manager._data_path(state), 'ab') as f:
+            f.write(b'garbage' * 500)
+        state = await manager.append(upload_id, 1000, FakeUpload(data[1000:]))
+        assert state['offset'] == len(data) and state['chunks'] == 2
+
+        await manager.finalize(upload_id, sha(data).upper())
+        with open(dest(tmp_path), 'rb') as f:
+            assert f.read() == data
+        assert await manager.get(upload_id) is None
+        assert os.listdir(tmp_path / 'partial') == []
+        assert os.listdir(os.path.join(os.path.dirname(dest(tmp_path)), '.uploading')) == []
+
+    asyncio.run(scenario())
+
+
+def test_checksum_mismatch_discards(tmp_path):
+    async def scenario():
+        manager = ResumableUploadManager(partial_root=str(tmp_path / 'partial'))
+        state = await manager.start(dest(tmp_path), {'filename': 'x'})
+        await manager.append(state['upload_id'], 0, FakeUpload(b'abc'))
+
+        with pytest.raises(UploadChecksumMismatch) as e:
+            await manager.finalize(state['upload_id'], sha(b'abd'))
+        assert e.value.state['upload_id'] == state['upload_id']
+        assert not os.path.exists(dest(tmp_path)) and not os.path.exists(manager._data_path(state))
+        with pytest.raises(KeyError):
+            await manager.append(state['upload_id'], 3, FakeUpload(b'd'))
+
+    asyncio.run(scenario())
+
+
+def test_workers_share_state_on_disk(tmp_path):
+    async def scenario():
+        a = ResumableUploadManager(partial_root=str(tmp_path / 'partial'))
+        b = ResumableUploadManager(partial_root=str(tmp_path / 'partial'))
+        state = await a.start(dest(tmp_path), {'filename': 'x'})
+        upload_id = state['upload_id']
+        assert (await b.start(dest(tmp_path), {'filename': 'x'}))['upload_id'] == upload_id
+
+        await a.append(upload_id, 0, FakeUpload(b'abc'))
+        await b.append(upload_id, 3, FakeUpload(b'def'))
+        with pytest.raises(UploadOffsetMismatch) as e:
+            await a.append(upload_id, 3, FakeUpload(b'def'))
+        assert e.value.expected == 6
+
+        await b.finalize(upload_id, sha(b'abcdef'))
+        assert await a.get(upload_id) is None
+        assert await a.get('../../etc/passwd') is None
+
+    asyncio.run(scenario())
+
+
+def test_garbage_collection(tmp_path):
+    async def scenario():
+        manager = ResumableUploadManager(partial_root=str(tmp_path / 'partial'), ttl=60)
+        stale = await manager.start(dest(tmp_path), {'filename': 'x'})
+        fresh = await manager.start(str(tmp_path / 'storage' / 'cam1' / 'images' / 'other.jpg'), {'filename': 'y'})
+
+        # Last touched long ago, as another worker's appends would show only in the state file.
+        with open(manager._state_path(stale['upload_id'])) as f:
+            state = json.load(f)
+        state['updated_at'] = time.time() - 3600
+        with open(manager._state_path(stale['upload_id']), 'w') as f:
+            json.dump(state, f)
+
+        assert await manager.collect_garbage() == 1
+        assert await manager.get(stale['upload_id']) is None
+        assert not os.path.exists(manager._data_path(stale))
+        assert await manager.get(fresh['upload_id']) is not None
+
+    asyncio.run(scenario())
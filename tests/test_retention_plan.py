@@ -0,0 +1,79 @@
+import json
+from datetime import date, datetime
+
+from src.core import retention_manager as rm
+from src.core.media_index import MediaIndex, DATASET_FOLDER
+
+
+TODAY = date(2026, 3, 31)
+
+
+def make_manager(tmp_path, monkeypatch, config):
+    index = MediaIndex(str(tmp_path / 'media.db'), storage_root=str(tmp_path))
+    monkeypatch.setattr(rm, 'media_index', index)
+    config_path = tmp_path / 'retention.json'
+    config_path.write_text(json.dumps(config))
+    manager = rm.RetentionManager(config_path=str(config_path), storage_root=str(tmp_path),
+                                  dataset_root=str(tmp_path), lock_path=str(tmp_path / 'retention.lock'))
+    return manager, index
+
+
+def add(index, device_id, folder, day, size):
+    index.add(device_id, folder, f"img_{day}_120000.jpg", size=size)
+
+
+def test_age_policy(tmp_path, monkeypatch):
+    manager, index = make_manager(tmp_path, monkeypatch, {
+        'default': {'images': {'max_age_days': 30, 'archive_after_days': 7}},
+        'devices': {'cam2': {'images': {'max_age_days': 60}}},
+    })
+    add(index, 'cam1', 'images', '20260201', 10)     # 58 days: past max age
+    add(index, 'cam1', 'images', '20260320', 10)     # 11 days: archive
+    add(index, 'cam1', 'images', '20260329', 10)     # 2 days: keep
+    add(index, 'cam2', 'images', '20260201', 10)     # Device override keeps it, archive_after still applies
+    index.add_archive('a.tar.gz', 'cam1', 'images', '20260101', 5, 7)
+
+    assert manager.plan(TODAY) == [
+        ('drop_archive', 'cam1', 'images', '20260101', 7, 'a.tar.gz'),
+        ('delete', 'cam1', 'images', '20260201', 10, None),
+        ('archive', 'cam2', 'images', '20260201', 10, None),
+        ('archive', 'cam1', 'images', '20260320', 10, None),
+    ]
+
+
+def test_quota_evicts_oldest_then_evict_last_and_never_today(tmp_path, monkeypatch):
+    manager, index = make_manager(tmp_path, monkeypatch, {
+        'default': {'max_bytes': 25, 'annotated_videos': {'evict_last': True}},
+    })
+    index.add('cam1', 'annotated_videos', 'evidence_ANN_20260301_120000.mp4', size=10)
+    add(index, 'cam1', 'images', '20260310', 10)
+    add(index, 'cam1', 'images', '20260320', 10)
+    add(index, 'cam1', 'images', TODAY.strftime("%Y%m%d"), 10)
+
+    assert manager.plan(TODAY) == [
+        ('delete', 'cam1', 'images', '20260310', 10, None),
+        ('delete', 'cam1', 'images', '20260320', 10, None),
+    ]
+
+    # However far over quota today is, its files stay.
+    add(index, 'cam1', 'images', TODAY.strftime("%Y%m%d"), 40)
+    index.remove_many('cam1', 'annotated_videos', ['evidence_ANN_20260301_120000.mp4'])
+    assert [a[0:4] for a in manager.plan(TODAY)] == [
+        ('delete', 'cam1', 'images', '20260310'),
+        ('delete', 'cam1', 'images', '20260320'),
+    ]
+
+
+def test_dataset_sub_folders_share_one_quota(tmp_path, monkeypatch):
+    manager, index = make_manager(tmp_path, monkeypatch, {'dataset': {'max_bytes': 15}})
+    old = datetime(2026, 3, 1, 12)
+    index.add('line1', DATASET_FOLDER, 'a.jpg', size=10, timestamp=old)
+    index.add('line2', DATASET_FOLDER, 'b.jpg', size=10, timestamp=datetime(2026, 3, 2, 12))
+
+    assert manager.plan(TODAY) == [('delete', 'line1', DATASET_FOLDER, '20260301', 10, None)]
+
+
+def test_no_policy_no_actions(tmp_path, monkeypatch):
+    manager, index = make_manager(tmp_path, monkeypatch, {})
+    add(index, 'cam1', 'images', '20200101', 10)
+    assert manager.plan(TODAY) == []
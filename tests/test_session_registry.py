@@ -0,0 +1,42 @@
+from src.core.session_registry import SessionRegistry
+
+
+def test_reconnect_supersedes_old_socket():
+    reg = SessionRegistry()
+    assert reg.register('sid-1', 'cam1') == (1, None)
+    assert reg.register('sid-2', 'cam1') == (2, 'sid-1')
+
+    assert reg.get_sid('cam1') == 'sid-2'
+    assert not reg.is_current('sid-1')
+    assert reg.get_generation('sid-1') == 1 and reg.get_generation('sid-2') == 2
+
+    # The old socket's late disconnect must not take the device offline.
+    assert reg.unregister('sid-1') == ('cam1', False)
+    assert reg.is_connected('cam1')
+    assert reg.unregister('sid-2') == ('cam1', True)
+    assert not reg.is_connected('cam1')
+
+
+def test_generations_keep_growing_across_disconnects():
+    reg = SessionRegistry()
+    reg.register('sid-1', 'cam1')
+    reg.unregister('sid-1')
+    assert reg.register('sid-2', 'cam1') == (2, None)
+
+
+def test_same_sid_reregistering():
+    reg = SessionRegistry()
+    reg.register('sid-1', 'cam1')
+    assert reg.register('sid-1', 'cam1') == (2, None)
+
+    # Switching id on one socket frees the old device.
+    assert reg.register('sid-1', 'cam2') == (1, None)
+    assert not reg.is_connected('cam1')
+    assert reg.get_device('sid-1') == 'cam2'
+    assert reg.connected_devices() == ['cam2'] and len(reg) == 1
+
+
+def test_unknown_sid():
+    reg = SessionRegistry()
+    assert reg.unregister('nope') == (None, False)
+    assert reg.get_device('nope') is None and reg.get_generation('nope') is None
@@ -0,0 +1,118 @@
+import asyncio
+import os
+
+import orjson
+
+from src.core.state_broker import StateBroker, EXPIRED_PREFIX
+from src.core.state_backend import BrokerBackend
+
+from tests.helpers import socket_path, wait_for
+
+
+def crash(broker):
+    # StateBroker.close only stops accepting; drop live connections as a dying broker would.
+    for conn in list(broker.connections):
+        conn.writer.close()
+
+
+async def started(path, **kwargs):
+    backend = BrokerBackend(path, **kwargs)
+    await backend.start()
+    return backend
+
+
+def test_publish_is_not_echoed_to_publisher():
+    async def scenario():
+        path = socket_path()
+        broker = StateBroker(path)
+        await broker.start()
+        a, b = await started(path), await started(path)
+        got_a, got_b = [], []
+        a.subscribe('ch', lambda channel, body: got_a.append(body))
+        b.subscribe('ch', lambda channel, body: got_b.append(body))
+        await asyncio.sleep(0.05)
+
+        a.publish('ch', b'hello')
+        a.publish('ch', b'x' * 200_000)
+        await wait_for(lambda: len(got_b) == 2)
+        await asyncio.sleep(0.05)
+
+        assert got_b == [b'hello', b'x' * 200_000]
+        assert got_a == []
+        await a.close(); await b.close(); await broker.close()
+
+    asyncio.run(scenario())
+
+
+def test_ephemeral_fields_expire_with_their_connection():
+    async def scenario():
+        path = socket_path()
+        broker = StateBroker(path)
+        await broker.start()
+        a, b = await started(path), await started(path)
+        expired = []
+        b.subscribe(EXPIRED_PREFIX + 'k', lambda channel, body: expired.extend(orjson.loads(body)))
+        a.hset('k', 'temp', {'v': 1}, ephemeral=True)
+        a.hset('k', 'kept', {'v': 2})
+        a.hset('k', 'taken', 1, ephemeral=True)
+        b.hset('k', 'taken', 2, ephemeral=True)
+        await wait_for(lambda: broker.hashes.get('k', {}).get('taken') == 2)
+
+        await a.close()
+        await wait_for(lambda: expired)
+
+        assert expired == ['temp']
+        assert await b.hgetall('k') == {'kept': {'v': 2}, 'taken': 2}
+        await b.close(); await broker.close()
+
+    asyncio.run(scenario())
+
+
+def test_resubscribe_and_replay_after_reconnect():
+    async def scenario():
+        path = socket_path()
+        broker = StateBroker(path)
+        await broker.start()
+        a = await started(path, reconnect_delay=0.05)
+        got = []
+        a.subscribe('ch', lambda channel, body: got.append(body))
+        a.hset('k', 'mine', 'alive', ephemeral=True)
+        a.hset('k', 'gone', 'x', ephemeral=True)
+        a.hdel('k', 'gone')
+        await wait_for(lambda: 'mine' in broker.hashes.get('k', {}))
+
+        await broker.close()
+        crash(broker)
+        os.unlink(path)
+        broker = StateBroker(path)
+        await broker.start()
+        await wait_for(lambda: a.stats['reconnects'] == 1)
+
+        assert await a.hgetall('k') == {'mine': 'alive'}
+        b = await started(path)
+        b.publish('ch', b'after')
+        await wait_for(lambda: got == [b'after'])
+        await a.close(); await b.close(); await broker.close()
+
+    asyncio.run(scenario())
+
+
+def test_hgetall_fails_fast_while_disconnected():
+    async def scenario():
+        path = socket_path()
+        broker = StateBroker(path)
+        await broker.start()
+        a = await started(path, reconnect_delay=10)
+        await wait_for(lambda: broker.connections)
+        await broker.close()
+        crash(broker)
+        await wait_for(lambda: a._writer is None)
+        try:
+            await a.hgetall('k')
+        except ConnectionError:
+            pass
+        else:
+            raise AssertionError("hgetall should fail without a broker connection")
+        await a.close()
+
+    asyncio.run(scenario())